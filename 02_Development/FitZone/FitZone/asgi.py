@@ -1,7 +1,9 @@
 """
-ASGI config for FYP project.
+ASGI config for FitZone project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it (for example ``uvicorn FitZone.asgi:application``) to stream chat
+updates with CHAT_SSE_ENABLED=True.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -11,6 +13,13 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'FYP.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'FitZone.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.FOOD_PRELOAD_ARTIFACTS:
+    from food_recommendation_system.worker_memory import preload_artifacts
+
+    preload_artifacts()
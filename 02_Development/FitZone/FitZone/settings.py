@@ -200,3 +200,21 @@ KHALTI_SECRET_KEY = os.getenv('KHALTI_SECRET_KEY')
 
 # Site Configuration
 SITE_URL = os.getenv('SITE_URL', 'http://127.0.0.1:8000')
+
+# Load the food recommendation artifacts when the WSGI module is imported, so a
+# preforking server (gunicorn --preload, uWSGI without lazy-apps) shares them
+FOOD_PRELOAD_ARTIFACTS = os.getenv('FOOD_PRELOAD_ARTIFACTS', 'False').lower() in ('1', 'true', 'yes')
+
+# Filter recommendation candidates in SQL once a catalog version has been
+# imported with ``manage.py import_recipe_catalog``
+FOOD_SQL_PREFILTER = os.getenv('FOOD_SQL_PREFILTER', 'False').lower() in ('1', 'true', 'yes')
+
+# Push chat messages and unread counts over Server-Sent Events. Needs an ASGI
+# server (uvicorn/daphne serving FitZone.asgi); chat pages poll when disabled
+CHAT_SSE_ENABLED = os.getenv('CHAT_SSE_ENABLED', 'False').lower() in ('1', 'true', 'yes')
+
+# Chat events reach streams of the same process by default. With several
+# processes or nodes, use chat.events.SocketBroker and run
+# ``manage.py run_chat_broker`` at CHAT_EVENTS_BROKER (host:port)
+CHAT_EVENTS_BACKEND = os.getenv('CHAT_EVENTS_BACKEND', 'chat.events.InProcessBroker')
+CHAT_EVENTS_BROKER = os.getenv('CHAT_EVENTS_BROKER', '127.0.0.1:8765')
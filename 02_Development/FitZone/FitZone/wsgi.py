@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'FitZone.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.FOOD_PRELOAD_ARTIFACTS:
+    # Runs in the master of a preforking server, before workers are forked
+    from food_recommendation_system.worker_memory import preload_artifacts
+
+    preload_artifacts()
@@ -5,7 +5,7 @@ from .models import ChatRoom, Message, ChatReport
 class MessageInline(admin.TabularInline):
     model = Message
     extra = 0
-    readonly_fields = ('sender', 'content', 'is_read', 'created_at')
+    readonly_fields = ('sender', 'content', 'created_at')
 
 
 @admin.register(ChatRoom)
@@ -18,8 +18,8 @@ class ChatRoomAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ('room', 'sender', 'content_short', 'is_read', 'created_at')
-    list_filter = ('is_read', 'created_at')
+    list_display = ('room', 'sender', 'content_short', 'created_at')
+    list_filter = ('created_at',)
     search_fields = ('content', 'sender__username')
 
     def content_short(self, obj):
@@ -0,0 +1,253 @@
+"""
+Publish/subscribe for chat events.
+
+Views publish small JSON-serializable events (a new message, a changed
+unread count) to one channel per user, and the Server-Sent Events stream of
+every open chat page subscribes to its user's channel. Events only carry
+what the page could also fetch itself, so a dropped event costs an update
+until the page resyncs, never data.
+
+``InProcessBroker`` delivers within one process, which is enough while a
+single ASGI process serves the streams. ``SocketBroker`` lets several
+processes or nodes share events through the relay started with
+``manage.py run_chat_broker``, a local stand-in for a broker such as Redis:
+every node sends its events to the relay, which echoes them to all
+connected nodes (the sender included) for local delivery. The backend is
+chosen with ``CHAT_EVENTS_BACKEND``.
+"""
+import asyncio
+import json
+import logging
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+BACKEND = getattr(settings, 'CHAT_EVENTS_BACKEND', 'chat.events.InProcessBroker')
+BROKER_ADDRESS = getattr(settings, 'CHAT_EVENTS_BROKER', '127.0.0.1:8765')
+
+# Events a subscriber may fall behind by before it is told to resync instead
+QUEUE_SIZE = 100
+
+CONNECT_TIMEOUT = 2
+RECONNECT_DELAY = 1
+
+# Bytes the relay buffers for a node that stopped reading before dropping it
+RELAY_WRITE_LIMIT = 1024 * 1024
+
+RESYNC = {'type': 'resync'}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def user_channel(user_id):
+    return f'chat.user.{user_id}'
+
+
+class Subscription:
+    """Events of one channel queued for one consumer on an asyncio event loop."""
+
+    def __init__(self, broker, channel, loop):
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Runs on self.loop; a consumer that fell behind only gets RESYNC next
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout=None):
+        """Next event, ``RESYNC`` if events were dropped, or ``None`` after ``timeout`` seconds."""
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return RESYNC
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fan-out to the subscribers of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, channel):
+        """Subscribe the running event loop to ``channel``; call from a coroutine."""
+        subscription = Subscription(self, channel, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def publish(self, channel, event):
+        """Send ``event`` to every subscriber of ``channel``; safe to call from any thread."""
+        self.dispatch(channel, event)
+
+    def dispatch(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's event loop has been closed
+                self.unsubscribe(subscription)
+
+
+class SocketBroker(InProcessBroker):
+    """
+    Shares events between processes through the ``run_chat_broker`` relay.
+
+    Events are written to the relay as JSON lines and delivered locally
+    when the relay echoes them back, so every node sees the same stream.
+    A background thread reads the relay and reconnects when it goes away;
+    events published while the relay is unreachable are dropped.
+    """
+
+    def __init__(self, address=BROKER_ADDRESS):
+        super().__init__()
+        host, _, port = address.rpartition(':')
+        self.address = (host or '127.0.0.1', int(port))
+        self._socket = None
+        self._socket_lock = threading.Lock()
+        self._reader = None
+        self._closed = False
+
+    def _connect(self):
+        with self._socket_lock:
+            if self._socket is None:
+                self._socket = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+                self._socket.settimeout(None)
+            return self._socket
+
+    def _disconnect(self, sock):
+        with self._socket_lock:
+            if self._socket is sock:
+                self._socket = None
+        sock.close()
+
+    def _start_reader(self):
+        with self._socket_lock:
+            if self._reader is None:
+                self._reader = threading.Thread(target=self._read, name='chat-events-reader', daemon=True)
+                self._reader.start()
+
+    def _read(self):
+        while not self._closed:
+            try:
+                sock = self._connect()
+            except OSError:
+                time.sleep(RECONNECT_DELAY)
+                continue
+            try:
+                with sock.makefile('rb') as lines:
+                    for line in lines:
+                        try:
+                            message = json.loads(line)
+                        except ValueError:
+                            continue
+                        self.dispatch(message['channel'], message['event'])
+            except OSError:
+                pass
+            self._disconnect(sock)
+            if not self._closed:
+                time.sleep(RECONNECT_DELAY)
+
+    def subscribe(self, channel):
+        self._start_reader()
+        return super().subscribe(channel)
+
+    def publish(self, channel, event):
+        self._start_reader()
+        line = (json.dumps({'channel': channel, 'event': event}) + '\n').encode()
+        sock = None
+        try:
+            sock = self._connect()
+            sock.sendall(line)
+        except OSError:
+            logger.warning('Chat event broker %s:%s is unreachable; dropped an event for %s', *self.address, channel)
+            if sock is not None:
+                self._disconnect(sock)
+
+    def close(self):
+        """Disconnect from the relay and stop the reader thread."""
+        self._closed = True
+        with self._socket_lock:
+            sock, self._socket = self._socket, None
+        if sock is not None:
+            try:
+                # Wakes the reader thread blocked on this socket
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+
+async def serve_relay(host, port):
+    """
+    Start the relay used by ``SocketBroker`` and return the asyncio server.
+    Every line received from a node is written to all connected nodes.
+    """
+    nodes = set()
+
+    async def handle(reader, writer):
+        nodes.add(writer)
+        try:
+            while line := await reader.readline():
+                for node in list(nodes):
+                    if node.transport.get_write_buffer_size() > RELAY_WRITE_LIMIT:
+                        nodes.discard(node)
+                        node.close()
+                    else:
+                        node.write(line)
+        except ConnectionError:
+            pass
+        finally:
+            nodes.discard(writer)
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(BACKEND)()
+    return _broker
+
+
+def publish(channel, event):
+    get_broker().publish(channel, event)
+
+
+def subscribe(channel):
+    return get_broker().subscribe(channel)
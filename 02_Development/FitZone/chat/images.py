@@ -0,0 +1,84 @@
+"""
+Transcoding of chat image uploads.
+
+Uploads are decoded with Pillow and never stored as sent: the image is
+rotated upright from its EXIF orientation, then re-encoded to WebP without
+any metadata (EXIF carries GPS positions and camera details), with its long
+edge bounded by ``CHAT_IMAGE_MAX_EDGE``. A small WebP thumbnail is shown in
+the conversation and the bounded image opens on click. JPEGs are decoded at
+a reduced scale when they are much larger than needed, which keeps large
+phone photos cheap to process. The files are written with ``save_files``
+before the message is added, so the room row is never locked during file
+I/O.
+"""
+import io
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Message
+
+MAX_EDGE = getattr(settings, 'CHAT_IMAGE_MAX_EDGE', 2048)
+THUMBNAIL_EDGE = getattr(settings, 'CHAT_THUMBNAIL_EDGE', 480)
+
+IMAGE_QUALITY = 82
+THUMBNAIL_QUALITY = 70
+
+# Refuse to decode anything larger, whatever its file size (decompression bombs)
+MAX_PIXELS = 50_000_000
+
+
+def _webp(image, quality, name):
+    output = io.BytesIO()
+    image.save(output, format='WEBP', quality=quality, method=4)
+    return ContentFile(output.getvalue(), name=name)
+
+
+def transcode_upload(upload):
+    """
+    ``(image, thumbnail)`` WebP files for an uploaded image, ready to assign
+    to ``Message.image`` and ``Message.thumbnail``. Raises ``ValueError`` if
+    the upload is not an image Pillow can read.
+    """
+    try:
+        with Image.open(upload) as source:
+            if source.width * source.height > MAX_PIXELS:
+                raise ValueError('Image dimensions are too large.')
+            # Animated GIFs and WebPs keep their first frame
+            source.draft('RGB', (MAX_EDGE, MAX_EDGE))
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as exc:
+        raise ValueError('The image could not be read.') from exc
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    image.info.clear()
+
+    image.thumbnail((MAX_EDGE, MAX_EDGE), Image.LANCZOS)
+    thumbnail = image.copy()
+    thumbnail.thumbnail((THUMBNAIL_EDGE, THUMBNAIL_EDGE), Image.LANCZOS)
+
+    name = uuid.uuid4().hex
+    return _webp(image, IMAGE_QUALITY, f'{name}.webp'), _webp(thumbnail, THUMBNAIL_QUALITY, f'{name}.webp')
+
+
+def save_files(image, thumbnail):
+    """
+    Write the files from ``transcode_upload`` to the storage of
+    ``Message.image`` and ``Message.thumbnail``. Returns their stored names,
+    which can be passed to ``ChatRoom.add_message`` as they are.
+    """
+    names = []
+    for field_name, content in (('image', image), ('thumbnail', thumbnail)):
+        field = Message._meta.get_field(field_name)
+        names.append(field.storage.save(field.generate_filename(None, content.name), content))
+    return tuple(names)
+
+
+def delete_files(image, thumbnail):
+    """Remove files written by ``save_files`` whose message was never created."""
+    for field_name, name in (('image', image), ('thumbnail', thumbnail)):
+        Message._meta.get_field(field_name).storage.delete(name)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from chat.models import ChatRoom
+
+
+class Command(BaseCommand):
+    help = 'Post the session-ended message in chat rooms whose booking access has run out (run on a schedule)'
+
+    def handle(self, *args, **options):
+        # Rooms with access_until in the past, or no access at all, not told yet
+        rooms = ChatRoom.objects.filter(
+            Q(access_until__isnull=True) | Q(access_until__lt=timezone.now()),
+            access_ended_notified=False,
+        ).select_related('trainer__user')
+
+        # notify_access_ended re-checks each room, so ones a poll got to first are skipped
+        count = sum(room.notify_access_ended() is not None for room in rooms.iterator())
+
+        if count == 0:
+            self.stdout.write(self.style.WARNING('No chat sessions have ended'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Ended {count} chat session(s)'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from chat.models import ChatRoom, access_deadlines
+from trainer.models import TrainerBooking
+
+
+class Command(BaseCommand):
+    help = 'Create the chat rooms missing for confirmed trainer bookings (rooms are otherwise created when a booking is confirmed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rooms inserted per query')
+
+    def handle(self, *args, **options):
+        pairs = (
+            TrainerBooking.objects.filter(status='confirmed')
+            .values_list('trainer_id', 'user_id')
+            .distinct()
+        )
+        deadlines = access_deadlines(TrainerBooking.objects.all())
+        before = ChatRoom.objects.count()
+        # Rooms that already exist are skipped by the (trainer, client) unique constraint
+        ChatRoom.objects.bulk_create(
+            [
+                ChatRoom(trainer_id=trainer_id, client_id=user_id, access_until=deadlines.get((trainer_id, user_id)))
+                for trainer_id, user_id in pairs.iterator()
+            ],
+            batch_size=options['batch_size'],
+            ignore_conflicts=True,
+        )
+        created = ChatRoom.objects.count() - before
+
+        if created == 0:
+            self.stdout.write(self.style.WARNING('No chat rooms were missing'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Created {created} chat room(s)'))
@@ -0,0 +1,26 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from chat.events import BROKER_ADDRESS, serve_relay
+
+
+class Command(BaseCommand):
+    help = 'Run the relay that shares chat events between processes using chat.events.SocketBroker'
+
+    def add_arguments(self, parser):
+        host, _, port = BROKER_ADDRESS.rpartition(':')
+        parser.add_argument('--host', default=host or '127.0.0.1', help='Interface to listen on')
+        parser.add_argument('--port', type=int, default=int(port), help='Port to listen on')
+
+    def handle(self, *args, **options):
+        try:
+            asyncio.run(self.serve(options['host'], options['port']))
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self, host, port):
+        server = await serve_relay(host, port)
+        self.stdout.write(self.style.SUCCESS(f'Relaying chat events on {host}:{port}'))
+        async with server:
+            await server.serve_forever()
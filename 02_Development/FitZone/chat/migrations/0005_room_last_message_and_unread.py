@@ -0,0 +1,74 @@
+# Generated by Django 6.0.2 on 2026-10-17 09:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_rooms(apps, schema_editor):
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Message = apps.get_model('chat', 'Message')
+    for room in ChatRoom.objects.select_related('trainer').iterator():
+        last = Message.objects.filter(room=room).order_by('-created_at', '-id').first()
+        unread = Message.objects.filter(room=room, is_read=False).aggregate(
+            client=Count('id', filter=~Q(sender_id=room.client_id)),
+            trainer=Count('id', filter=~Q(sender_id=room.trainer.user_id)),
+        )
+        if last is None and not unread['client'] and not unread['trainer']:
+            continue
+        if last is not None:
+            room.last_message = last
+            room.last_message_at = last.created_at
+            room.last_message_preview = last.content[:35] + '...' if len(last.content) > 35 else last.content
+        room.client_unread = unread['client']
+        room.trainer_unread = unread['trainer']
+        room.save(update_fields=[
+            'last_message', 'last_message_at', 'last_message_preview', 'client_unread', 'trainer_unread',
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_chatreport'),
+        ('trainer', '0020_alter_trainerregistrationdocument_file'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='client_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='trainer_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['trainer', '-last_message_at'], name='chat_room_trainer_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['client', '-last_message_at'], name='chat_room_client_recent_idx'),
+        ),
+        migrations.RunPython(backfill_rooms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:40
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def backfill_watermarks(apps, schema_editor):
+    # A participant has read everything before the first message from the
+    # other side still marked unread, or the whole room if there is none
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Message = apps.get_model('chat', 'Message')
+    for room in ChatRoom.objects.select_related('trainer').iterator():
+        messages = Message.objects.filter(room=room)
+        last_id = messages.aggregate(last=Max('id'))['last']
+        if last_id is None:
+            continue
+        for user_id, unread_field, watermark_field in (
+            (room.client_id, 'client_unread', 'client_last_read_message_id'),
+            (room.trainer.user_id, 'trainer_unread', 'trainer_last_read_message_id'),
+        ):
+            from_others = messages.exclude(sender_id=user_id)
+            first_unread = from_others.filter(is_read=False).aggregate(first=Min('id'))['first']
+            watermark = last_id if first_unread is None else first_unread - 1
+            setattr(room, watermark_field, watermark)
+            setattr(room, unread_field, from_others.filter(id__gt=watermark).count())
+        room.save(update_fields=[
+            'client_unread', 'trainer_unread', 'client_last_read_message_id', 'trainer_last_read_message_id',
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_message_room_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='client_last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='trainer_last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
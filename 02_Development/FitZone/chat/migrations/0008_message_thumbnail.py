@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='chat_images/thumbnails/'),
+        ),
+    ]
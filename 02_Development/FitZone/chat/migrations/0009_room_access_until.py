@@ -0,0 +1,66 @@
+# Generated by Django 6.0.2 on 2026-10-17 11:50
+
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations, models
+from django.utils import timezone as django_timezone
+
+SESSION_ENDED_MESSAGE = "Your session has ended. Please book again to continue access."
+
+
+def backfill_access(apps, schema_editor):
+    # Same rule as chat.models.access_deadlines: two free days from an unpaid
+    # confirmed booking, or the paid period (unlimited without an end date)
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Message = apps.get_model('chat', 'Message')
+    TrainerBooking = apps.get_model('trainer', 'TrainerBooking')
+    unlimited = datetime(9999, 1, 1, tzinfo=timezone.utc)
+
+    deadlines = {}
+    rows = TrainerBooking.objects.filter(status='confirmed').values_list(
+        'trainer_id', 'user_id', 'payment_status', 'created_at', 'valid_until',
+    )
+    for trainer_id, user_id, payment_status, created_at, valid_until in rows.iterator():
+        if payment_status == 'pending':
+            until = created_at + timedelta(days=2)
+        elif payment_status == 'completed':
+            until = valid_until or unlimited
+        else:
+            continue
+        pair = (trainer_id, user_id)
+        if pair not in deadlines or until > deadlines[pair]:
+            deadlines[pair] = until
+
+    now = django_timezone.now()
+    notified_room_ids = set(
+        Message.objects.filter(message_type='system', content=SESSION_ENDED_MESSAGE).values_list('room_id', flat=True)
+    )
+    for room in ChatRoom.objects.iterator():
+        room.access_until = deadlines.get((room.trainer_id, room.client_id))
+        # Rooms whose access already ended and were told so are not told again
+        room.access_ended_notified = (
+            (room.access_until is None or room.access_until < now) and room.id in notified_room_ids
+        )
+        room.save(update_fields=['access_until', 'access_ended_notified'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_message_thumbnail'),
+        ('trainer', '0020_alter_trainerregistrationdocument_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='access_ended_notified',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='access_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_access, migrations.RunPython.noop),
+    ]
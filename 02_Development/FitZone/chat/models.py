@@ -1,10 +1,66 @@
-from django.db import models
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import models, transaction
+from django.db.models import Q, Sum
 from django.conf import settings
-from trainer.models import TrainerRegistration
+from django.utils import timezone
+from trainer.models import TrainerBooking, TrainerRegistration
+
+# Chat access a confirmed booking gives before it is paid
+FREE_ACCESS_PERIOD = timedelta(days=2)
+
+# access_until of a room with a paid booking that has no end date
+ACCESS_UNLIMITED = datetime(9999, 1, 1, tzinfo=dt_timezone.utc)
+
+SESSION_ENDED_MESSAGE = "Your session has ended. Please book again to continue access."
+
+
+def message_preview(content):
+    if len(content) > 35:
+        return content[:35] + '...'
+    return content
+
+
+def access_deadlines(bookings):
+    """
+    ``{(trainer id, client id): access_until}`` for the confirmed ones among
+    ``bookings``: the latest end of the free window of an unpaid booking or
+    of the paid period of a paid one. Pairs whose bookings give no access
+    are left out.
+    """
+    deadlines = {}
+    rows = bookings.filter(status='confirmed').values_list(
+        'trainer_id', 'user_id', 'payment_status', 'created_at', 'valid_until',
+    )
+    for trainer_id, user_id, payment_status, created_at, valid_until in rows:
+        if payment_status == 'pending':
+            until = created_at + FREE_ACCESS_PERIOD
+        elif payment_status == 'completed':
+            until = valid_until or ACCESS_UNLIMITED
+        else:
+            continue
+        pair = (trainer_id, user_id)
+        if pair not in deadlines or until > deadlines[pair]:
+            deadlines[pair] = until
+    return deadlines
 
 
 class ChatRoom(models.Model):
-    """A chat room between a trainer and a client."""
+    """
+    A chat room between a trainer and a client.
+
+    The last message and each participant's unread count are kept on the
+    room by ``add_message`` and ``mark_read``, so room lists and badges do
+    not aggregate over messages. What a participant has read is a watermark:
+    the id of the last message they have seen, so every message from the
+    other side with a higher id is unread.
+
+    Whether the client may still chat is ``access_until``, kept up to date
+    from their bookings with the trainer by ``refresh_access`` whenever one
+    of them is saved, so it is a timestamp comparison rather than booking
+    queries. ``access_ended_notified`` records that the session-ended
+    message was posted for the current lapse of access.
+    """
     trainer = models.ForeignKey(
         TrainerRegistration,
         on_delete=models.CASCADE,
@@ -17,19 +73,166 @@ class ChatRoom(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=40, blank=True, default='')
+    client_unread = models.PositiveIntegerField(default=0)
+    trainer_unread = models.PositiveIntegerField(default=0)
+    client_last_read_message_id = models.PositiveBigIntegerField(default=0)
+    trainer_last_read_message_id = models.PositiveBigIntegerField(default=0)
+    access_until = models.DateTimeField(null=True, blank=True)
+    access_ended_notified = models.BooleanField(default=False)
 
     class Meta:
         unique_together = ('trainer', 'client')
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['trainer', '-last_message_at'], name='chat_room_trainer_recent_idx'),
+            models.Index(fields=['client', '-last_message_at'], name='chat_room_client_recent_idx'),
+        ]
 
     def __str__(self):
         return f"Chat: {self.client.username} <-> {self.trainer.user.username}"
 
+    @classmethod
+    def provision(cls, booking):
+        """
+        The room between ``booking``'s trainer and client, created if it does
+        not exist yet. Called when a booking is confirmed or paid, so chat
+        pages only ever read rooms.
+        """
+        room, _ = cls.objects.get_or_create(
+            trainer_id=booking.trainer_id,
+            client_id=booking.user_id,
+            defaults={'access_until': cls.compute_access_until(booking.trainer_id, booking.user_id)},
+        )
+        return room
+
+    @staticmethod
+    def compute_access_until(trainer_id, client_id):
+        bookings = TrainerBooking.objects.filter(trainer_id=trainer_id, user_id=client_id)
+        return access_deadlines(bookings).get((trainer_id, client_id))
+
+    @classmethod
+    def refresh_access(cls, trainer_id, client_id):
+        """
+        Recompute ``access_until`` of the room between ``trainer_id`` and
+        ``client_id`` (if there is one) from their bookings. Access that is
+        valid again re-arms the session-ended message.
+        """
+        access_until = cls.compute_access_until(trainer_id, client_id)
+        fields = {'access_until': access_until}
+        if access_until is not None and access_until >= timezone.now():
+            fields['access_ended_notified'] = False
+        cls.objects.filter(trainer_id=trainer_id, client_id=client_id).update(**fields)
+
+    def has_access(self, now=None):
+        return self.access_until is not None and self.access_until >= (now or timezone.now())
+
+    def notify_access_ended(self):
+        """
+        Post the session-ended system message, once per lapse of access.
+        Returns the message, or ``None`` if access has not ended or the
+        message was already posted (by a poll or the sweep).
+        """
+        with transaction.atomic():
+            claimed = ChatRoom.objects.filter(
+                Q(access_until__isnull=True) | Q(access_until__lt=timezone.now()),
+                pk=self.pk,
+                access_ended_notified=False,
+            ).update(access_ended_notified=True)
+            if not claimed:
+                return None
+            self.access_ended_notified = True
+            return self.add_message(
+                sender=self.trainer.user,
+                content=SESSION_ENDED_MESSAGE,
+                message_type='system',
+            )
+
     def get_last_message(self):
         return self.messages.order_by('-created_at').first()
 
     def get_unread_count_for_user(self, user):
-        return self.messages.filter(is_read=False).exclude(sender=user).count()
+        return self.client_unread if user.id == self.client_id else self.trainer_unread
+
+    def _read_fields(self, user):
+        """Names of the unread counter and read watermark of ``user``."""
+        if user.id == self.client_id:
+            return 'client_unread', 'client_last_read_message_id'
+        return 'trainer_unread', 'trainer_last_read_message_id'
+
+    def count_unread(self, user):
+        """Messages from others after ``user``'s watermark, counted on the ``(room, id)`` index."""
+        _, watermark_field = self._read_fields(user)
+        return self.messages.filter(id__gt=getattr(self, watermark_field)).exclude(sender=user).count()
+
+    def add_message(self, sender, content='', **fields):
+        """
+        Create a message and, in the same transaction, make it the room's
+        last message and count it as unread for the other participant(s).
+        The room row is locked first, so concurrent messages are recorded
+        in the order they were created.
+        """
+        with transaction.atomic():
+            room = ChatRoom.objects.select_for_update().get(pk=self.pk)
+            message = Message.objects.create(room=self, sender=sender, content=content, **fields)
+            room.last_message = message
+            room.last_message_at = message.created_at
+            room.last_message_preview = message_preview(message.content)
+            if sender.id != room.client_id:
+                room.client_unread += 1
+            if sender.id != self.trainer.user_id:
+                room.trainer_unread += 1
+            room.save(update_fields=[
+                'last_message', 'last_message_at', 'last_message_preview',
+                'client_unread', 'trainer_unread', 'updated_at',
+            ])
+        for field in ('last_message', 'last_message_at', 'last_message_preview',
+                      'client_unread', 'trainer_unread', 'updated_at'):
+            setattr(self, field, getattr(room, field))
+        return message
+
+    def mark_read(self, user, up_to=None):
+        """
+        Move ``user``'s read watermark to the message id ``up_to`` (the last
+        message if ``None``), a single-row write. Returns whether anything
+        became read.
+        """
+        unread_field, watermark_field = self._read_fields(user)
+        if not getattr(self, unread_field):
+            return False
+        with transaction.atomic():
+            room = (
+                ChatRoom.objects.select_for_update()
+                .only('pk', 'client', 'last_message', unread_field, watermark_field)
+                .get(pk=self.pk)
+            )
+            last_id = room.last_message_id or 0
+            watermark = last_id if up_to is None else min(up_to, last_id)
+            if not getattr(room, unread_field) or watermark <= getattr(room, watermark_field):
+                setattr(self, unread_field, getattr(room, unread_field))
+                return False
+            setattr(room, watermark_field, watermark)
+            # Reading only part of the way (messages arrived since) needs a recount
+            unread = 0 if watermark == last_id else room.count_unread(user)
+            ChatRoom.objects.filter(pk=self.pk).update(**{unread_field: unread, watermark_field: watermark})
+        setattr(self, unread_field, unread)
+        setattr(self, watermark_field, watermark)
+        return True
+
+    @classmethod
+    def total_unread(cls, user):
+        """Unread messages across every room of ``user``, as client and as trainer."""
+        as_client = cls.objects.filter(client=user).aggregate(total=Sum('client_unread'))['total']
+        as_trainer = cls.objects.filter(trainer__user=user).aggregate(total=Sum('trainer_unread'))['total']
+        return (as_client or 0) + (as_trainer or 0)
 
 
 class Message(models.Model):
@@ -51,12 +254,16 @@ class Message(models.Model):
     )
     content = models.TextField(blank=True, default='')
     image = models.ImageField(upload_to='chat_images/', blank=True, null=True)
+    thumbnail = models.ImageField(upload_to='chat_images/thumbnails/', blank=True, null=True)
     message_type = models.CharField(max_length=20, choices=MESSAGE_TYPES, default='normal')
-    is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Keyset pagination of a room's history and "newer than" polling
+            models.Index(fields=['room', 'id'], name='chat_message_room_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username}: {self.content[:40]}"
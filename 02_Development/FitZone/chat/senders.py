@@ -0,0 +1,33 @@
+"""
+Display names and avatars of message senders.
+
+Serializing a batch of messages needs the name and profile picture of
+every sender, usually just the two participants of a room. They are read
+for all senders at once with one joined query, so a poll that returns
+hundreds of messages costs one query for them. Nothing is kept between
+requests, so a new name or profile picture shows on the next poll in
+every worker.
+"""
+from django.contrib.auth.models import User
+
+from login_logout_register.models import UserProfile
+
+
+def sender_cards(user_ids):
+    """``{user id: {'username', 'name', 'profile_picture'}}`` for ``user_ids``."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    storage = UserProfile._meta.get_field('profile_picture').storage
+    rows = User.objects.filter(id__in=user_ids).values_list(
+        'id', 'username', 'first_name', 'last_name', 'userprofile__profile_picture',
+    )
+    return {
+        user_id: {
+            'username': username,
+            # Same as User.get_full_name(), falling back to the username
+            'name': f'{first_name} {last_name}'.strip() or username,
+            'profile_picture': storage.url(picture) if picture else '',
+        }
+        for user_id, username, first_name, last_name, picture in rows
+    }
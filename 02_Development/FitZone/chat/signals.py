@@ -0,0 +1,25 @@
+"""
+Keeps the chat access stored on rooms (``ChatRoom.access_until``) in step
+with trainer bookings: every saved or deleted booking recomputes the room
+of its trainer and client. ``ChatConfig.ready`` connects the receivers.
+"""
+from django.db.models.signals import post_delete, post_save
+
+from trainer.models import TrainerBooking
+
+from .models import ChatRoom
+
+# Booking fields chat access is computed from
+ACCESS_FIELDS = {'status', 'payment_status', 'valid_until'}
+
+
+def _booking_changed(sender, instance, update_fields=None, **kwargs):
+    # Saves of reminder flags and the like leave access as it was
+    if update_fields is not None and not ACCESS_FIELDS & update_fields:
+        return
+    ChatRoom.refresh_access(instance.trainer_id, instance.user_id)
+
+
+def connect_receivers():
+    post_save.connect(_booking_changed, sender=TrainerBooking, dispatch_uid='chat.signals.booking_saved')
+    post_delete.connect(_booking_changed, sender=TrainerBooking, dispatch_uid='chat.signals.booking_deleted')
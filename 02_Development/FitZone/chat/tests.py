@@ -1,3 +1,552 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from login_logout_register.models import UserProfile
+from trainer.models import TrainerBooking, TrainerRegistration
+
+from . import events, views
+from .models import SESSION_ENDED_MESSAGE, ChatRoom, Message
+
+
+class ChatEventBrokerTests(SimpleTestCase):
+    async def test_events_reach_subscribers_of_the_channel(self):
+        broker = events.InProcessBroker()
+        subscription = broker.subscribe('chat.user.1')
+        other = broker.subscribe('chat.user.2')
+
+        # Views publish from worker threads
+        thread = threading.Thread(target=broker.publish, args=('chat.user.1', {'type': 'unread', 'unread': 2}))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(await subscription.get(timeout=1), {'type': 'unread', 'unread': 2})
+        self.assertIsNone(await other.get(timeout=0.05))
+
+    async def test_subscriber_that_falls_behind_is_told_to_resync(self):
+        broker = events.InProcessBroker()
+        subscription = broker.subscribe('chat.user.1')
+        for i in range(events.QUEUE_SIZE + 5):
+            broker.publish('chat.user.1', {'type': 'unread', 'unread': i})
+        await asyncio.sleep(0)
+
+        # Queued events are discarded too: the page refetches everything
+        self.assertEqual(await subscription.get(timeout=1), events.RESYNC)
+        self.assertIsNone(await subscription.get(timeout=0.05))
+
+    async def test_closed_subscriptions_stop_receiving(self):
+        broker = events.InProcessBroker()
+        subscription = broker.subscribe('chat.user.1')
+        subscription.close()
+
+        broker.publish('chat.user.1', {'type': 'unread'})
+
+        self.assertEqual(broker._subscriptions, {})
+
+    async def test_socket_brokers_share_events_through_the_relay(self):
+        relay = await events.serve_relay('127.0.0.1', 0)
+        address = '127.0.0.1:%d' % relay.sockets[0].getsockname()[1]
+        node_a = events.SocketBroker(address)
+        node_b = events.SocketBroker(address)
+        try:
+            subscription = node_a.subscribe('chat.user.1')
+            # Wait until node A's reader is connected before node B publishes
+            while node_a._socket is None:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+
+            await asyncio.to_thread(node_b.publish, 'chat.user.1', {'type': 'unread', 'unread': 1})
+
+            self.assertEqual(await subscription.get(timeout=2), {'type': 'unread', 'unread': 1})
+        finally:
+            node_a.close()
+            node_b.close()
+            await asyncio.sleep(0.05)
+            relay.close()
+            await relay.wait_closed()
+
+
+@mock.patch.object(views, 'SSE_ENABLED', True)
+class ChatStreamTests(TestCase):
+    def setUp(self):
+        self.trainer_user = User.objects.create_user(username='coach', password='Pass1234')
+        self.trainer = TrainerRegistration.objects.create(user=self.trainer_user, experience=3, specialization='Strength')
+        self.member = User.objects.create_user(username='member', password='Pass1234')
+        booking = TrainerBooking.objects.create(
+            user=self.member, trainer=self.trainer, booking_date=date.today(),
+            status='confirmed', payment_status='pending',
+        )
+        self.room = ChatRoom.provision(booking)
+
+    async def test_sent_message_is_pushed_to_both_participants(self):
+        member_events = events.subscribe(events.user_channel(self.member.id))
+        trainer_events = events.subscribe(events.user_channel(self.trainer_user.id))
+        try:
+            await self.async_client.aforce_login(self.member)
+            response = await self.async_client.post(
+                reverse('send_message', args=[self.room.id]), {'content': 'Morning session?'}
+            )
+            self.assertEqual(response.status_code, 200)
+
+            pushed = await member_events.get(timeout=1)
+            self.assertEqual(pushed['type'], 'message')
+            self.assertEqual(pushed['message']['content'], 'Morning session?')
+            self.assertEqual((await trainer_events.get(timeout=1))['type'], 'message')
+            self.assertEqual(
+                await trainer_events.get(timeout=1),
+                {'type': 'unread', 'room': self.room.id, 'unread': 1, 'total_unread': 1},
+            )
+
+            await self.async_client.aforce_login(self.trainer_user)
+            await self.async_client.post(reverse('mark_chat_read', args=[self.room.id]))
+
+            self.assertEqual((await trainer_events.get(timeout=1))['unread'], 0)
+        finally:
+            member_events.close()
+            trainer_events.close()
+
+    async def test_stream_sends_events_for_the_signed_in_user(self):
+        await self.async_client.aforce_login(self.member)
+        response = await self.async_client.get(reverse('chat_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        try:
+            self.assertTrue((await anext(stream)).startswith(b'retry:'))
+
+            events.publish(events.user_channel(self.member.id), {
+                'type': 'message', 'room': self.room.id, 'sender_id': self.member.id,
+                'message': {'id': 1, 'content': 'Hi'}, 'last_message': 'Hi', 'time': 'just now',
+            })
+
+            name, data = (await anext(stream)).decode().strip().split('\n')
+            self.assertEqual(name, 'event: message')
+            self.assertTrue(json.loads(data.removeprefix('data: '))['message']['is_mine'])
+        finally:
+            await stream.aclose()
+
+    def test_stream_is_refused_when_disabled(self):
+        self.client.force_login(self.member)
+        with mock.patch.object(views, 'SSE_ENABLED', False):
+            self.assertEqual(self.client.get(reverse('chat_stream')).status_code, 503)
+
+
+class ChatRoomCounterTests(TestCase):
+    def setUp(self):
+        self.trainer_user = User.objects.create_user(username='coach', password='Pass1234')
+        UserProfile.objects.create(user=self.trainer_user, role='trainer')
+        self.trainer = TrainerRegistration.objects.create(user=self.trainer_user, experience=3, specialization='Strength')
+        self.member = User.objects.create_user(username='member', password='Pass1234')
+        booking = TrainerBooking.objects.create(
+            user=self.member, trainer=self.trainer, booking_date=date.today(),
+            status='confirmed', payment_status='pending',
+        )
+        self.room = ChatRoom.provision(booking)
+
+    def test_sending_updates_the_last_message_and_the_recipient_counter(self):
+        self.client.force_login(self.member)
+        for content in ['Hello coach', 'Can we move tomorrow\'s session to the evening please?']:
+            self.client.post(reverse('send_message', args=[self.room.id]), {'content': content})
+
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_message, self.room.messages.last())
+        self.assertEqual(self.room.last_message_preview, "Can we move tomorrow's session to t...")
+        self.assertEqual((self.room.client_unread, self.room.trainer_unread), (0, 2))
+        self.assertEqual(ChatRoom.total_unread(self.trainer_user), 2)
+
+    def test_opening_the_room_resets_only_the_readers_counter(self):
+        self.room.add_message(sender=self.member, content='Hello coach')
+        self.room.add_message(sender=self.trainer_user, content='Hi!')
+        self.client.force_login(self.trainer_user)
+
+        response = self.client.get(reverse('trainer_chat'), {'room': self.room.id})
+
+        self.assertEqual(response.context['chat_unread_count'], 0)
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.client_unread, self.room.trainer_unread), (1, 0))
+        self.assertEqual(self.room.trainer_last_read_message_id, self.room.last_message_id)
+        self.assertEqual(self.room.client_last_read_message_id, 0)
+
+    def test_reading_part_of_the_way_recounts_from_the_watermark(self):
+        first = self.room.add_message(sender=self.member, content='One')
+        self.room.add_message(sender=self.member, content='Two')
+        self.room.add_message(sender=self.member, content='Three')
+        self.client.force_login(self.trainer_user)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('mark_chat_read', args=[self.room.id]), {'up_to': first.id})
+
+        writes = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"chat_chatroom"', writes[0])
+
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.trainer_last_read_message_id, self.room.trainer_unread), (first.id, 2))
+        self.assertEqual(self.room.count_unread(self.trainer_user), 2)
+
+    def test_chat_list_reads_the_room_fields(self):
+        self.room.add_message(sender=self.trainer_user, content='See you at 6')
+        self.client.force_login(self.member)
+
+        data = self.client.get(reverse('fetch_chat_list'), {'role': 'client'}).json()
+
+        self.assertEqual(data['total_unread'], 1)
+        self.assertEqual(data['rooms'][0]['last_message'], 'See you at 6')
+        self.assertEqual(data['rooms'][0]['time'], 'just now')
+
+
+class ChatListQueryTests(TestCase):
+    def setUp(self):
+        self.trainer_user = User.objects.create_user(username='coach', password='Pass1234')
+        self.trainer = TrainerRegistration.objects.create(user=self.trainer_user, experience=3, specialization='Strength')
+
+    def add_rooms(self, count):
+        for i in range(count):
+            member = User.objects.create(username=f'member{ChatRoom.objects.count()}')
+            room = ChatRoom.objects.create(trainer=self.trainer, client=member)
+            room.add_message(sender=member, content=f'Message {i}')
+
+    def chat_list_queries(self, role):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('fetch_chat_list'), {'role': role})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_query_count_does_not_grow_with_rooms(self):
+        self.client.force_login(self.trainer_user)
+        self.add_rooms(1)
+        few, _ = self.chat_list_queries('trainer')
+
+        self.add_rooms(10)
+        many, data = self.chat_list_queries('trainer')
+
+        self.assertEqual(many, few)
+        self.assertEqual(len(data['rooms']), 11)
+        self.assertEqual(data['total_unread'], 11)
+
+    def test_client_list_is_a_single_query_after_authentication(self):
+        self.add_rooms(3)
+        member = ChatRoom.objects.first().client
+        self.client.force_login(member)
+        # Session and user lookups, then the room list
+        with self.assertNumQueries(3):
+            self.client.get(reverse('fetch_chat_list'), {'role': 'client'})
+
+
+class ChatRoomProvisioningTests(TestCase):
+    def setUp(self):
+        self.trainer_user = User.objects.create_user(username='coach', password='Pass1234')
+        UserProfile.objects.create(user=self.trainer_user, role='trainer')
+        self.trainer = TrainerRegistration.objects.create(
+            user=self.trainer_user, experience=3, specialization='Strength', monthly_price=1000,
+        )
+        self.member = User.objects.create_user(username='member', password='Pass1234')
+
+    def book(self, status):
+        return TrainerBooking.objects.create(user=self.member, trainer=self.trainer, booking_date=date.today(), status=status)
+
+    def test_confirming_a_booking_opens_the_room(self):
+        booking = self.book('pending')
+        self.client.force_login(self.trainer_user)
+
+        self.client.post(reverse('update_booking_status', args=[booking.id]), {'status': 'confirmed'})
+
+        self.assertTrue(ChatRoom.objects.filter(trainer=self.trainer, client=self.member).exists())
+
+    def test_chat_page_does_not_create_rooms(self):
+        self.book('confirmed')
+        self.client.force_login(self.trainer_user)
+
+        response = self.client.get(reverse('trainer_chat'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ChatRoom.objects.exists())
+
+    def test_backfill_creates_only_missing_rooms(self):
+        self.book('confirmed')
+        self.book('confirmed')
+        other = User.objects.create_user(username='other', password='Pass1234')
+        TrainerBooking.objects.create(user=other, trainer=self.trainer, booking_date=date.today(), status='confirmed')
+        ChatRoom.objects.create(trainer=self.trainer, client=other)
+        self.book('rejected')
+
+        call_command('provision_chat_rooms', stdout=io.StringIO())
+        call_command('provision_chat_rooms', stdout=io.StringIO())
+
+        self.assertEqual(
+            set(ChatRoom.objects.values_list('client__username', flat=True)),
+            {'member', 'other'},
+        )
+
+
+class ChatSessionExpiryTests(TestCase):
+    def setUp(self):
+        trainer_user = User.objects.create_user(username='coach', password='Pass1234')
+        self.trainer = TrainerRegistration.objects.create(user=trainer_user, experience=3, specialization='Strength')
+        self.member = User.objects.create_user(username='member', password='Pass1234')
+        self.booking = TrainerBooking.objects.create(
+            user=self.member, trainer=self.trainer, booking_date=date.today(),
+            status='confirmed', payment_status='pending',
+        )
+        self.room = ChatRoom.provision(self.booking)
+        self.client.force_login(self.member)
+
+    def end_access(self):
+        ChatRoom.objects.filter(pk=self.room.pk).update(access_until=timezone.now() - timedelta(minutes=1))
+
+    def ended_messages(self):
+        return self.room.messages.filter(message_type='system', content=SESSION_ENDED_MESSAGE).count()
+
+    def test_access_follows_the_free_window_and_the_paid_period(self):
+        self.assertEqual(self.room.access_until, self.booking.created_at + timedelta(days=2))
+
+        valid_until = timezone.now() + timedelta(days=30)
+        self.booking.payment_status = 'completed'
+        self.booking.valid_until = valid_until
+        self.booking.save()
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.access_until, valid_until)
+
+        self.booking.status = 'cancelled'
+        self.booking.save()
+        self.room.refresh_from_db()
+        self.assertIsNone(self.room.access_until)
+
+    def test_polls_do_not_query_bookings(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('fetch_messages', args=[self.room.id]))
+
+        self.assertFalse([q for q in queries if TrainerBooking._meta.db_table in q['sql']])
+        self.assertEqual(self.ended_messages(), 0)
+
+    def test_poll_after_access_ends_posts_the_message_once(self):
+        self.end_access()
+        url = reverse('fetch_messages', args=[self.room.id])
+
+        self.client.get(url)
+        self.client.get(url)
+
+        self.assertEqual(self.ended_messages(), 1)
+
+    def test_sweep_posts_the_message_once_per_lapse(self):
+        self.end_access()
+        first, second = io.StringIO(), io.StringIO()
+        call_command('end_chat_sessions', stdout=first)
+        call_command('end_chat_sessions', stdout=second)
+        self.assertEqual(self.ended_messages(), 1)
+        self.assertIn('Ended 1 chat session(s)', first.getvalue())
+        self.assertIn('No chat sessions have ended', second.getvalue())
+
+        # Booking again restores access, and its end is announced again
+        TrainerBooking.objects.create(
+            user=self.member, trainer=self.trainer, booking_date=date.today(),
+            status='confirmed', payment_status='pending',
+        )
+        self.room.refresh_from_db()
+        self.assertTrue(self.room.has_access())
+        self.end_access()
+        call_command('end_chat_sessions', stdout=io.StringIO())
+        self.assertEqual(self.ended_messages(), 2)
+
+
+@mock.patch.object(views, 'HISTORY_PAGE_SIZE', 3)
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        self.trainer_user = User.objects.create_user(username='coach', password='Pass1234')
+        UserProfile.objects.create(user=self.trainer_user, role='trainer')
+        self.trainer = TrainerRegistration.objects.create(user=self.trainer_user, experience=3, specialization='Strength')
+        self.member = User.objects.create_user(username='member', password='Pass1234')
+        booking = TrainerBooking.objects.create(
+            user=self.member, trainer=self.trainer, booking_date=date.today(),
+            status='confirmed', payment_status='pending',
+        )
+        self.room = ChatRoom.provision(booking)
+        self.ids = [self.room.add_message(sender=self.member, content=f'Message {i}').id for i in range(7)]
+        self.client.force_login(self.trainer_user)
+
+    def test_room_page_renders_only_the_latest_messages(self):
+        response = self.client.get(reverse('trainer_chat'), {'room': self.room.id})
+
+        self.assertEqual([m.id for m in response.context['messages']], self.ids[-3:])
+        self.assertTrue(response.context['has_older_messages'])
+
+    def test_older_pages_are_fetched_before_an_id(self):
+        url = reverse('fetch_chat_history', args=[self.room.id])
+
+        page = self.client.get(url, {'before': self.ids[4]}).json()
+        self.assertEqual([m['id'] for m in page['messages']], self.ids[1:4])
+        self.assertTrue(page['has_more'])
+
+        page = self.client.get(url, {'before': self.ids[1]}).json()
+        self.assertEqual([m['id'] for m in page['messages']], self.ids[:1])
+        self.assertFalse(page['has_more'])
+
+    def test_history_is_limited_to_participants(self):
+        outsider = User.objects.create_user(username='outsider', password='Pass1234')
+        self.client.force_login(outsider)
+
+        response = self.client.get(reverse('fetch_chat_history', args=[self.room.id]), {'before': self.ids[-1]})
+
+        self.assertEqual(response.status_code, 403)
+
+
+class ChatSenderCardTests(TestCase):
+    def setUp(self):
+        self.trainer_user = User.objects.create_user(username='coach', password='Pass1234', first_name='Sam', last_name='Coach')
+        self.trainer = TrainerRegistration.objects.create(user=self.trainer_user, experience=3, specialization='Strength')
+        self.member = User.objects.create_user(username='member', password='Pass1234')
+        self.profile = UserProfile.objects.create(user=self.member, profile_picture='profile_pictures/member.png')
+        booking = TrainerBooking.objects.create(
+            user=self.member, trainer=self.trainer, booking_date=date.today(),
+            status='confirmed', payment_status='pending',
+        )
+        self.room = ChatRoom.provision(booking)
+        self.client.force_login(self.member)
+
+    def add_messages(self, count):
+        for i in range(count):
+            self.room.add_message(sender=self.member if i % 2 else self.trainer_user, content=f'Message {i}')
+
+    def poll(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('fetch_messages', args=[self.room.id]))
+        self.assertEqual(response.status_code, 200)
+        self.queries = [q['sql'] for q in queries]
+        return len(queries), response.json()['messages']
+
+    def test_query_count_does_not_grow_with_messages(self):
+        self.add_messages(2)
+        self.poll()
+        few, _ = self.poll()
+
+        self.add_messages(40)
+        self.poll()
+        many, messages = self.poll()
+
+        self.assertEqual(many, few)
+        self.assertEqual(len(messages), 42)
+        self.assertEqual({m['sender_name'] for m in messages}, {'Sam Coach', 'member'})
+        self.assertEqual(
+            {m['profile_picture'] for m in messages if m['sender'] == 'member'},
+            {self.profile.profile_picture.url},
+        )
+
+    def test_every_poll_reads_all_senders_with_one_query(self):
+        self.add_messages(4)
+        self.poll()
+        count, _ = self.poll()
+
+        user_table = User._meta.db_table
+        sender_queries = [sql for sql in self.queries if user_table in sql and 'JOIN' in sql]
+        self.assertEqual(len(sender_queries), 1)
+        self.assertIn(UserProfile._meta.db_table, sender_queries[0])
+        # Session, user, room, its client for the access check and messages, plus the senders
+        self.assertEqual(count, 6, self.queries)
+
+    def test_changes_made_by_another_process_show_on_the_next_poll(self):
+        self.add_messages(2)
+        self.poll()
+
+        # Queryset updates send no signals, like a save handled by another worker
+        UserProfile.objects.filter(pk=self.profile.pk).update(profile_picture='profile_pictures/member_new.png')
+        User.objects.filter(pk=self.trainer_user.pk).update(first_name='Alex')
+        _, messages = self.poll()
+
+        self.assertIn('/media/profile_pictures/member_new.png', {m['profile_picture'] for m in messages})
+        self.assertIn('Alex Coach', {m['sender_name'] for m in messages})
+
+
+class ChatImageUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+        trainer_user = User.objects.create_user(username='coach', password='Pass1234')
+        trainer = TrainerRegistration.objects.create(user=trainer_user, experience=3, specialization='Strength')
+        self.member = User.objects.create_user(username='member', password='Pass1234')
+        booking = TrainerBooking.objects.create(
+            user=self.member, trainer=trainer, booking_date=date.today(),
+            status='confirmed', payment_status='pending',
+        )
+        self.room = ChatRoom.provision(booking)
+        self.client.force_login(self.member)
+
+    def send_image(self, data, name='photo.jpg', content_type='image/jpeg'):
+        upload = SimpleUploadedFile(name, data, content_type=content_type)
+        return self.client.post(reverse('send_message', args=[self.room.id]), {'image': upload})
+
+    def test_uploads_are_stored_as_bounded_webp_without_exif(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        exif[0x010F] = 'PhoneMaker'
+        photo = io.BytesIO()
+        Image.new('RGB', (3000, 1000), 'orange').save(photo, format='JPEG', exif=exif)
+
+        response = self.send_image(photo.getvalue())
+
+        self.assertEqual(response.status_code, 200)
+        msg = self.room.messages.get()
+        with Image.open(msg.image) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(stored.size, (683, 2048))
+            self.assertEqual(len(stored.getexif()), 0)
+        with Image.open(msg.thumbnail) as thumbnail:
+            self.assertEqual(max(thumbnail.size), 480)
+
+        data = response.json()['message']
+        self.assertEqual(data['image_url'], msg.thumbnail.url)
+        self.assertEqual(data['image_full_url'], msg.image.url)
+
+    def test_files_that_are_not_images_are_rejected(self):
+        response = self.send_image(b'not really a png', name='fake.png', content_type='image/png')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.room.messages.exists())
+
+    def test_files_are_stored_before_the_room_is_locked(self):
+        photo = io.BytesIO()
+        Image.new('RGB', (64, 64), 'blue').save(photo, format='PNG')
+        storage = Message._meta.get_field('image').storage
+        add_message = ChatRoom.add_message
+        stored_at_lock = []
+
+        def record(room, sender, content='', **fields):
+            stored_at_lock.extend(storage.exists(fields[name]) for name in ('image', 'thumbnail'))
+            return add_message(room, sender, content, **fields)
+
+        with mock.patch.object(ChatRoom, 'add_message', autospec=True, side_effect=record):
+            response = self.send_image(photo.getvalue(), name='photo.png', content_type='image/png')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stored_at_lock, [True, True])
+        msg = self.room.messages.get()
+        self.assertTrue(storage.exists(msg.image.name))
+        self.assertTrue(storage.exists(msg.thumbnail.name))
+
+    def test_files_are_removed_when_the_message_is_not_created(self):
+        photo = io.BytesIO()
+        Image.new('RGB', (64, 64), 'blue').save(photo, format='PNG')
+        storage = Message._meta.get_field('image').storage
+
+        with mock.patch.object(ChatRoom, 'add_message', side_effect=RuntimeError('database down')):
+            with self.assertRaises(RuntimeError):
+                self.send_image(photo.getvalue(), name='photo.png', content_type='image/png')
+
+        _, files = storage.listdir('chat_images')
+        _, thumbnails = storage.listdir('chat_images/thumbnails')
+        self.assertEqual(files + thumbnails, [])
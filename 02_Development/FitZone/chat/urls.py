@@ -7,6 +7,9 @@ urlpatterns = [
     path('chat/send/<int:room_id>/', views.send_message, name='send_message'),
     path('chat/fetch/<int:room_id>/', views.fetch_messages, name='fetch_messages'),
     path('chat/fetch-list/', views.fetch_chat_list, name='fetch_chat_list'),
+    path('chat/history/<int:room_id>/', views.fetch_history, name='fetch_chat_history'),
+    path('chat/read/<int:room_id>/', views.mark_read, name='mark_chat_read'),
+    path('chat/stream/', views.chat_stream, name='chat_stream'),
     path('chat/start/<int:trainer_id>/', views.start_chat_with_trainer, name='start_chat_with_trainer'),
     path('chat/delete-room/<int:room_id>/', views.delete_room, name='delete_chat_room'),
     path('chat/report/<int:room_id>/', views.report_room, name='report_chat_room'),
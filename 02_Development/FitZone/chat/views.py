@@ -1,52 +1,117 @@
 ﻿from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from datetime import timedelta
-from django.db.models import Q, Max, Count
-from .models import ChatRoom, Message, ChatReport
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.db.models import F
+from . import events
+from .images import delete_files, save_files, transcode_upload
+from .models import ChatRoom, ChatReport
+from .senders import sender_cards
 from trainer.models import TrainerRegistration, TrainerBooking
 from login_logout_register.models import UserProfile
 
+# Push updates over Server-Sent Events (needs an ASGI server); pages poll otherwise
+SSE_ENABLED = getattr(settings, 'CHAT_SSE_ENABLED', False)
+
+# Seconds between keep-alive comments, and before a stream is closed so the
+# browser reconnects (which also lets proxies recycle the connection)
+STREAM_HEARTBEAT = 15
+STREAM_MAX_SECONDS = 300
+STREAM_RETRY_MS = 3000
+
+# Messages rendered when a room is opened, and per older page loaded on scroll
+HISTORY_PAGE_SIZE = getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', 50)
+
+
+def _message_data(msg, sender):
+    """JSON for ``msg``; ``sender`` is its sender's card from ``sender_cards``."""
+    return {
+        'id': msg.id,
+        'sender': sender['username'],
+        'sender_name': sender['name'],
+        'content': msg.content,
+        # The thumbnail is shown in the conversation and the full image opens on click
+        'image_url': (msg.thumbnail or msg.image).url if msg.image else '',
+        'image_full_url': msg.image.url if msg.image else '',
+        'message_type': msg.message_type,
+        'time': msg.created_at.strftime('%I:%M %p'),
+        'profile_picture': sender['profile_picture'],
+    }
 
-def get_profile_picture_url(user):
-    try:
-        profile = user.userprofile
-        if profile.profile_picture:
-            return profile.profile_picture.url
-    except UserProfile.DoesNotExist:
-        pass
-    return ''
 
-def _has_chat_access(client_user, trainer_reg):
-    now = timezone.now()
-    two_days_ago = now - timedelta(days=2)
-    
-    base_qs = TrainerBooking.objects.filter(
-        user=client_user, trainer=trainer_reg, status='confirmed'
-    )
-    
-    has_free = base_qs.filter(payment_status='pending', created_at__gte=two_days_ago).exists()
-    has_paid = base_qs.filter(
-        payment_status='completed'
-    ).filter(Q(valid_until__isnull=True) | Q(valid_until__gte=now)).exists()
+def _messages_data(messages, user):
+    """JSON for ``messages`` as seen by ``user``, resolving all their senders at once."""
+    senders = sender_cards(msg.sender_id for msg in messages)
+    return [
+        {**_message_data(msg, senders[msg.sender_id]), 'is_mine': msg.sender_id == user.id}
+        for msg in messages
+    ]
+
+
+def _message_page(room, before=None):
+    """
+    Up to ``HISTORY_PAGE_SIZE`` messages of ``room`` older than the id
+    ``before`` (the latest ones if ``None``), oldest first, and whether
+    there are older ones. Keyset pagination on the ``(room, id)`` index.
+    """
+    # The room page renders each sender's avatar
+    messages = room.messages.select_related('sender__userprofile')
+    if before is not None:
+        messages = messages.filter(id__lt=before)
+    page = list(messages.order_by('-id')[:HISTORY_PAGE_SIZE + 1])
+    return page[:HISTORY_PAGE_SIZE][::-1], len(page) > HISTORY_PAGE_SIZE
+
+
+def _publish_unread(room, user):
+    if not SSE_ENABLED:
+        return
+    events.publish(events.user_channel(user.id), {
+        'type': 'unread',
+        'room': room.id,
+        'unread': room.get_unread_count_for_user(user),
+        'total_unread': ChatRoom.total_unread(user),
+    })
+
+
+def _publish_message(room, msg):
+    """Push a new message to both participants, and the recipient's new unread counts."""
+    if not SSE_ENABLED:
+        return
+    event = {
+        'type': 'message',
+        'room': room.id,
+        'sender_id': msg.sender_id,
+        'message': _message_data(msg, sender_cards([msg.sender_id])[msg.sender_id]),
+        'last_message': room.last_message_preview,
+        'time': 'just now',
+    }
+    trainer_user = room.trainer.user
+    for user_id in (room.client_id, trainer_user.id):
+        events.publish(events.user_channel(user_id), event)
+    _publish_unread(room, room.client if msg.sender_id == trainer_user.id else trainer_user)
+
+
+def _mark_read(room, user, up_to=None):
+    if room.mark_read(user, up_to):
+        _publish_unread(room, user)
 
-    return has_free or has_paid
 
 def _handle_session_expiry(room):
-    if not _has_chat_access(room.client, room.trainer):
-        msg_text = "Your session has ended. Please book again to continue access."
-        has_ended_msg = room.messages.filter(message_type='system', content=msg_text).exists()
-        
-        if not has_ended_msg:
-            Message.objects.create(
-                room=room,
-                sender=room.trainer.user, 
-                content=msg_text,
-                message_type='system'
-            )
-            room.updated_at = timezone.now()
-            room.save(update_fields=['updated_at'])
+    """
+    Post the session-ended message when ``room``'s access has run out.
+    Compares the stored ``access_until``, so it queries nothing until the
+    moment access ends; ``end_chat_sessions`` covers rooms nobody opens.
+    """
+    if room.access_ended_notified or room.has_access():
+        return
+    msg = room.notify_access_ended()
+    if msg is not None:
+        _publish_message(room, msg)
+
 
 @login_required
 def trainer_chat(request):
@@ -61,43 +126,25 @@ def trainer_chat(request):
     if not registration:
         return redirect('trainer_dashboard')
 
-    active_bookings = TrainerBooking.objects.filter(
-        trainer=registration,
-        status='confirmed',
-    ).select_related('user')
-
-    for booking in active_bookings:
-        ChatRoom.objects.get_or_create(
-            trainer=registration,
-            client=booking.user
-        )
-
     chat_rooms = ChatRoom.objects.filter(trainer=registration).select_related(
         'client'
-    ).annotate(
-        last_message_time=Max('messages__created_at'),
-        unread=Count(
-            'messages',
-            filter=Q(messages__is_read=False) & ~Q(messages__sender=request.user)
-        )
-    ).order_by('-last_message_time')
+    ).annotate(unread=F('trainer_unread')).order_by('-last_message_at')
 
-    active_client_ids = set()
-    for booking in active_bookings:
-        if _has_chat_access(booking.user, registration):
-            active_client_ids.add(booking.user_id)
+    now = timezone.now()
+    active_client_ids = {room.client_id for room in chat_rooms if room.has_access(now)}
 
     room_id = request.GET.get('room')
     active_room = None
     messages_list = []
+    has_older_messages = False
 
     if room_id:
         active_room = ChatRoom.objects.filter(id=room_id, trainer=registration).first()
 
     if active_room:
         _handle_session_expiry(active_room)
-        messages_list = active_room.messages.select_related('sender').order_by('created_at').all()
-        active_room.messages.filter(is_read=False).exclude(sender=request.user).update(is_read=True)
+        messages_list, has_older_messages = _message_page(active_room)
+        _mark_read(active_room, request.user)
 
     active_room_is_active = False
     if active_room and active_room.client_id in active_client_ids:
@@ -110,53 +157,37 @@ def trainer_chat(request):
         'chat_rooms': chat_rooms,
         'active_room': active_room,
         'messages': messages_list,
+        'has_older_messages': has_older_messages,
         'total_unread': total_unread,
         'user_role': 'trainer',
         'active_client_ids': active_client_ids,
         'active_room_is_active': active_room_is_active,
+        'chat_sse_enabled': SSE_ENABLED,
     }
     return render(request, 'chat/trainer_chat.html', context)
 
 
 @login_required
 def client_chat(request):
-    active_bookings = TrainerBooking.objects.filter(
-        user=request.user,
-        status='confirmed',
-    ).select_related('trainer__user')
-
-    for booking in active_bookings:
-        ChatRoom.objects.get_or_create(
-            trainer=booking.trainer,
-            client=request.user
-        )
-
-    active_trainer_ids = set()
-    for booking in active_bookings:
-        if _has_chat_access(request.user, booking.trainer):
-            active_trainer_ids.add(booking.trainer_id)
-
     chat_rooms = ChatRoom.objects.filter(client=request.user).select_related(
         'trainer__user'
-    ).annotate(
-        last_message_time=Max('messages__created_at'),
-        unread=Count(
-            'messages',
-            filter=Q(messages__is_read=False) & ~Q(messages__sender=request.user)
-        )
-    ).order_by('-last_message_time')
+    ).annotate(unread=F('client_unread')).order_by('-last_message_at')
+
+    now = timezone.now()
+    active_trainer_ids = {room.trainer_id for room in chat_rooms if room.has_access(now)}
 
     room_id = request.GET.get('room')
     active_room = None
     messages_list = []
+    has_older_messages = False
 
     if room_id:
         active_room = ChatRoom.objects.filter(id=room_id, client=request.user).first()
 
     if active_room:
         _handle_session_expiry(active_room)
-        messages_list = active_room.messages.select_related('sender').order_by('created_at').all()
-        active_room.messages.filter(is_read=False).exclude(sender=request.user).update(is_read=True)
+        messages_list, has_older_messages = _message_page(active_room)
+        _mark_read(active_room, request.user)
 
     active_room_is_active = False
     if active_room and active_room.trainer_id in active_trainer_ids:
@@ -168,10 +199,12 @@ def client_chat(request):
         'chat_rooms': chat_rooms,
         'active_room': active_room,
         'messages': messages_list,
+        'has_older_messages': has_older_messages,
         'total_unread': total_unread,
         'user_role': 'client',
         'active_trainer_ids': active_trainer_ids,
         'active_room_is_active': active_room_is_active,
+        'chat_sse_enabled': SSE_ENABLED,
     }
     return render(request, 'chat/client_chat.html', context)
 
@@ -186,7 +219,7 @@ def send_message(request, room_id):
     if request.user != room.client and request.user != room.trainer.user:
         return JsonResponse({'error': 'Access denied'}, status=403)
 
-    if not _has_chat_access(room.client, room.trainer):
+    if not room.has_access():
         _handle_session_expiry(room)
         return JsonResponse({'error': 'Booking is no longer active. Book again to access this feature.'}, status=403)
 
@@ -202,29 +235,31 @@ def send_message(request, room_id):
             return JsonResponse({'error': 'Only JPEG, PNG, GIF, and WebP images are allowed.'}, status=400)
         if image.size > 5 * 1024 * 1024:
             return JsonResponse({'error': 'Image must be under 5 MB.'}, status=400)
+        try:
+            image, thumbnail = transcode_upload(image)
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        # Stored before add_message locks the room, which then only records the names
+        image, thumbnail = save_files(image, thumbnail)
+    else:
+        thumbnail = None
 
-    msg = Message.objects.create(
-        room=room,
-        sender=request.user,
-        content=content,
-        image=image,
-    )
-    room.updated_at = timezone.now()
-    room.save(update_fields=['updated_at'])
+    try:
+        msg = room.add_message(
+            sender=request.user,
+            content=content,
+            image=image,
+            thumbnail=thumbnail,
+        )
+    except Exception:
+        if image:
+            delete_files(image, thumbnail)
+        raise
+    _publish_message(room, msg)
 
     return JsonResponse({
         'status': 'ok',
-        'message': {
-            'id': msg.id,
-            'sender': msg.sender.username,
-            'sender_name': msg.sender.get_full_name() or msg.sender.username,
-            'content': msg.content,
-            'image_url': msg.image.url if msg.image else '',
-            'message_type': msg.message_type,
-            'time': msg.created_at.strftime('%I:%M %p'),
-            'is_mine': True,
-            'profile_picture': get_profile_picture_url(msg.sender),
-        }
+        'message': _messages_data([msg], request.user)[0],
     })
 
 
@@ -243,29 +278,100 @@ def fetch_messages(request, room_id):
     except (ValueError, TypeError):
         after_id = 0
 
-    new_messages = room.messages.filter(id__gt=after_id).select_related('sender').order_by('created_at')
-
-    new_messages_to_mark = new_messages.filter(is_read=False).exclude(sender=request.user)
-    if new_messages_to_mark.exists():
-        new_messages_to_mark.update(is_read=True)
-
-    messages_data = []
-    for msg in new_messages:
-        messages_data.append({
-            'id': msg.id,
-            'sender': msg.sender.username,
-            'sender_name': msg.sender.get_full_name() or msg.sender.username,
-            'content': msg.content,
-            'image_url': msg.image.url if msg.image else '',
-            'message_type': msg.message_type,
-            'time': msg.created_at.strftime('%I:%M %p'),
-            'is_mine': msg.sender == request.user,
-            'profile_picture': get_profile_picture_url(msg.sender),
-        })
+    new_messages = list(room.messages.filter(id__gt=after_id).order_by('id'))
+    messages_data = _messages_data(new_messages, request.user)
+
+    # Everything up to the newest message now on the page has been seen
+    _mark_read(room, request.user, up_to=messages_data[-1]['id'] if messages_data else after_id)
 
     return JsonResponse({'messages': messages_data})
 
 
+@login_required
+def fetch_history(request, room_id):
+    """Older messages for a room page scrolled to the top: ``?before=<id of the oldest one shown>``."""
+    room = get_object_or_404(ChatRoom.objects.select_related('trainer'), id=room_id)
+
+    if request.user != room.client and request.user.id != room.trainer.user_id:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    try:
+        before = int(request.GET['before'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'before must be a message id'}, status=400)
+
+    older, has_more = _message_page(room, before)
+    return JsonResponse({
+        'messages': _messages_data(older, request.user),
+        'has_more': has_more,
+    })
+
+
+@login_required
+def mark_read(request, room_id):
+    """
+    Mark a room read after its open page received messages from the
+    stream, up to the message id ``up_to`` if given.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST only'}, status=405)
+
+    room = get_object_or_404(ChatRoom.objects.select_related('trainer'), id=room_id)
+
+    if request.user.id != room.client_id and request.user.id != room.trainer.user_id:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    try:
+        up_to = int(request.POST['up_to']) if request.POST.get('up_to') else None
+    except ValueError:
+        return JsonResponse({'error': 'up_to must be a message id'}, status=400)
+
+    _mark_read(room, request.user, up_to)
+    return JsonResponse({'status': 'ok'})
+
+
+async def _event_stream(user_id):
+    subscription = events.subscribe(events.user_channel(user_id))
+    try:
+        yield f'retry: {STREAM_RETRY_MS}\n\n'
+        loop = asyncio.get_running_loop()
+        closes_at = loop.time() + STREAM_MAX_SECONDS
+        while loop.time() < closes_at:
+            event = await subscription.get(timeout=STREAM_HEARTBEAT)
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+            if event['type'] == 'message':
+                event = {**event, 'message': {**event['message'], 'is_mine': event['sender_id'] == user_id}}
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        subscription.close()
+
+
+def _signed_in_user_id(request):
+    # Resolved synchronously: request.auser() needs async-capable auth
+    # backends, and social_core's Google backend is not one
+    return request.user.id if request.user.is_authenticated else None
+
+
+async def chat_stream(request):
+    """
+    Server-Sent Events stream of the signed-in user's new messages and
+    unread counts, replacing the message and chat list polling. Served
+    from ``FitZone.asgi``; under WSGI it is disabled and pages keep polling.
+    """
+    user_id = await sync_to_async(_signed_in_user_id)(request)
+    if user_id is None:
+        return JsonResponse({'error': 'Login required'}, status=401)
+    if not SSE_ENABLED:
+        return JsonResponse({'error': 'Live updates are not enabled'}, status=503)
+
+    response = StreamingHttpResponse(_event_stream(user_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def delete_room(request, room_id):
     if request.method != 'POST':
@@ -324,7 +430,8 @@ def start_chat_with_trainer(request, trainer_id):
 
     room, _ = ChatRoom.objects.get_or_create(
         trainer=trainer,
-        client=request.user
+        client=request.user,
+        defaults={'access_until': ChatRoom.compute_access_until(trainer.id, request.user.id)},
     )
 
     return redirect(f'/chat/client/?room={room.id}')
@@ -346,44 +453,31 @@ def fetch_chat_list(request):
     role = request.GET.get('role', 'client')
     user = request.user
 
+    # One query for the whole list: the last message and unread count are
+    # kept on each room, and rooms are matched through the trainer's user
+    # instead of looking the registration up first
     if role == 'trainer':
-        registration = TrainerRegistration.objects.filter(user=user).first()    
-        if not registration:
-            return JsonResponse({'rooms': [], 'total_unread': 0})
-
-        chat_rooms = ChatRoom.objects.filter(trainer=registration).annotate(    
-            last_message_time=Max('messages__created_at'),
-            unread=Count(
-                'messages',
-                filter=Q(messages__is_read=False) & ~Q(messages__sender=user)   
-            )
-        ).order_by('-last_message_time')
+        chat_rooms = ChatRoom.objects.filter(trainer__user=user).annotate(unread=F('trainer_unread'))
     else:
-        chat_rooms = ChatRoom.objects.filter(client=user).annotate(
-            last_message_time=Max('messages__created_at'),
-            unread=Count(
-                'messages',
-                filter=Q(messages__is_read=False) & ~Q(messages__sender=user)   
-            )
-        ).order_by('-last_message_time')
+        chat_rooms = ChatRoom.objects.filter(client=user).annotate(unread=F('client_unread'))
+    chat_rooms = chat_rooms.order_by('-last_message_at').values(
+        'id', 'last_message_id', 'last_message_at', 'last_message_preview', 'unread'
+    )
 
     rooms_data = []
     for room in chat_rooms:
-        last_msg = room.messages.order_by('-created_at').first()
-        if last_msg:
-            time_display = _smart_time_ago(last_msg.created_at)
-            preview = last_msg.content[:35]
-            if len(last_msg.content) > 35:
-                preview += '...'
+        if room['last_message_id']:
+            time_display = _smart_time_ago(room['last_message_at'])
+            preview = room['last_message_preview']
         else:
             time_display = ''
             preview = 'No messages yet'
 
         rooms_data.append({
-            'id': room.id,
+            'id': room['id'],
             'last_message': preview,
             'time': time_display,
-            'unread': room.unread,
+            'unread': room['unread'],
         })
 
     total_unread = sum(r['unread'] for r in rooms_data)
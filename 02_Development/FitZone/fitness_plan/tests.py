@@ -1,3 +1,70 @@
+from unittest import mock
+
+import pandas as pd
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+
+from food_recommendation_system.artifacts import from_dataframe
+from trainer.models import TrainerRegistration
+
+
+def recipe_catalog():
+    return from_dataframe('test', pd.DataFrame({
+        'recipe_name': ['Chicken Salad', 'Grilled Chicken Breast', 'Chickpea Curry', 'Banana Oatmeal'],
+        'image_url': [''] * 4,
+        'food_type': ['non-veg', 'non-veg', 'veg', 'veg'],
+        'cuisine_type': [['american'], ['american'], ['indian'], ['american']],
+        'meal_type': [['lunch/dinner'], ['lunch/dinner'], ['lunch/dinner'], ['breakfast']],
+        'ingredient_lines': [['200 g chicken', '1 cup lettuce'], ['1 chicken breast'], ['1 cup chickpeas'], ['1 banana', '1 cup oats']],
+        'calories': [420.4, 380.0, 510.0, 350.6],
+        'protein': [38.2, 52.0, 19.5, 9.0],
+        'fat': [21.0, 12.4, 14.0, 6.2],
+        'carbs': [12.0, 2.0, 70.6, 64.0],
+    }), dt_model=None)
+
+
+@mock.patch('fitness_plan.views.get_artifacts', side_effect=recipe_catalog)
+class RecipeAutocompleteTests(TestCase):
+    def setUp(self):
+        self.trainer = User.objects.create_user(username='trainer', password='Pass1234')
+        TrainerRegistration.objects.create(user=self.trainer, experience=3, specialization='Nutrition')
+        self.url = reverse('recipe_autocomplete')
+
+    def test_prefix_returns_macros_for_the_meal_form(self, get_artifacts):
+        self.client.login(username='trainer', password='Pass1234')
+
+        results = self.client.get(self.url, {'q': 'chick'}).json()['results']
+
+        self.assertEqual([r['name'] for r in results], ['Chicken Salad', 'Chickpea Curry', 'Grilled Chicken Breast'])
+        self.assertEqual(
+            {key: results[0][key] for key in ('calories', 'protein', 'carbs', 'fat')},
+            {'calories': 420, 'protein': 38, 'carbs': 12, 'fat': 21},
+        )
+        self.assertEqual(results[0]['ingredients'], '200 g chicken\n1 cup lettuce')
+
+    def test_recipes_without_ingredient_lines_are_suggested(self, get_artifacts):
+        catalog = recipe_catalog()
+        catalog.columns['ingredient_lines'] = catalog.columns['ingredient_lines'].copy()
+        catalog.columns['ingredient_lines'][0] = None
+        get_artifacts.side_effect = None
+        get_artifacts.return_value = catalog
+        self.client.login(username='trainer', password='Pass1234')
+
+        results = self.client.get(self.url, {'q': 'chicken salad'}).json()['results']
+
+        self.assertEqual(results[0]['name'], 'Chicken Salad')
+        self.assertEqual(results[0]['ingredients'], '')
+
+    def test_misspelled_words_still_match(self, get_artifacts):
+        self.client.login(username='trainer', password='Pass1234')
+
+        results = self.client.get(self.url, {'q': 'grilled chiken'}).json()['results']
+
+        self.assertEqual([r['name'] for r in results], ['Grilled Chicken Breast'])
+
+    def test_only_trainers_can_search(self, get_artifacts):
+        User.objects.create_user(username='member', password='Pass1234')
+        self.client.login(username='member', password='Pass1234')
 
-# Create your tests here.
+        self.assertEqual(self.client.get(self.url, {'q': 'chick'}).status_code, 403)
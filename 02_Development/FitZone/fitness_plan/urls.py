@@ -26,5 +26,6 @@ urlpatterns = [
     path('trainer/diet/<int:plan_id>/edit/', views.edit_diet_plan, name='edit_diet_plan'),
     path('trainer/diet/<int:plan_id>/add-meal/', views.add_meal, name='add_meal'),
     path('trainer/diet/meal/<int:meal_id>/delete/', views.delete_meal, name='delete_meal'),
+    path('trainer/diet/recipes/autocomplete/', views.recipe_autocomplete, name='recipe_autocomplete'),
     path('trainer/diet/<int:plan_id>/delete/', views.delete_diet_plan, name='delete_diet_plan'),
 ]
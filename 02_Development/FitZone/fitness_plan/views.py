@@ -5,9 +5,12 @@ from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
 from django.db.models import Q
+from django.http import JsonResponse
 
 from trainer.models import TrainerRegistration, TrainerBooking
 from notifications.utils import create_user_notification
+from food_recommendation_system.artifacts import get_artifacts
+from food_recommendation_system.recipe_search import suggest
 from .models import (
     ClientFitnessProfile, WorkoutPlan, WorkoutDay, Exercise, DietPlan, Meal
 )
@@ -584,6 +587,26 @@ def add_meal(request, plan_id):
     return redirect('edit_diet_plan', plan_id=plan.id)
 
 
+@login_required
+# Recipe suggestions for the add-meal form, with macros to pre-fill it
+def recipe_autocomplete(request):
+    if not TrainerRegistration.objects.filter(user=request.user).exists():
+        return JsonResponse({'error': 'Trainers only'}, status=403)
+
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'results': []})
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+
+    artifacts = get_artifacts()
+    if artifacts is None:
+        return JsonResponse({'error': 'Recipe catalog is not available', 'results': []}, status=503)
+    return JsonResponse({'results': suggest(artifacts, query, limit)})
+
+
 @login_required
 # Delete a meal
 def delete_meal(request, meal_id):
@@ -0,0 +1,496 @@
+"""
+Loading and publishing of the food recommendation artifacts.
+
+A published artifact version is a directory under ``ARTIFACTS_DIR``::
+
+    artifacts/
+        CURRENT              name of the version requests should use
+        <version>/
+            metadata.json    version, recipe count, label vocabularies, checksums
+            calories.npy     one float64 array per feature column
+            protein.npy
+            fat.npy
+            carbs.npy
+            health_score.npy precomputed dt_model probability per recipe
+            food_type.npy    (labels x recipes) bool masks, one row per label
+            cuisine.npy
+            meal_type.npy
+            ingredients_data.npy, ingredients_indices.npy, ingredients_indptr.npy
+                             CSR ingredient vectors (L2-normalized rows)
+            cosine_sim.npy   dense fallback, only written when the vectors
+                             could not be rebuilt from the legacy matrix
+            ingredient_tokens_indptr.npy, ingredient_tokens_indices.npy
+                             token -> recipe posting lists for exclusions,
+                             with the vocabulary in metadata.json
+            recipes.pkl      display columns (name, image, url, lists)
+            models.pkl       dt_model and scaler
+
+Arrays are opened with ``mmap_mode='r'`` so workers share the OS page cache
+instead of each unpickling a private copy. Nothing is read at import time:
+``get_artifacts()`` loads on first use and swaps in a new version when
+``CURRENT`` changes. When no artifact directory has been published, the
+legacy ``food_models.pkl`` is loaded into the same structure.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from .ingredient_index import TOKENIZER_VERSION, IngredientIndex
+from .macro_index import MacroIndex
+from .recipe_search import RecipeNameIndex
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.join(settings.BASE_DIR, 'food_recommendation_system')
+MODEL_PATH = os.path.join(APP_DIR, 'food_models.pkl')
+ARTIFACTS_DIR = getattr(settings, 'FOOD_ARTIFACTS_DIR', os.path.join(APP_DIR, 'artifacts'))
+
+# How often (seconds) a worker re-reads CURRENT to pick up a newly published version
+RELOAD_CHECK_INTERVAL = getattr(settings, 'FOOD_ARTIFACTS_RELOAD_INTERVAL', 5.0)
+
+FORMAT_VERSION = 1
+# Version name prefix of artifacts loaded from MODEL_PATH instead of a published directory
+LEGACY_PREFIX = "legacy-"
+FEATURES = ["calories", "protein", "fat", "carbs"]
+LABEL_COLUMNS = {"food_type": "food_type", "cuisine": "cuisine_type", "meal_type": "meal_type"}
+
+
+def build_filter_indexes(df):
+    """
+    Precompute one boolean mask per categorical label so requests can narrow
+    the catalog with vectorized ``&`` instead of per-row ``apply`` scans.
+
+    ``food_type`` is keyed by its raw value (matched exactly), while
+    ``cuisine`` and ``meal_type`` hold lists per recipe and are keyed by the
+    lowercased label, mirroring the case-insensitive matching of the old
+    ``apply(lambda ...)`` filters.
+    """
+    n_rows = len(df)
+
+    def list_label_masks(column):
+        masks = {}
+        for pos, labels in enumerate(df[column].tolist()):
+            for label in labels:
+                key = label.lower()
+                if key not in masks:
+                    masks[key] = np.zeros(n_rows, dtype=bool)
+                masks[key][pos] = True
+        return masks
+
+    food_types = df["food_type"].to_numpy()
+    return {
+        "food_type": {value: food_types == value for value in pd.unique(food_types)},
+        "cuisine": list_label_masks("cuisine_type"),
+        "meal_type": list_label_masks("meal_type"),
+        "calories": df["calories"].to_numpy(dtype=float),
+    }
+
+
+def build_ingredient_vectors(df, cosine_sim=None, n_probe=32):
+    """
+    Return L2-normalized TF-IDF ingredient vectors as a CSR matrix.
+
+    With unit rows, ``cosine_sim[i, j]`` is ``v_i . v_j``, so the mean
+    similarity of a recipe to a candidate set equals its dot product with the
+    set's centroid. When the legacy dense ``cosine_sim`` is given, a sample of
+    its rows is used to confirm the vectors reproduce it; ``None`` is returned
+    if they do not, so callers can keep using the dense matrix.
+    """
+    documents = df["ingredient_lines"].apply(lambda lines: " ".join(lines) if lines else "")
+    vectors = TfidfVectorizer().fit_transform(documents).tocsr().astype(np.float64)
+
+    if cosine_sim is not None:
+        probe = np.unique(np.linspace(0, len(df) - 1, num=min(n_probe, len(df)), dtype=int))
+        reconstructed = (vectors[probe] @ vectors.T).toarray()
+        if not np.allclose(reconstructed, np.asarray(cosine_sim[probe]), atol=1e-6):
+            return None
+    return vectors
+
+
+def predict_health(dt_model, numeric):
+    """
+    Probability of the "healthy" class for every recipe; all ones if the model cannot score.
+
+    Row predictions are independent, so scoring the catalog once gives the
+    same values as scoring each request's candidates.
+    """
+    X_df = pd.DataFrame({column: numeric[column] for column in FEATURES})
+    try:
+        if hasattr(dt_model, "predict_proba"):
+            return np.ascontiguousarray(dt_model.predict_proba(X_df)[:, 1], dtype=np.float64)
+        return dt_model.predict(X_df).astype(np.float64)
+    except Exception:
+        return np.ones(len(X_df))
+
+
+class RecommendationArtifacts:
+    """Immutable, read-only view of one artifact version used by the engine."""
+
+    def __init__(self, version, dt_model, scaler, recipes, numeric, filter_indexes,
+                 ingredient_vectors=None, cosine_sim=None, health_score=None, ingredient_index=None):
+        self.version = version
+        self.dt_model = dt_model
+        self.scaler = scaler
+        self.recipes = recipes
+        self.numeric = numeric
+        self.filter_indexes = filter_indexes
+        self.ingredient_vectors = ingredient_vectors
+        self.cosine_sim = cosine_sim
+        self.health_score = health_score if health_score is not None else predict_health(dt_model, numeric)
+        # Display columns as plain arrays so the engine can index them without pandas
+        self.columns = {column: recipes[column].to_numpy() for column in recipes.columns}
+        self._macro_index = None
+        self._ingredient_index = ingredient_index
+        self._name_index = None
+
+    @property
+    def n_recipes(self):
+        return len(self.recipes)
+
+    @property
+    def macro_index(self):
+        """KD-tree index over the standardized macros, created on first use."""
+        if self._macro_index is None:
+            X = np.column_stack([self.numeric[column] for column in FEATURES])
+            self._macro_index = MacroIndex(X, self.filter_indexes)
+        return self._macro_index
+
+    @property
+    def ingredient_index(self):
+        """Token posting lists of the ingredient lines, built on first use unless stored with the version."""
+        if self._ingredient_index is None:
+            self._ingredient_index = IngredientIndex.build(self.columns["ingredient_lines"])
+        return self._ingredient_index
+
+    @property
+    def name_index(self):
+        """Autocomplete index over the recipe names, built on first use."""
+        if self._name_index is None:
+            self._name_index = RecipeNameIndex(self.columns["recipe_name"])
+        return self._name_index
+
+
+def from_dataframe(version, df, dt_model, scaler=None, ingredient_vectors=None, cosine_sim=None):
+    """Build in-memory artifacts from a cleaned catalog DataFrame."""
+    df = df.reset_index(drop=True)
+    if ingredient_vectors is None:
+        ingredient_vectors = build_ingredient_vectors(df, cosine_sim)
+    else:
+        ingredient_vectors = sparse.csr_matrix(ingredient_vectors)
+    if ingredient_vectors is not None:
+        # The dense n x n matrix is no longer needed once the sparse vectors reproduce it
+        cosine_sim = None
+
+    numeric = {column: df[column].to_numpy(dtype=np.float64) for column in FEATURES}
+    return RecommendationArtifacts(
+        version=version,
+        dt_model=dt_model,
+        scaler=scaler,
+        recipes=df.drop(columns=FEATURES),
+        numeric=numeric,
+        filter_indexes=build_filter_indexes(df),
+        ingredient_vectors=ingredient_vectors,
+        cosine_sim=cosine_sim,
+    )
+
+
+def load_legacy_pickle(path=MODEL_PATH):
+    """Load the single-file ``food_models.pkl`` produced by the original notebook."""
+    version = f"{LEGACY_PREFIX}{os.stat(path).st_mtime_ns}"
+    with open(path, 'rb') as f:
+        models_data = pickle.load(f)
+    return from_dataframe(
+        version,
+        models_data['df_clean'],
+        models_data['dt_model'],
+        scaler=models_data.get('scaler'),
+        ingredient_vectors=models_data.get('ingredient_vectors'),
+        cosine_sim=models_data.get('cosine_sim'),
+    )
+
+
+def is_legacy_version(version):
+    """
+    True for versions loaded straight from ``food_models.pkl``. They are named
+    after the pickle's mtime and are gone once it is exported, rebuilt or
+    touched, so nothing saved should refer to them by position.
+    """
+    return bool(version) and version.startswith(LEGACY_PREFIX)
+
+
+def write_artifacts(artifacts, root=ARTIFACTS_DIR, extra_metadata=None):
+    """
+    Write ``artifacts`` as a new version directory under ``root``.
+
+    Files are written to a temporary directory that is renamed into place, so a
+    partially written version is never visible. ``metadata.json`` records a
+    SHA-256 checksum for every other file. Returns the version directory.
+    """
+    target = os.path.join(root, artifacts.version)
+    if os.path.exists(target):
+        raise FileExistsError(f"Artifact version {artifacts.version} already exists")
+    staging = os.path.join(root, f".{artifacts.version}.tmp-{os.getpid()}")
+    os.makedirs(staging)
+
+    n_rows = artifacts.n_recipes
+    labels = {}
+    for key in LABEL_COLUMNS:
+        vocabulary = sorted(artifacts.filter_indexes[key])
+        labels[key] = vocabulary
+        masks = (np.stack([artifacts.filter_indexes[key][label] for label in vocabulary])
+                 if vocabulary else np.zeros((0, n_rows), dtype=bool))
+        np.save(os.path.join(staging, f"{key}.npy"), masks)
+
+    for column in FEATURES:
+        np.save(os.path.join(staging, f"{column}.npy"), np.ascontiguousarray(artifacts.numeric[column], dtype=np.float64))
+    np.save(os.path.join(staging, "health_score.npy"), artifacts.health_score)
+
+    metadata = {
+        "version": artifacts.version,
+        "format": FORMAT_VERSION,
+        "created_at": timezone.now().isoformat(),
+        "n_recipes": n_rows,
+        "features": FEATURES,
+        "labels": labels,
+    }
+    if artifacts.ingredient_vectors is not None:
+        vectors = artifacts.ingredient_vectors.tocsr()
+        np.save(os.path.join(staging, "ingredients_data.npy"), vectors.data.astype(np.float64))
+        # Keep scipy's own index dtype so loading can wrap the mapped arrays without a cast
+        np.save(os.path.join(staging, "ingredients_indices.npy"), vectors.indices)
+        np.save(os.path.join(staging, "ingredients_indptr.npy"), vectors.indptr)
+        metadata["similarity"] = "sparse"
+        metadata["ingredient_shape"] = list(vectors.shape)
+    else:
+        np.save(os.path.join(staging, "cosine_sim.npy"), np.asarray(artifacts.cosine_sim))
+        metadata["similarity"] = "dense"
+
+    ingredient_index = artifacts.ingredient_index
+    np.save(os.path.join(staging, "ingredient_tokens_indptr.npy"), ingredient_index.indptr)
+    np.save(os.path.join(staging, "ingredient_tokens_indices.npy"), ingredient_index.indices)
+    metadata["ingredient_vocabulary"] = sorted(ingredient_index.vocabulary, key=ingredient_index.vocabulary.get)
+    metadata["ingredient_tokenizer"] = TOKENIZER_VERSION
+
+    artifacts.recipes.reset_index(drop=True).to_pickle(os.path.join(staging, "recipes.pkl"))
+    with open(os.path.join(staging, "models.pkl"), 'wb') as f:
+        pickle.dump({'dt_model': artifacts.dt_model, 'scaler': artifacts.scaler}, f)
+
+    metadata.update(extra_metadata or {})
+    metadata["checksums"] = {name: file_sha256(os.path.join(staging, name)) for name in sorted(os.listdir(staging))}
+    with open(os.path.join(staging, "metadata.json"), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    os.rename(staging, target)
+    return target
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_checksums(version, root=ARTIFACTS_DIR):
+    """Return the files of ``version`` whose contents no longer match ``metadata.json``."""
+    directory = os.path.join(root, version)
+    with open(os.path.join(directory, "metadata.json")) as f:
+        checksums = json.load(f).get("checksums", {})
+    return [
+        name for name, expected in checksums.items()
+        if not os.path.exists(os.path.join(directory, name))
+        or file_sha256(os.path.join(directory, name)) != expected
+    ]
+
+
+def publish(version, root=ARTIFACTS_DIR):
+    """Atomically point ``CURRENT`` at ``version``; running workers pick it up on their next check."""
+    if not os.path.isdir(os.path.join(root, version)):
+        raise FileNotFoundError(f"Artifact version {version} does not exist in {root}")
+    pointer = os.path.join(root, "CURRENT")
+    staging = f"{pointer}.tmp-{os.getpid()}"
+    with open(staging, 'w') as f:
+        f.write(version + "\n")
+    os.replace(staging, pointer)
+
+
+def current_version(root=ARTIFACTS_DIR):
+    """Name of the published version, or ``None`` if nothing has been published."""
+    try:
+        with open(os.path.join(root, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_version(version, root=ARTIFACTS_DIR):
+    """Open a published version with all arrays memory-mapped read-only."""
+    directory = os.path.join(root, version)
+
+    def array(name):
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+
+    with open(os.path.join(directory, "metadata.json")) as f:
+        metadata = json.load(f)
+    if metadata.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format {metadata.get('format')} in {directory}")
+
+    numeric = {column: array(column) for column in FEATURES}
+    filter_indexes = {"calories": numeric["calories"]}
+    for key in LABEL_COLUMNS:
+        masks = array(key)
+        filter_indexes[key] = {label: masks[i] for i, label in enumerate(metadata["labels"][key])}
+
+    ingredient_vectors = None
+    cosine_sim = None
+    if metadata["similarity"] == "sparse":
+        ingredient_vectors = sparse.csr_matrix(
+            (array("ingredients_data"), array("ingredients_indices"), array("ingredients_indptr")),
+            shape=tuple(metadata["ingredient_shape"]),
+            copy=False,
+        )
+    else:
+        cosine_sim = array("cosine_sim")
+
+    with open(os.path.join(directory, "models.pkl"), 'rb') as f:
+        models_data = pickle.load(f)
+
+    health_path = os.path.join(directory, "health_score.npy")
+    health_score = array("health_score") if os.path.exists(health_path) else None
+
+    recipes = pd.read_pickle(os.path.join(directory, "recipes.pkl"))
+
+    # An index tokenized differently from today's requests is rebuilt on first use instead
+    ingredient_index = None
+    if "ingredient_vocabulary" in metadata and metadata.get("ingredient_tokenizer") == TOKENIZER_VERSION:
+        ingredient_index = IngredientIndex(
+            metadata["ingredient_vocabulary"],
+            array("ingredient_tokens_indptr"),
+            array("ingredient_tokens_indices"),
+            metadata["n_recipes"],
+            recipes["ingredient_lines"].to_numpy(),
+        )
+
+    return RecommendationArtifacts(
+        version=metadata["version"],
+        dt_model=models_data['dt_model'],
+        scaler=models_data.get('scaler'),
+        recipes=recipes,
+        numeric=numeric,
+        filter_indexes=filter_indexes,
+        ingredient_vectors=ingredient_vectors,
+        cosine_sim=cosine_sim,
+        health_score=health_score,
+        ingredient_index=ingredient_index,
+    )
+
+
+_lock = threading.Lock()
+_state = {"source": None, "artifacts": None, "checked_at": 0.0}
+
+# Older published versions kept open for rendering plans generated from them
+PREVIOUS_VERSIONS_CACHED = 2
+_previous_versions = OrderedDict()
+
+
+def _resolve_source():
+    version = current_version(ARTIFACTS_DIR)
+    if version is not None:
+        return ("version", version)
+    try:
+        return ("legacy", os.stat(MODEL_PATH).st_mtime_ns)
+    except OSError:
+        return None
+
+
+def get_artifacts():
+    """
+    Return the artifacts for the currently published version, or ``None``.
+
+    The first call loads them; later calls re-check the published version at
+    most every ``RELOAD_CHECK_INTERVAL`` seconds. A new version is fully loaded
+    before the shared reference is swapped, so concurrent requests see either
+    the old or the new artifacts, never a mix. If loading a new version fails
+    the previous artifacts stay in service.
+    """
+    now = time.monotonic()
+    if _state["source"] is not None and now - _state["checked_at"] < RELOAD_CHECK_INTERVAL:
+        return _state["artifacts"]
+
+    with _lock:
+        if _state["source"] is not None and now - _state["checked_at"] < RELOAD_CHECK_INTERVAL:
+            return _state["artifacts"]
+        _state["checked_at"] = now
+
+        source = _resolve_source()
+        if source == _state["source"]:
+            return _state["artifacts"]
+
+        try:
+            if source is None:
+                loaded = None
+            elif source[0] == "version":
+                loaded = load_version(source[1], root=ARTIFACTS_DIR)
+            else:
+                loaded = load_legacy_pickle()
+        except Exception:
+            logger.exception("Failed to load food recommendation artifacts from %s", source)
+            if _state["artifacts"] is not None:
+                return _state["artifacts"]
+            loaded = None
+
+        _state["artifacts"] = loaded
+        _state["source"] = source
+        return loaded
+
+
+def get_artifacts_version(version):
+    """
+    Artifacts for a specific ``version``, or ``None`` if it is no longer available.
+
+    The current version is served from ``get_artifacts()``; other published
+    versions are opened on demand (memory-mapped, so this is cheap) and the
+    most recently used ones are kept open. Legacy pickles are only available
+    while they are the current source, which is why plans made from them are
+    saved in full (see ``is_legacy_version``).
+    """
+    current = get_artifacts()
+    if current is not None and current.version == version:
+        return current
+    if not version or not os.path.isdir(os.path.join(ARTIFACTS_DIR, version)):
+        return None
+
+    with _lock:
+        if version in _previous_versions:
+            _previous_versions.move_to_end(version)
+            return _previous_versions[version]
+    try:
+        loaded = load_version(version, root=ARTIFACTS_DIR)
+    except Exception:
+        logger.exception("Failed to load food recommendation artifacts %s", version)
+        return None
+    with _lock:
+        _previous_versions[version] = loaded
+        while len(_previous_versions) > PREVIOUS_VERSIONS_CACHED:
+            _previous_versions.popitem(last=False)
+    return loaded
+
+
+def reset_artifacts():
+    """Forget the loaded artifacts so the next ``get_artifacts()`` reloads from disk."""
+    with _lock:
+        _state.update(source=None, artifacts=None, checked_at=0.0)
+        _previous_versions.clear()
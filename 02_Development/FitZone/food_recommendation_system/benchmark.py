@@ -0,0 +1,196 @@
+"""
+Benchmark harness for the recommendation engine at catalog scale.
+
+``synthesize_catalog`` builds in-memory artifacts for an arbitrary number
+of recipes with realistic distributions (log-normal calories, Dirichlet
+macro shares, Zipf-skewed cuisines and ingredients, Edamam meal labels),
+and ``run_benchmark`` times ``get_recommendations`` over a matrix of user
+profiles against it. Used by the ``benchmark_recommendations`` command.
+"""
+import itertools
+import multiprocessing
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .artifacts import from_dataframe
+from .catalog_builder import artifact_footprint, train_health_model
+from .pool_cache import scored_pools
+from .recommendation_engine import get_recommendations
+
+CUISINES = [
+    "american", "asian", "british", "caribbean", "central europe", "chinese", "eastern europe",
+    "french", "greek", "indian", "italian", "japanese", "korean", "mediterranean", "mexican",
+    "middle eastern", "nordic", "south american", "south east asian", "nepali",
+]
+MEAL_TYPES = ["breakfast", "lunch/dinner", "lunch", "dinner", "snack", "brunch", "teatime"]
+MEAL_TYPE_WEIGHTS = [0.18, 0.42, 0.10, 0.12, 0.12, 0.03, 0.03]
+VOCABULARY_SIZE = 5000
+
+PROFILE_MATRIX = {
+    "body": [
+        {"age": 24, "height": 178, "current_weight": 82, "target_weight": 74, "gender": "M"},
+        {"age": 31, "height": 162, "current_weight": 54, "target_weight": 58, "gender": "F"},
+        {"age": 52, "height": 170, "current_weight": 96, "target_weight": 80, "gender": "F"},
+    ],
+    "activity_level": ["sedentary", "moderate", "very_active"],
+    "food_pref": ["both", "veg", "non-veg"],
+    "cuisine": ["all", "indian", "nordic"],
+}
+
+
+def profile_matrix():
+    """Every combination of body, activity, food preference and cuisine in ``PROFILE_MATRIX``."""
+    return [
+        {**body, "activity_level": activity, "food_pref": food_pref, "cuisine": cuisine}
+        for body, activity, food_pref, cuisine in itertools.product(*PROFILE_MATRIX.values())
+    ]
+
+
+def _zipf_choice(rng, n_options, size, exponent=1.1):
+    weights = 1.0 / np.arange(1, n_options + 1) ** exponent
+    return rng.choice(n_options, size=size, p=weights / weights.sum())
+
+
+def synthesize_catalog(n_recipes, seed=0):
+    """Artifacts for ``n_recipes`` synthetic recipes, built the same way as a real catalog."""
+    rng = np.random.default_rng(seed)
+
+    calories = np.clip(rng.lognormal(mean=np.log(480), sigma=0.55, size=n_recipes), 40, 2500)
+    shares = rng.dirichlet([4.0, 5.0, 8.0], size=n_recipes)
+    protein = calories * shares[:, 0] / 4
+    fat = calories * shares[:, 1] / 9
+    carbs = calories * shares[:, 2] / 4
+
+    n_cuisines = rng.choice([0, 1, 2], size=n_recipes, p=[0.1, 0.75, 0.15])
+    cuisine_ids = _zipf_choice(rng, len(CUISINES), size=(n_recipes, 2))
+    n_meals = rng.choice([1, 2], size=n_recipes, p=[0.8, 0.2])
+    meal_ids = rng.choice(len(MEAL_TYPES), size=(n_recipes, 2), p=MEAL_TYPE_WEIGHTS)
+
+    # Ingredient vectors are generated directly in sparse form; display lines reuse
+    # one string per vocabulary word to keep million-row catalogs affordable.
+    n_ingredients = rng.integers(4, 13, size=n_recipes)
+    indptr = np.concatenate([[0], np.cumsum(n_ingredients)])
+    indices = _zipf_choice(rng, VOCABULARY_SIZE, size=int(indptr[-1]), exponent=0.9)
+    idf = np.log(VOCABULARY_SIZE / (1.0 + np.arange(VOCABULARY_SIZE))) + 1.0
+    vectors = sparse.csr_matrix((idf[indices], indices, indptr), shape=(n_recipes, VOCABULARY_SIZE))
+    vectors.sum_duplicates()
+    norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+    vectors = sparse.diags(1.0 / norms) @ vectors
+    words = [f"1 cup ingredient {i}" for i in range(VOCABULARY_SIZE)]
+
+    df = pd.DataFrame({
+        "recipe_name": [f"Recipe {i}" for i in range(n_recipes)],
+        "image_url": "https://example.com/recipe.jpg",
+        "url": "https://example.com/recipe",
+        "calories": calories,
+        "protein": protein,
+        "fat": fat,
+        "carbs": carbs,
+        "food_type": np.where(rng.random(n_recipes) < 0.45, "veg", "non-veg"),
+        "cuisine_type": [[CUISINES[c] for c in row[:k]] for row, k in zip(cuisine_ids.tolist(), n_cuisines)],
+        "meal_type": [[MEAL_TYPES[m] for m in row[:k]] for row, k in zip(meal_ids.tolist(), n_meals)],
+        "ingredient_lines": [
+            [words[i] for i in indices[start:end]] for start, end in zip(indptr[:-1], indptr[1:])
+        ],
+    })
+
+    sample = df.sample(n=min(n_recipes, 20000), random_state=seed)
+    dt_model = train_health_model(sample)
+    return from_dataframe(f"synthetic-{n_recipes}", df, dt_model, ingredient_vectors=vectors)
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _time_calls(artifacts, profiles, repeats):
+    timings = []
+    peaks = []
+    for _ in range(repeats):
+        for profile in profiles:
+            started = time.perf_counter()
+            get_recommendations(**profile, artifacts=artifacts)
+            timings.append((time.perf_counter() - started) * 1000)
+
+    # Peak Python heap traced during one call (NumPy buffers included), not a count of allocations
+    for profile in profiles:
+        tracemalloc.start()
+        get_recommendations(**profile, artifacts=artifacts)
+        peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+
+    return {
+        "calls": len(timings),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "max_ms": float(np.max(timings)),
+        "peak_traced_kb_per_call": float(np.mean(peaks)),
+    }
+
+
+def daily_calorie_deviation(results):
+    """Mean relative gap between each day's option totals and the target, over successful ``results``."""
+    gaps = []
+    for result in results:
+        if "error" in result:
+            continue
+        target = result["meta"]["target_calories"]
+        for meals in result["weekly_plan"].values():
+            for option in zip(meals["breakfast"], meals["lunch"], meals["dinner"]):
+                gaps.append(abs(sum(meal["calories"] for meal in option) - target) / target)
+    return float(np.mean(gaps)) if gaps else None
+
+
+def benchmark_size(n_recipes, repeats=3, seed=0):
+    """Benchmark one catalog size; uncached numbers bypass the scored-pool cache."""
+    started = time.perf_counter()
+    artifacts = synthesize_catalog(n_recipes, seed=seed)
+    build_seconds = time.perf_counter() - started
+    profiles = profile_matrix()
+
+    get_recommendations(**profiles[0], artifacts=artifacts)  # warm-up
+
+    cache_size = scored_pools.maxsize
+    scored_pools.maxsize = 0
+    try:
+        uncached = _time_calls(artifacts, profiles, repeats)
+    finally:
+        scored_pools.maxsize = cache_size
+    scored_pools.clear()
+    results = [get_recommendations(**profile, artifacts=artifacts) for profile in profiles]
+    cached = _time_calls(artifacts, profiles, repeats)
+
+    return {
+        "catalog_size": n_recipes,
+        "profiles": len(profiles),
+        "build_seconds": build_seconds,
+        "footprint_mb": artifact_footprint(artifacts) / (1024 * 1024),
+        "uncached": uncached,
+        "cached": cached,
+        "daily_calorie_deviation": daily_calorie_deviation(results),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_benchmark(sizes, repeats=3, seed=0):
+    """
+    Benchmark every catalog size, each in a fresh forked process where
+    available so ``peak_rss_mb`` reflects that size alone.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return [benchmark_size(size, repeats, seed) for size in sizes]
+
+    context = multiprocessing.get_context("fork")
+    results = []
+    for size in sizes:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(benchmark_size, (size, repeats, seed)))
+    return results
@@ -0,0 +1,234 @@
+"""
+Offline pipeline that turns a raw recipe export into recommendation artifacts.
+
+Used by the ``build_food_models`` management command: read a CSV/JSONL
+export, clean it into the columns the engine expects, train the health
+classifier, build ingredient vectors and filter indexes, and measure the
+result against latency and memory budgets before it is published.
+"""
+import ast
+import re
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from .artifacts import FEATURES, build_ingredient_vectors, from_dataframe
+from .recommendation_engine import (
+    DEFAULT_MACRO_SPLIT,
+    MACRO_SPLITS,
+    build_weekly_plan,
+    energy_targets,
+    score_candidates,
+)
+
+# Edamam-style export keys mapped onto the engine's column names
+COLUMN_ALIASES = {
+    "label": "recipe_name",
+    "name": "recipe_name",
+    "image": "image_url",
+    "cuisineType": "cuisine_type",
+    "mealType": "meal_type",
+    "ingredientLines": "ingredient_lines",
+    "healthy": "is_healthy",
+}
+REQUIRED_COLUMNS = ["recipe_name", "ingredient_lines"] + FEATURES
+LIST_COLUMNS = ["cuisine_type", "meal_type", "ingredient_lines"]
+CATALOG_COLUMNS = ["recipe_name", "image_url", "url", "food_type"] + LIST_COLUMNS + FEATURES
+
+FOOD_TYPE_ALIASES = {
+    "vegetarian": "veg",
+    "vegan": "veg",
+    "non-vegetarian": "non-veg",
+    "non veg": "non-veg",
+    "nonveg": "non-veg",
+}
+MEAT_PATTERN = re.compile(
+    r"\b(chicken|beef|pork|lamb|mutton|goat|turkey|duck|bacon|ham|sausage|fish|salmon|tuna|"
+    r"shrimp|prawn|crab|lobster|anchov(y|ies)|egg|eggs|gelatin)\b"
+)
+
+# Profiles spanning loss/gain, veg/non-veg and cuisine filters for the budget check
+VALIDATION_PROFILES = [
+    {"age": 25, "height": 175, "current_weight": 80, "target_weight": 70, "gender": "M",
+     "activity_level": "moderate", "food_pref": "both", "cuisine": "all"},
+    {"age": 30, "height": 160, "current_weight": 55, "target_weight": 60, "gender": "F",
+     "activity_level": "light", "food_pref": "veg", "cuisine": "indian"},
+    {"age": 45, "height": 180, "current_weight": 100, "target_weight": 85, "gender": "M",
+     "activity_level": "active", "food_pref": "non-veg", "cuisine": "italian"},
+    {"age": 60, "height": 170, "current_weight": 70, "target_weight": 72, "gender": "F",
+     "activity_level": "sedentary", "food_pref": "both", "cuisine": "american"},
+]
+
+
+def read_recipes(path):
+    """Read a raw recipe export; ``.jsonl``/``.ndjson`` and ``.json`` by extension, CSV otherwise."""
+    if path.endswith((".jsonl", ".ndjson")):
+        return pd.read_json(path, lines=True)
+    if path.endswith(".json"):
+        return pd.read_json(path)
+    return pd.read_csv(path)
+
+
+def as_list(value):
+    """Normalize a list cell: real lists, ``"['a', 'b']"`` strings or ``a|b`` strings."""
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return []
+    text = str(value).strip()
+    if text.startswith("["):
+        try:
+            parsed = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            parsed = None
+        if isinstance(parsed, (list, tuple)):
+            return as_list(parsed)
+    return [part.strip() for part in text.split("|") if part.strip()]
+
+
+def infer_food_type(ingredient_lines):
+    text = " ".join(ingredient_lines).lower()
+    return "non-veg" if MEAT_PATTERN.search(text) else "veg"
+
+
+def clean_recipes(raw):
+    """
+    Return the cleaned catalog and the number of dropped rows.
+
+    Rows without a name, ingredients or valid non-negative macros (and
+    positive calories) are dropped, list columns are parsed, ``food_type`` is
+    normalized to ``veg``/``non-veg`` (inferred from the ingredients when
+    absent) and duplicates by name and URL are removed.
+    """
+    df = raw.rename(columns=COLUMN_ALIASES).copy()
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Recipe file is missing required columns: {', '.join(missing)}")
+
+    for column in FEATURES:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    for column in LIST_COLUMNS:
+        df[column] = df[column].apply(as_list) if column in df.columns else [[] for _ in range(len(df))]
+    for column in ("image_url", "url"):
+        df[column] = df[column].fillna("").astype(str) if column in df.columns else ""
+
+    df["recipe_name"] = df["recipe_name"].fillna("").astype(str).str.strip()
+    valid = (
+        (df["recipe_name"] != "")
+        & df["ingredient_lines"].apply(bool)
+        & df[FEATURES].notna().all(axis=1)
+        & (df[FEATURES] >= 0).all(axis=1)
+        & (df["calories"] > 0)
+    )
+    df = df[valid]
+
+    inferred = df["ingredient_lines"].apply(infer_food_type)
+    if "food_type" in df.columns:
+        food_type = df["food_type"].fillna("").astype(str).str.strip().str.lower().replace(FOOD_TYPE_ALIASES)
+        df["food_type"] = food_type.where(food_type.isin(["veg", "non-veg"]), inferred)
+    else:
+        df["food_type"] = inferred
+
+    df = df.drop_duplicates(subset=["recipe_name", "url"])
+    columns = CATALOG_COLUMNS + (["is_healthy"] if "is_healthy" in df.columns else [])
+    cleaned = df[columns].reset_index(drop=True)
+    return cleaned, len(raw) - len(cleaned)
+
+
+def health_labels(df):
+    """
+    Training labels for the health classifier.
+
+    An ``is_healthy`` column in the export wins; otherwise a recipe counts as
+    healthy when at least 20% of its calories come from protein, at most 35%
+    from fat, and it stays under 800 kcal.
+    """
+    if "is_healthy" in df.columns:
+        return df["is_healthy"].fillna(0).astype(int)
+    protein_share = df["protein"] * 4 / df["calories"]
+    fat_share = df["fat"] * 9 / df["calories"]
+    return ((protein_share >= 0.20) & (fat_share <= 0.35) & (df["calories"] <= 800)).astype(int)
+
+
+def train_health_model(df):
+    model = DecisionTreeClassifier(max_depth=6, min_samples_leaf=20, random_state=42)
+    return model.fit(df[FEATURES], health_labels(df))
+
+
+def build_artifacts(df, version):
+    """Train the models and build every index for a cleaned catalog."""
+    dt_model = train_health_model(df)
+    catalog = df.drop(columns=["is_healthy"], errors="ignore")
+    return from_dataframe(
+        version,
+        catalog,
+        dt_model,
+        scaler=StandardScaler().fit(catalog[FEATURES]),
+        ingredient_vectors=build_ingredient_vectors(catalog),
+    )
+
+
+def artifact_footprint(artifacts):
+    """Approximate bytes held by the artifacts' arrays and display columns."""
+    arrays = list(artifacts.numeric.values()) + [artifacts.health_score]
+    for key in ("food_type", "cuisine", "meal_type"):
+        arrays.extend(artifacts.filter_indexes[key].values())
+    total = sum(array.nbytes for array in arrays)
+    if artifacts.ingredient_vectors is not None:
+        vectors = artifacts.ingredient_vectors
+        total += vectors.data.nbytes + vectors.indices.nbytes + vectors.indptr.nbytes
+    if artifacts.cosine_sim is not None:
+        total += artifacts.cosine_sim.nbytes
+    total += int(artifacts.recipes.memory_usage(deep=True).sum())
+    return total
+
+
+def validate_artifacts(artifacts, profiles=VALIDATION_PROFILES, repeats=5):
+    """
+    Time uncached plan generation for ``profiles`` and measure memory.
+
+    Returns p50/p95 latency in milliseconds, the artifact footprint and the
+    peak Python allocation of a single plan, both in megabytes.
+    """
+    weights = (0.45, 0.35, 0.20)
+
+    def generate(profile):
+        targets = energy_targets(
+            profile["age"], profile["height"], profile["current_weight"], profile["target_weight"],
+            profile["gender"], profile["activity_level"],
+        )
+        macro_split = MACRO_SPLITS.get(str(targets["direction"][0]), DEFAULT_MACRO_SPLIT)
+        pool = score_candidates(
+            artifacts, profile["food_pref"], profile["cuisine"],
+            (targets["calorie_min"][0], targets["calorie_max"][0]),
+            macro_split, *weights
+        )
+        if len(pool.positions):
+            build_weekly_plan(artifacts, pool, float(targets["target_cal"][0]), macro_split)
+
+    generate(profiles[0])  # warm up lazily mapped pages
+
+    timings = []
+    for _ in range(repeats):
+        for profile in profiles:
+            started = time.perf_counter()
+            generate(profile)
+            timings.append((time.perf_counter() - started) * 1000)
+
+    peak = 0
+    for profile in profiles:
+        tracemalloc.start()
+        generate(profile)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "footprint_mb": artifact_footprint(artifacts) / (1024 * 1024),
+        "peak_request_mb": peak / (1024 * 1024),
+    }
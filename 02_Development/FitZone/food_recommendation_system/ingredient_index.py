@@ -0,0 +1,221 @@
+"""
+Inverted index from ingredient tokens to the recipes that use them.
+
+Every recipe's ``ingredient_lines`` are tokenized once per artifact version
+(lowercase words, plurals folded) into a vocabulary and, per token, the
+sorted catalog positions of the recipes containing it, stored as a CSR
+matrix of tokens x recipes. Excluding allergens or ingredients from a
+request then only scatters the posting lists of the excluded tokens into
+one boolean mask instead of scanning ingredient strings. Words match
+whole tokens only ("tea" never matches "teaspoon"); compound words such
+as "buttermilk" are listed explicitly under their allergen.
+"""
+import re
+
+import numpy as np
+from scipy import sparse
+
+WORD = re.compile(r"[a-z]+")
+
+# Bump whenever ``tokenize`` changes; indexes stored by another version are rebuilt on load
+TOKENIZER_VERSION = 2
+
+DAIRY = (
+    "milk", "cheese", "butter", "cream", "yogurt", "yoghurt", "whey", "ghee", "paneer", "curd", "casein",
+    "lactose", "kefir", "custard", "quark", "mozzarella", "parmesan", "parmigiano", "pecorino", "ricotta",
+    "cheddar", "feta", "brie", "camembert", "mascarpone", "gouda", "gruyere", "emmental", "halloumi",
+    "burrata", "provolone", "manchego", "queso", "raita", "lassi", "buttermilk", "buttercream",
+    "cheesecake", "cheeseburger", "creamer", "milkshake", "icecream",
+)
+GLUTEN = (
+    "wheat", "flour", "bread", "breadcrumb", "panko", "crouton", "pasta", "spaghetti", "macaroni", "noodle",
+    "lasagna", "lasagne", "ravioli", "orzo", "gnocchi", "tortilla", "pita", "baguette", "barley", "malt",
+    "rye", "spelt", "farro", "couscous", "semolina", "seitan", "bulgur", "cracker", "biscuit",
+    "cornbread", "flatbread", "shortbread", "sourdough", "breadstick", "wholewheat",
+)
+TREE_NUTS = (
+    "almond", "walnut", "cashew", "pecan", "pistachio", "hazelnut", "macadamia", "nut", "praline",
+    "marzipan", "nougat", "pesto", "nutella",
+)
+FISH = (
+    "fish", "salmon", "tuna", "cod", "anchovy", "sardine", "tilapia", "trout", "halibut", "mackerel",
+    "haddock", "herring", "pollock", "snapper", "bass", "worcestershire", "swordfish", "catfish",
+    "monkfish",
+)
+SHELLFISH = (
+    "shrimp", "prawn", "crab", "lobster", "clam", "mussel", "oyster", "scallop", "crayfish", "langoustine",
+    "shellfish",
+)
+
+# Allergens expand to the ingredient words that commonly carry them
+ALLERGEN_INGREDIENTS = {
+    "dairy": DAIRY,
+    "milk": DAIRY,
+    "lactose": DAIRY,
+    "gluten": GLUTEN,
+    "wheat": GLUTEN,
+    "egg": ("egg", "eggnog", "mayonnaise", "mayo", "meringue", "aioli", "custard"),
+    "nut": TREE_NUTS + ("peanut", "peanutbutter"),
+    "tree nut": TREE_NUTS,
+    "peanut": ("peanut", "peanutbutter"),
+    "soy": ("soy", "soya", "tofu", "tempeh", "edamame", "miso"),
+    "fish": FISH,
+    "shellfish": SHELLFISH,
+    "seafood": FISH + SHELLFISH,
+    "sesame": ("sesame", "tahini"),
+}
+
+# Words around an allergy that are not ingredients: "lactose intolerant", "egg allergy", "gluten-free"
+QUALIFIER_WORDS = (
+    "allergy", "allergies", "allergic", "intolerant", "intolerance", "sensitive", "sensitivity",
+    "free", "no", "to", "avoid", "severe", "mild", "i", "am", "have", "an", "a",
+)
+
+
+def normalize_word(word):
+    """
+    Fold common English plurals and the endings "y"/"ie"/"i", so "eggs" and
+    "egg", "tomatoes" and "tomato", "chillies" and "chilli", "berries" and
+    "berry" each share a token.
+    """
+    if len(word) > 4 and word.endswith("ies"):
+        word = word[:-3] + "i"
+    elif len(word) > 4 and word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        word = word[:-2]
+    elif len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    if len(word) > 4 and word.endswith("ie"):
+        return word[:-1]
+    if len(word) > 3 and word.endswith("y") and word[-2] not in "aeiou":
+        return word[:-1] + "i"
+    return word
+
+
+def tokenize(text):
+    """Normalized words of ``text`` in order of appearance, without repeats."""
+    return list(dict.fromkeys(normalize_word(word) for word in WORD.findall(text.lower())))
+
+
+# Measurements in ingredient lines; never part of what a member excludes
+UNIT_WORDS = (
+    "cup", "tablespoon", "tbsp", "teaspoon", "tsp", "g", "gram", "kg", "kilogram", "mg", "ml", "l", "liter",
+    "litre", "oz", "ounce", "lb", "pound", "pinch", "dash", "handful", "slice", "piece", "package", "pkg",
+)
+
+IGNORED_TOKENS = frozenset(normalize_word(word) for word in QUALIFIER_WORDS + UNIT_WORDS)
+ALLERGEN_TERMS = {" ".join(tokenize(allergen)): ingredients for allergen, ingredients in ALLERGEN_INGREDIENTS.items()}
+
+
+def split_terms(text):
+    """Split free text such as ``"Peanuts, shellfish and dairy"`` into lowercase terms."""
+    if not text:
+        return []
+    parts = re.split(r"[,;/\n]|\band\b", text.lower())
+    return [part.strip() for part in parts if part.strip()]
+
+
+def term_tokens(text):
+    """Tokens of one allergy or ingredient entry without ``QUALIFIER_WORDS`` or ``UNIT_WORDS``."""
+    return [token for token in tokenize(text) if token not in IGNORED_TOKENS]
+
+
+def exclusion_terms(allergens=(), excluded_ingredients=()):
+    """
+    Canonical terms to exclude for a request: a sorted tuple of token
+    tuples, where a recipe matches a term if one of its ingredient lines
+    contains all of the term's tokens. Known allergens expand
+    through ``ALLERGEN_INGREDIENTS``; anything else is matched as an
+    ingredient name.
+    """
+    terms = set()
+    for allergen in allergens or ():
+        name = " ".join(term_tokens(allergen))
+        for ingredient in ALLERGEN_TERMS.get(name, (name,)):
+            terms.add(tuple(sorted(tokenize(ingredient))))
+    for ingredient in excluded_ingredients or ():
+        terms.add(tuple(sorted(term_tokens(ingredient))))
+    terms.discard(())
+    return tuple(sorted(terms))
+
+
+def unmatched_terms(index, allergens=(), excluded_ingredients=()):
+    """
+    Entries of ``allergens`` and ``excluded_ingredients`` that match no
+    ingredient in ``index``, so nothing was left out for them. Either no
+    recipe uses them or they are not ingredient names at all, which the
+    member should be told rather than shown a plan that looks safe.
+    """
+    entries = [(entry, exclusion_terms(allergens=[entry])) for entry in allergens or ()]
+    entries += [(entry, exclusion_terms(excluded_ingredients=[entry])) for entry in excluded_ingredients or ()]
+    return [entry for entry, terms in entries if not terms or not index.exclusion_mask(terms).any()]
+
+
+class IngredientIndex:
+    """Token vocabulary and posting lists (``tokens x recipes`` CSR) of one artifact version."""
+
+    def __init__(self, vocabulary, indptr, indices, n_recipes, ingredient_lines=None):
+        self.vocabulary = {token: i for i, token in enumerate(vocabulary)}
+        self.indptr = indptr
+        self.indices = indices
+        self.n_recipes = n_recipes
+        # Per-recipe lines, to check that a multi-word term sits on one line
+        self.ingredient_lines = ingredient_lines
+
+    @classmethod
+    def build(cls, ingredient_lines):
+        """Tokenize every recipe's ``ingredient_lines``; repeated lines are only tokenized once."""
+        ingredient_lines = list(ingredient_lines)
+        token_ids = {}
+        line_tokens = {}
+        rows = []
+        columns = []
+        for position, lines in enumerate(ingredient_lines):
+            recipe_tokens = set()
+            for line in lines if lines is not None else ():
+                tokens = line_tokens.get(line)
+                if tokens is None:
+                    tokens = line_tokens[line] = [token_ids.setdefault(t, len(token_ids)) for t in tokenize(line)]
+                recipe_tokens.update(tokens)
+            rows.extend(recipe_tokens)
+            columns.extend([position] * len(recipe_tokens))
+
+        postings = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int8), (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp))),
+            shape=(len(token_ids), len(ingredient_lines)),
+        )
+        postings.sort_indices()
+        vocabulary = sorted(token_ids, key=token_ids.get)
+        return cls(vocabulary, postings.indptr, postings.indices, len(ingredient_lines), ingredient_lines)
+
+    def postings(self, token):
+        """Sorted catalog positions of the recipes containing ``token``."""
+        token_id = self.vocabulary.get(token)
+        if token_id is None:
+            return self.indices[:0]
+        return self.indices[self.indptr[token_id]:self.indptr[token_id + 1]]
+
+    def term_positions(self, term):
+        """
+        Catalog positions of the recipes with an ingredient line containing
+        every token of ``term``. The posting lists narrow the candidates; for
+        multi-word terms only those candidates' lines are tokenized again.
+        """
+        positions = self.postings(term[0])
+        for token in term[1:]:
+            positions = np.intersect1d(positions, self.postings(token), assume_unique=True)
+        if len(term) == 1 or self.ingredient_lines is None or not len(positions):
+            return positions
+        wanted = set(term)
+        return np.asarray([
+            position for position in positions
+            if any(wanted.issubset(tokenize(line)) for line in self.ingredient_lines[position] or ())
+        ], dtype=positions.dtype)
+
+    def exclusion_mask(self, terms):
+        """Recipes matching any of ``terms`` (see ``exclusion_terms``), or ``None`` if there are none."""
+        if not terms:
+            return None
+        excluded = np.zeros(self.n_recipes, dtype=bool)
+        for term in terms:
+            excluded[self.term_positions(term)] = True
+        return excluded
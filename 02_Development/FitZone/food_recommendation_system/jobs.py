@@ -0,0 +1,128 @@
+"""
+Background generation of meal plans.
+
+The input form only records a ``MealPlanJob`` and returns; the plan is
+computed by a small thread pool in the web process (``PLAN_JOB_THREADS``)
+once the job row is committed, and/or by the ``process_meal_plan_jobs``
+command. A job is claimed with a conditional UPDATE, so it runs once
+however many runners see it.
+
+Jobs orphaned by a restarted process stay ``running`` until
+``process_meal_plan_jobs`` re-queues them, so that command has to be
+scheduled (or run with ``--loop``) for them to be recovered. A job that is
+re-queued while its first runner is still working is finished by whichever
+runner holds the current claim: the claim time is the token, and a runner
+that lost it saves nothing.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import MealPlanJob
+from .recommendation_engine import get_recommendations
+from .utils import profile_inputs, save_recommendations
+
+logger = logging.getLogger(__name__)
+
+# Worker threads per web process; 0 leaves every job to process_meal_plan_jobs
+PLAN_JOB_THREADS = getattr(settings, 'FOOD_PLAN_JOB_THREADS', 2)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PLAN_JOB_THREADS, thread_name_prefix='meal-plan-job')
+        return _executor
+
+
+def submit_plan_job(user, profile):
+    """
+    Queue plan generation for ``user`` with the engine inputs in ``profile``.
+
+    A pending or running job with the same inputs is returned instead of a
+    new one, so resubmitting the form while waiting does not add work.
+    """
+    inputs = profile_inputs(profile)
+    existing = MealPlanJob.objects.filter(
+        user=user, status__in=['pending', 'running'], inputs=inputs
+    ).order_by('-created_at').first()
+    if existing is not None:
+        return existing
+
+    job = MealPlanJob.objects.create(user=user, inputs=inputs)
+    if PLAN_JOB_THREADS > 0:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.id))
+    return job
+
+
+def _run_in_thread(job_id):
+    try:
+        run_plan_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def run_plan_job(job_id):
+    """
+    Generate and save the plan for a pending job. Returns False if it was
+    already claimed, or if the claim was lost (re-queued as stale) before
+    the plan was saved.
+    """
+    claimed_at = timezone.now()
+    claimed = MealPlanJob.objects.filter(id=job_id, status='pending').update(
+        status='running', started_at=claimed_at
+    )
+    if not claimed:
+        return False
+
+    job = MealPlanJob.objects.select_related('user').get(id=job_id)
+    result, error = None, ''
+    try:
+        result = get_recommendations(**job.inputs)
+        if "error" in result:
+            error, result = result['error'], None
+    except Exception as exc:
+        logger.exception("Meal plan job %s failed", job_id)
+        error = str(exc)
+
+    with transaction.atomic():
+        # Only the runner still holding the claim may finish the job; the
+        # UPDATE also locks the row until the plan is saved
+        owned = MealPlanJob.objects.filter(id=job_id, status='running', started_at=claimed_at).update(
+            status='failed' if result is None else 'done', error=error, finished_at=timezone.now()
+        )
+        if not owned:
+            logger.warning("Meal plan job %s was re-queued while running; discarding this run", job_id)
+            return False
+        if result is not None:
+            recommendation = save_recommendations([(job.user, job.inputs, result)])[0]
+            MealPlanJob.objects.filter(id=job_id).update(recommendation=recommendation)
+    return True
+
+
+def requeue_stale_jobs(stale_after):
+    """
+    Put jobs that have been running longer than ``stale_after`` seconds back
+    in the queue. Clearing ``started_at`` revokes the old runner's claim.
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return MealPlanJob.objects.filter(status='running', started_at__lt=cutoff).update(
+        status='pending', started_at=None
+    )
+
+
+def process_pending_jobs(limit=None):
+    """Run pending jobs oldest first in this process; returns how many this call ran."""
+    job_ids = MealPlanJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True)
+    if limit:
+        job_ids = job_ids[:limit]
+    return sum(1 for job_id in list(job_ids) if run_plan_job(job_id))
@@ -0,0 +1,157 @@
+"""
+KD-tree index over the standardized macros of one artifact version.
+
+The exact scoring path measures the macro distance of every candidate and
+then ranks the whole pool, which grows linearly with the catalog. With
+``FOOD_MACRO_INDEX`` enabled, large catalogs instead ask this index for the
+``k`` recipes nearest to the target macros within one meal type, the
+calorie window and the request's filters, so the cost grows with ``k``.
+Plans from the index are approximate: the same member gets different
+recipes than from the full scan.
+
+Recipes are grouped by meal type, or by cuisine when the request filters
+on one (cuisines are far more selective), sorted by calories and cut into
+bands of ``BAND_SIZE`` recipes with one KD-tree and bounding box per band.
+A query only visits the bands overlapping the calorie window, nearest box
+first, and stops once no remaining box can hold a closer recipe. Bands are
+built on first use per group and live as long as the artifacts.
+"""
+import threading
+
+import numpy as np
+from django.conf import settings
+from scipy.spatial import KDTree
+
+# Scoring from the index ranks differently from the full scan (see
+# ``score_nearest_candidates``), so it is opt-in; when enabled, catalogs with
+# at least MIN_RECIPES recipes use it
+ENABLED = getattr(settings, 'FOOD_MACRO_INDEX', False)
+MIN_RECIPES = getattr(settings, 'FOOD_MACRO_INDEX_MIN_RECIPES', 50000)
+
+BAND_SIZE = 4096
+
+
+class MacroBands:
+    """Calorie-sorted bands of one group of recipes, each with its own KD-tree."""
+
+    def __init__(self, points, positions):
+        # Column 0 of the standardized points is calories, so sorting it sorts by calories
+        positions = positions[np.argsort(points[positions, 0], kind="stable")]
+        self.positions = positions
+        self.starts = np.arange(0, positions.size, BAND_SIZE)
+        self.trees = []
+        lows, highs = [], []
+        for start in self.starts:
+            band_points = points[positions[start:start + BAND_SIZE]]
+            self.trees.append(KDTree(band_points))
+            lows.append(band_points.min(axis=0))
+            highs.append(band_points.max(axis=0))
+        self.lows = np.array(lows).reshape(-1, points.shape[1])
+        self.highs = np.array(highs).reshape(-1, points.shape[1])
+
+    def members(self, band):
+        start = self.starts[band]
+        return self.positions[start:start + BAND_SIZE]
+
+    def nearest_in_band(self, band, points, point, k, accept, upper_bound=np.inf):
+        """Up to ``k`` accepted recipes of ``band`` nearest to ``point`` and within ``upper_bound``."""
+        members = self.members(band)
+        fetch = 4 * k
+        while fetch < members.size:
+            distances, local = self.trees[band].query(point, k=fetch, distance_upper_bound=upper_bound)
+            found = local < members.size
+            candidates = members[local[found]]
+            ok = accept(candidates)
+            if np.count_nonzero(ok) >= k or not found.all():
+                return candidates[ok][:k], distances[found][ok][:k]
+            fetch *= 4
+
+        # Selective filters: scanning one band is cheaper than querying all of it
+        candidates = members[accept(members)]
+        return candidates, np.linalg.norm(points[candidates] - point, axis=1)
+
+
+class MacroIndex:
+    """
+    Nearest-neighbour lookup over ``(calories, protein, fat, carbs)``.
+
+    Features are standardized with the catalog-wide mean and population
+    standard deviation, so one set of bands per group serves every request.
+    ``filter_indexes`` are the artifact's label masks.
+    """
+
+    def __init__(self, X, filter_indexes):
+        X = np.asarray(X, dtype=np.float64)
+        self.mean = X.mean(axis=0)
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        self.scale = scale
+        self.points = (X - self.mean) / scale
+        self.filter_indexes = filter_indexes
+        self._bands = {}
+        self._lock = threading.Lock()
+
+    def standardize(self, values):
+        return (np.asarray(values, dtype=np.float64) - self.mean) / self.scale
+
+    def bands(self, key, label):
+        """``MacroBands`` for the recipes labelled ``label`` under ``key`` (all recipes for ``None``)."""
+        bands = self._bands.get((key, label))
+        if bands is not None:
+            return bands
+        with self._lock:
+            if (key, label) not in self._bands:
+                if label is None:
+                    positions = np.arange(len(self.points))
+                else:
+                    mask = self.filter_indexes[key].get(label)
+                    positions = np.flatnonzero(mask) if mask is not None else np.empty(0, dtype=np.intp)
+                self._bands[(key, label)] = MacroBands(self.points, positions)
+            return self._bands[(key, label)]
+
+    def nearest(self, target, k, calorie_range, accept, meal_type=None, cuisine=None):
+        """
+        Catalog positions and standardized distances of the ``k`` recipes
+        nearest to ``target``, nearest first (ties in catalog order), among
+        those of ``meal_type`` and ``cuisine`` (either may be ``None``).
+
+        Only bands overlapping ``calorie_range`` are searched; ``accept``
+        receives candidate positions and returns which of them pass the
+        remaining filters, including the calorie window itself.
+        """
+        if cuisine is not None:
+            bands = self.bands("cuisine", cuisine)
+            if meal_type is not None:
+                meal_mask = self.filter_indexes["meal_type"].get(meal_type)
+                if meal_mask is None:
+                    return np.empty(0, dtype=np.intp), np.empty(0)
+                cuisine_accept = accept
+
+                def accept(positions):
+                    return cuisine_accept(positions) & meal_mask[positions]
+        else:
+            bands = self.bands("meal_type", meal_type)
+
+        if k <= 0 or bands.positions.size == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        point = self.standardize(target)
+        calorie_lo, calorie_hi = (np.asarray(calorie_range, dtype=np.float64) - self.mean[0]) / self.scale[0]
+
+        overlapping = np.flatnonzero((bands.highs[:, 0] >= calorie_lo) & (bands.lows[:, 0] <= calorie_hi))
+        gap = np.maximum(bands.lows[overlapping] - point, 0) + np.maximum(point - bands.highs[overlapping], 0)
+        bounds = np.sqrt(np.sum(gap ** 2, axis=1))
+
+        candidates = np.empty(0, dtype=np.intp)
+        distances = np.empty(0)
+        for order in np.argsort(bounds, kind="stable"):
+            upper_bound = distances[-1] if candidates.size >= k else np.inf
+            if bounds[order] > upper_bound:
+                break
+            found, found_distances = bands.nearest_in_band(
+                overlapping[order], self.points, point, k, accept, upper_bound
+            )
+            candidates = np.concatenate([candidates, found])
+            distances = np.concatenate([distances, found_distances])
+            best = np.lexsort((candidates, distances))[:k]
+            candidates, distances = candidates[best], distances[best]
+        return candidates, distances
@@ -0,0 +1,63 @@
+import json
+import platform
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from food_recommendation_system.benchmark import profile_matrix, run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmark meal plan generation on synthetic 10k/100k/1M recipe catalogs and write a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Comma-separated catalog sizes')
+        parser.add_argument('--repeats', type=int, default=3, help='Passes over the profile matrix per size')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic catalogs')
+        parser.add_argument('--output', default='recommendation_benchmark.json', help='Where to write the report')
+        parser.add_argument('--latency-budget-ms', type=float, default=None,
+                            help='Fail if the uncached p95 latency of any size exceeds this')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError(f"--sizes must be comma-separated integers, got {options['sizes']!r}")
+        if not sizes or min(sizes) <= 0:
+            raise CommandError('--sizes needs at least one positive catalog size')
+
+        self.stdout.write(f'Benchmarking {len(profile_matrix())} profiles x {options["repeats"]} passes '
+                          f'on {", ".join(str(size) for size in sizes)} recipes')
+        results = run_benchmark(sizes, repeats=options['repeats'], seed=options['seed'])
+
+        for result in results:
+            uncached, cached = result['uncached'], result['cached']
+            self.stdout.write(
+                f"{result['catalog_size']:>9} recipes: uncached p50 {uncached['p50_ms']:.1f} ms, "
+                f"p95 {uncached['p95_ms']:.1f} ms; cached p50 {cached['p50_ms']:.2f} ms; "
+                f"peak traced memory {uncached['peak_traced_kb_per_call']:.0f} KB per call; "
+                f"peak RSS {result['peak_rss_mb']:.0f} MB; "
+                f"days off target by {100 * (result['daily_calorie_deviation'] or 0):.1f}% on average"
+            )
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'repeats': options['repeats'],
+            'seed': options['seed'],
+            'results': results,
+        }
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        budget = options['latency_budget_ms']
+        over_budget = [r['catalog_size'] for r in results if budget is not None and r['uncached']['p95_ms'] > budget]
+        if over_budget:
+            raise CommandError(
+                f"Uncached p95 latency over {budget:.1f} ms for {', '.join(str(size) for size in over_budget)} recipes"
+            )
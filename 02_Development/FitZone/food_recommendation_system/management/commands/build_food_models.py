@@ -0,0 +1,83 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from food_recommendation_system.artifacts import (
+    ARTIFACTS_DIR,
+    file_sha256,
+    load_version,
+    publish,
+    verify_checksums,
+    write_artifacts,
+)
+from food_recommendation_system.catalog_builder import (
+    build_artifacts,
+    clean_recipes,
+    read_recipes,
+    validate_artifacts,
+)
+
+
+class Command(BaseCommand):
+    help = 'Build a versioned food recommendation artifact from a recipe CSV/JSONL export and publish it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Recipe export (.csv, .jsonl or .json)')
+        parser.add_argument('--root', default=ARTIFACTS_DIR, help='Artifact root directory')
+        parser.add_argument('--name', dest='artifact_version', default=None,
+                            help='Version name (defaults to a timestamp)')
+        parser.add_argument('--latency-budget-ms', type=float, default=50.0,
+                            help='Maximum p95 plan generation latency')
+        parser.add_argument('--memory-budget-mb', type=float, default=1024.0,
+                            help='Maximum artifact footprint')
+        parser.add_argument('--no-publish', action='store_true', help='Build and validate without making it current')
+        parser.add_argument('--force', action='store_true', help='Publish even if a budget is exceeded')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if not os.path.exists(source):
+            raise CommandError(f'{source} does not exist')
+
+        try:
+            catalog, dropped = clean_recipes(read_recipes(source))
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if catalog.empty:
+            raise CommandError('No usable recipes left after cleaning')
+        self.stdout.write(f'Cleaned {len(catalog)} recipes ({dropped} dropped)')
+
+        version = options['artifact_version'] or timezone.now().strftime('%Y%m%d%H%M%S')
+        artifacts = build_artifacts(catalog, version)
+        path = write_artifacts(artifacts, root=options['root'], extra_metadata={
+            'source': os.path.basename(source),
+            'source_sha256': file_sha256(source),
+        })
+        self.stdout.write(f'Wrote {path}')
+
+        corrupted = verify_checksums(version, root=options['root'])
+        if corrupted:
+            raise CommandError(f"Checksum mismatch for {', '.join(corrupted)}; {version} was not published")
+
+        report = validate_artifacts(load_version(version, root=options['root']))
+        self.stdout.write(
+            f"Latency p50 {report['p50_ms']:.1f} ms, p95 {report['p95_ms']:.1f} ms; "
+            f"footprint {report['footprint_mb']:.1f} MB, peak per plan {report['peak_request_mb']:.1f} MB"
+        )
+
+        over_budget = []
+        if report['p95_ms'] > options['latency_budget_ms']:
+            over_budget.append(f"p95 latency {report['p95_ms']:.1f} ms > {options['latency_budget_ms']:.1f} ms")
+        if report['footprint_mb'] > options['memory_budget_mb']:
+            over_budget.append(f"footprint {report['footprint_mb']:.1f} MB > {options['memory_budget_mb']:.1f} MB")
+
+        if over_budget and not options['force']:
+            raise CommandError(f"Over budget ({'; '.join(over_budget)}); {version} was not published")
+        for problem in over_budget:
+            self.stdout.write(self.style.WARNING(f'Publishing despite {problem}'))
+
+        if options['no_publish']:
+            self.stdout.write(self.style.SUCCESS(f'Built {version} (not published)'))
+            return
+        publish(version, root=options['root'])
+        self.stdout.write(self.style.SUCCESS(f'Published {version} as current'))
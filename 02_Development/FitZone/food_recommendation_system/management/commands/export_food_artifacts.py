@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from food_recommendation_system.artifacts import (
+    ARTIFACTS_DIR,
+    MODEL_PATH,
+    load_legacy_pickle,
+    publish,
+    write_artifacts,
+)
+
+
+class Command(BaseCommand):
+    help = 'Convert food_models.pkl into a versioned, memory-mappable artifact directory and publish it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=MODEL_PATH, help='Path to the legacy food_models.pkl')
+        parser.add_argument('--root', default=ARTIFACTS_DIR, help='Artifact root directory')
+        parser.add_argument('--name', dest='artifact_version', default=None,
+                            help='Version name (defaults to a timestamp)')
+        parser.add_argument('--no-publish', action='store_true', help='Write the version without making it current')
+
+    def handle(self, *args, **options):
+        try:
+            artifacts = load_legacy_pickle(options['source'])
+        except OSError as exc:
+            raise CommandError(f"Could not read {options['source']}: {exc}")
+
+        artifacts.version = options['artifact_version'] or timezone.now().strftime('%Y%m%d%H%M%S')
+        path = write_artifacts(artifacts, root=options['root'], extra_metadata={'source': 'food_models.pkl'})
+        self.stdout.write(self.style.SUCCESS(f'Wrote {artifacts.n_recipes} recipes to {path}'))
+
+        if artifacts.ingredient_vectors is None:
+            self.stdout.write(self.style.WARNING(
+                'Ingredient vectors could not be rebuilt from cosine_sim; stored the dense matrix instead'
+            ))
+
+        if not options['no_publish']:
+            publish(artifacts.version, root=options['root'])
+            self.stdout.write(self.style.SUCCESS(f'Published {artifacts.version} as current'))
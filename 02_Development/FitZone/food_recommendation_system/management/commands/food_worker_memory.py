@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from food_recommendation_system.worker_memory import memory_report, worker_pids
+
+
+class Command(BaseCommand):
+    help = 'Report unique vs shared memory of each Gunicorn/uWSGI worker under a master process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('master_pid', type=int, help='PID of the server master process')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        master_pid = options['master_pid']
+        if memory_report(master_pid) is None:
+            raise CommandError(f'Cannot read /proc/{master_pid}/smaps_rollup (Linux only, and the process must exist)')
+
+        reports = [memory_report(pid) for pid in [master_pid] + worker_pids(master_pid)]
+        reports = [report for report in reports if report is not None]
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+
+        self.stdout.write(f"{'pid':>8} {'rss MB':>9} {'pss MB':>9} {'shared MB':>10} {'unique MB':>10} {'artifacts shared/unique MB':>28}")
+        for report in reports:
+            artifacts = report['artifacts']
+            self.stdout.write(
+                f"{report['pid']:>8} {report['rss_mb']:>9.1f} {report['pss_mb']:>9.1f} "
+                f"{report['shared_mb']:>10.1f} {report['unique_mb']:>10.1f} "
+                f"{artifacts['shared_mb']:>13.1f} / {artifacts['unique_mb']:.1f}"
+            )
+        workers = reports[1:]
+        if workers:
+            unique = sum(report['unique_mb'] for report in workers)
+            self.stdout.write(self.style.SUCCESS(
+                f'{len(workers)} workers: {unique:.1f} MB unique in total, '
+                f'{unique / len(workers):.1f} MB per worker'
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(f'Process {master_pid} has no worker processes'))
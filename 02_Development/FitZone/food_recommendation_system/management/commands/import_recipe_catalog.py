@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from food_recommendation_system.artifacts import ARTIFACTS_DIR, get_artifacts, load_version
+from food_recommendation_system.recipe_store import IMPORT_BATCH_SIZE, import_catalog
+
+
+class Command(BaseCommand):
+    help = 'Import the recipes of an artifact version into the database for SQL prefiltering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', dest='artifact_version', default=None,
+                            help='Published version to import (defaults to the current artifacts)')
+        parser.add_argument('--root', default=ARTIFACTS_DIR, help='Artifact root directory')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Recipes inserted per transaction')
+
+    def handle(self, *args, **options):
+        if options['artifact_version']:
+            try:
+                artifacts = load_version(options['artifact_version'], root=options['root'])
+            except OSError as exc:
+                raise CommandError(f"Could not open artifact version {options['artifact_version']}: {exc}")
+        else:
+            artifacts = get_artifacts()
+            if artifacts is None:
+                raise CommandError('No food recommendation artifacts are available')
+
+        try:
+            catalog = import_catalog(artifacts, batch_size=options['batch_size'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'Imported {catalog.recipe_count} recipes of {catalog.version}'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from food_recommendation_system.jobs import process_pending_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued meal plan generation jobs (and re-queue jobs abandoned by a restarted process)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='Seconds after which a running job is considered abandoned')
+        parser.add_argument('--limit', type=int, default=None, help='Maximum jobs to run per pass')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale_jobs(options['stale_after'])
+            if requeued:
+                self.stdout.write(self.style.WARNING(f'Re-queued {requeued} stale job(s)'))
+            processed = process_pending_jobs(options['limit'])
+            if processed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Processed {processed} meal plan job(s)'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from food_recommendation_system.models import FoodRecommendation
+from food_recommendation_system.recommendation_engine import get_recommendations_batch
+from food_recommendation_system.utils import PROFILE_FIELDS, save_recommendations
+from membership.models import UserMembership
+
+
+class Command(BaseCommand):
+    help = "Regenerate meal plans for active members from their latest recommendation inputs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', default=[],
+                            help='Only regenerate for this username (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users scored per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Score plans without saving them')
+
+    def handle(self, *args, **options):
+        latest_ids = FoodRecommendation.objects.values('user').annotate(latest=Max('id')).values('latest')
+        latest = FoodRecommendation.objects.filter(id__in=latest_ids).select_related('user').order_by('id')
+
+        if options['usernames']:
+            latest = latest.filter(user__username__in=options['usernames'])
+        else:
+            active_member_ids = UserMembership.objects.filter(
+                is_active=True, end_date__gt=timezone.now()
+            ).values('user')
+            latest = latest.filter(user__in=active_member_ids)
+
+        latest = list(latest)
+        if not latest:
+            self.stdout.write(self.style.WARNING('No members with saved recommendation inputs'))
+            return
+
+        batch_size = max(1, options['batch_size'])
+        created = 0
+        failed = 0
+        for start in range(0, len(latest), batch_size):
+            chunk = latest[start:start + batch_size]
+            profiles = [{field: getattr(rec, field) for field in PROFILE_FIELDS} for rec in chunk]
+            results = get_recommendations_batch(profiles)
+
+            entries = []
+            for rec, profile, result in zip(chunk, profiles, results):
+                if 'error' in result:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f"Skipped {rec.user.username}: {result['error']}"))
+                else:
+                    entries.append((rec.user, profile, result))
+
+            if not options['dry_run']:
+                save_recommendations(entries)
+            created += len(entries)
+
+        verb = 'Scored' if options['dry_run'] else 'Regenerated'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {created} meal plan(s), skipped {failed}'))
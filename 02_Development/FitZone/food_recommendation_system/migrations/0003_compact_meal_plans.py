@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-17 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_recommendation_system', '0002_mealplanjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailymealplan',
+            name='meals',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='foodrecommendation',
+            name='catalog_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='dailymealplan',
+            name='breakfast_options',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='dailymealplan',
+            name='dinner_options',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='dailymealplan',
+            name='lunch_options',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
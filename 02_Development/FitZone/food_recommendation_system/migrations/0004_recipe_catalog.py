@@ -0,0 +1,61 @@
+# Generated by Django 6.0.2 on 2026-10-17 21:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_recommendation_system', '0003_compact_meal_plans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cuisine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MealType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeCatalog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=64, unique=True)),
+                ('recipe_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Recipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('image_url', models.URLField(blank=True, max_length=500)),
+                ('url', models.URLField(blank=True, max_length=500)),
+                ('calories', models.FloatField(db_index=True)),
+                ('protein', models.FloatField()),
+                ('fat', models.FloatField()),
+                ('carbs', models.FloatField()),
+                ('food_type', models.CharField(db_index=True, max_length=20)),
+                ('ingredient_lines', models.JSONField(blank=True, default=list)),
+                ('cuisines', models.ManyToManyField(blank=True, related_name='recipes', to='food_recommendation_system.cuisine')),
+                ('meal_types', models.ManyToManyField(blank=True, related_name='recipes', to='food_recommendation_system.mealtype')),
+                ('catalog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to='food_recommendation_system.recipecatalog')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['catalog', 'calories'], name='food_recomm_catalog_03714e_idx'), models.Index(fields=['catalog', 'food_type', 'calories'], name='food_recomm_catalog_2e2218_idx')],
+                'constraints': [models.UniqueConstraint(fields=('catalog', 'position'), name='unique_recipe_position')],
+            },
+        ),
+    ]
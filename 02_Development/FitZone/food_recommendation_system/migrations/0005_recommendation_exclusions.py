@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-17 22:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_recommendation_system', '0004_recipe_catalog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foodrecommendation',
+            name='allergens',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='foodrecommendation',
+            name='excluded_ingredients',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-17 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_recommendation_system', '0005_recommendation_exclusions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_url',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='url',
+            field=models.TextField(blank=True),
+        ),
+    ]
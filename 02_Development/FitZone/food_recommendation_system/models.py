@@ -11,11 +11,16 @@ class FoodRecommendation(models.Model):
     activity_level = models.CharField(max_length=20)
     food_pref = models.CharField(max_length=10)
     cuisine = models.CharField(max_length=50)
+    # Lowercase terms; recipes mentioning them are left out of the plan
+    allergens = models.JSONField(default=list, blank=True)
+    excluded_ingredients = models.JSONField(default=list, blank=True)
     
     bmi = models.FloatField()
     bmi_category = models.CharField(max_length=20)
     target_calories = models.FloatField()
     tdee = models.FloatField()
+    # Artifact version whose catalog positions the meal plans reference
+    catalog_version = models.CharField(max_length=64, blank=True, default='')
     
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -26,10 +31,97 @@ class DailyMealPlan(models.Model):
     recommendations_record = models.ForeignKey(FoodRecommendation, related_name='meal_plans', on_delete=models.CASCADE)
     day_of_week = models.CharField(max_length=10) # Sunday, Monday, etc.
     
-    breakfast_options = models.JSONField()
-    lunch_options = models.JSONField()
-    dinner_options = models.JSONField()
+    # {"breakfast": [[recipe_id, health, macro, ingredient, final], ...], "lunch": ..., "dinner": ...}
+    # Recipe details are looked up in the catalog when the plan is shown
+    meals = models.JSONField(null=True, blank=True)
+
+    # Full meal dicts, only filled for plans saved before ``meals`` existed
+    # or made from the legacy food_models.pkl (which has no lasting version)
+    breakfast_options = models.JSONField(null=True, blank=True)
+    lunch_options = models.JSONField(null=True, blank=True)
+    dinner_options = models.JSONField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.day_of_week} Plan for {self.recommendations_record.user.username}"
 
+
+class MealPlanJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='meal_plan_jobs')
+    inputs = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    recommendation = models.ForeignKey(FoodRecommendation, null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Meal plan job {self.id} for {self.user.username} ({self.status})"
+
+
+class Cuisine(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class MealType(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeCatalog(models.Model):
+    # Artifact version the recipes were imported from
+    version = models.CharField(max_length=64, unique=True)
+    recipe_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Only set once every recipe is in, so requests never prefilter a partial import
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Recipe catalog {self.version} ({self.recipe_count} recipes)"
+
+
+class Recipe(models.Model):
+    catalog = models.ForeignKey(RecipeCatalog, related_name='recipes', on_delete=models.CASCADE)
+    # Row of the recipe in its artifact version; stored meal plans reference this
+    position = models.IntegerField()
+
+    name = models.CharField(max_length=255)
+    # Signed image URLs from recipe APIs can run to well over 500 characters
+    image_url = models.TextField(blank=True)
+    url = models.TextField(blank=True)
+    calories = models.FloatField(db_index=True)
+    protein = models.FloatField()
+    fat = models.FloatField()
+    carbs = models.FloatField()
+    food_type = models.CharField(max_length=20, db_index=True)
+    cuisines = models.ManyToManyField(Cuisine, related_name='recipes', blank=True)
+    meal_types = models.ManyToManyField(MealType, related_name='recipes', blank=True)
+    ingredient_lines = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['catalog', 'position'], name='unique_recipe_position'),
+        ]
+        indexes = [
+            models.Index(fields=['catalog', 'calories']),
+            models.Index(fields=['catalog', 'food_type', 'calories']),
+        ]
+
+    def __str__(self):
+        return self.name
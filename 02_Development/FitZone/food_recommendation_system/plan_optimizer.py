@@ -0,0 +1,115 @@
+"""
+Arranging a week of meals around the daily calorie and macro targets.
+
+The engine picks the ``POOL_SIZE`` best breakfasts, lunches and dinners
+independently; each day shows three (breakfast, lunch, dinner) options.
+Slicing the pools in score order lets a day's totals drift far from the
+target, so ``arrange_week`` instead assigns every recipe to one triple,
+using each recipe once, to minimize the squared relative deviation of the
+triples' calories and macros from the daily targets.
+
+The cost of every candidate triple is computed once by broadcasting the
+three pools against each other (``21 x 21 x 21`` entries). A beam search
+then picks triples one at a time, keeping the ``BEAM_WIDTH`` cheapest
+partial weeks, with used recipes masked out by infinite costs. Greedy
+picks leave the hardest recipes for the last days, so the week is then
+polished by single-meal swaps between days, each round scored for every
+pair of triples at once.
+"""
+import numpy as np
+from django.conf import settings
+
+BEAM_WIDTH = getattr(settings, 'FOOD_PLAN_BEAM_WIDTH', 2)
+
+# Relative weight of the protein/fat/carbs deviation against the calorie deviation
+MACRO_WEIGHT = 0.5
+
+MACROS = ["protein", "fat", "carbs"]
+KCAL_PER_GRAM = {"protein": 4.0, "fat": 9.0, "carbs": 4.0}
+
+
+def daily_macro_targets(daily_calories, macro_split):
+    """Daily ``[calories, protein g, fat g, carbs g]`` for a calorie target and macro split."""
+    return np.array(
+        [daily_calories] + [daily_calories * macro_split[macro] / KCAL_PER_GRAM[macro] for macro in MACROS],
+        dtype=np.float64,
+    )
+
+
+def triple_costs(breakfast, lunch, dinner, targets):
+    """
+    Cost of every (breakfast, lunch, dinner) triple as an ``(nb, nl, nd)`` array.
+
+    Each argument is an ``(n, 4)`` array of calories, protein, fat and carbs;
+    ``targets`` comes from ``daily_macro_targets``.
+    """
+    totals = breakfast[:, None, None, :] + lunch[None, :, None, :] + dinner[None, None, :, :]
+    deviation = ((totals - targets) / targets) ** 2
+    return deviation[..., 0] + MACRO_WEIGHT * deviation[..., 1:].mean(axis=-1)
+
+
+def arrange_week(breakfast, lunch, dinner, targets, n_triples, beam_width=BEAM_WIDTH, max_swaps=200):
+    """
+    ``n_triples`` index triples into the three pools with every index used
+    at most once.
+
+    A beam search builds the triples cheapest first; the result is then
+    improved by swapping single meals between triples while that lowers
+    the total cost (at most ``max_swaps`` swaps).
+    """
+    costs = triple_costs(breakfast, lunch, dinner, targets)
+    shape = costs.shape
+
+    # Each beam entry: total cost, triple costs with used recipes masked out, picks so far
+    beam = [(0.0, costs.copy(), [])]
+    for _ in range(n_triples):
+        children = []
+        for total, masked, picks in beam:
+            flat = masked.ravel()
+            width = min(beam_width, flat.size)
+            for index in np.argpartition(flat, width - 1)[:width]:
+                if np.isfinite(flat[index]):
+                    children.append((total + flat[index], masked, picks, index))
+        if not children:
+            break
+        children.sort(key=lambda child: child[0])
+
+        beam = []
+        for total, masked, picks, index in children[:beam_width]:
+            b, l, d = np.unravel_index(index, shape)
+            masked = masked.copy()
+            masked[b, :, :] = masked[:, l, :] = masked[:, :, d] = np.inf
+            beam.append((total, masked, picks + [(b, l, d)]))
+
+    triples = np.array(beam[0][2], dtype=np.intp).reshape(-1, 3)
+    return [tuple(int(i) for i in triple) for triple in improve_by_swaps(costs, triples, max_swaps)]
+
+
+def improve_by_swaps(costs, triples, max_swaps):
+    """
+    Repeatedly apply the single-meal swap between two triples that lowers
+    the summed cost the most. Every candidate swap is scored at once as a
+    ``3 x n x n`` array (meal, receiving triple, giving triple).
+    """
+    triples = triples.copy()
+    n = len(triples)
+    if n < 2:
+        return triples
+    meals = np.arange(3)
+    for _ in range(max_swaps):
+        current = costs[triples[:, 0], triples[:, 1], triples[:, 2]]
+        swapped = np.broadcast_to(triples[None, :, None, :], (3, n, n, 3)).copy()
+        swapped[meals, :, :, meals] = triples[:, meals].T[:, None, :]
+        swapped_costs = costs[swapped[..., 0], swapped[..., 1], swapped[..., 2]]
+        gain = current[:, None] + current[None, :] - swapped_costs - swapped_costs.transpose(0, 2, 1)
+        meal, i, j = np.unravel_index(np.argmax(gain), gain.shape)
+        if gain[meal, i, j] <= 1e-12:
+            break
+        triples[i, meal], triples[j, meal] = triples[j, meal], triples[i, meal]
+    return triples
+
+
+def daily_deviation(breakfast, lunch, dinner, triples, targets):
+    """Mean absolute relative deviation of the triples' calories from the daily target."""
+    totals = np.array([breakfast[b, 0] + lunch[l, 0] + dinner[d, 0] for b, l, d in triples])
+    return float(np.mean(np.abs(totals - targets[0]) / targets[0]))
@@ -0,0 +1,139 @@
+"""
+In-process LRU + TTL cache for scored candidate pools.
+
+Scoring a candidate pool (decision-tree probabilities, the per-subset
+scaler, macro distances and ingredient similarity) only depends on the
+filters, the calorie window, the weight direction and the artifact
+version, so repeat requests with the same signature skip straight to meal
+selection. The cache is bounded by entry count and by the bytes of the
+cached arrays, since every pool holds a few catalog-sized columns.
+
+By default the signature keeps the exact calorie window, so a cached plan
+is the plan an uncached request would get. A nonzero ``CALORIE_QUANTUM``
+lets members with near-identical windows share a pool, but the window is
+then rounded before filtering: the plan is built from (and reports) the
+rounded window rather than the member's exact one.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+CACHE_SIZE = getattr(settings, 'FOOD_POOL_CACHE_SIZE', 256)
+CACHE_TTL = getattr(settings, 'FOOD_POOL_CACHE_TTL', 600.0)
+CACHE_BYTES = getattr(settings, 'FOOD_POOL_CACHE_BYTES', 64 * 1024 * 1024)
+CALORIE_QUANTUM = getattr(settings, 'FOOD_POOL_CALORIE_QUANTUM', 0.0)
+
+
+def quantize_calories(value, quantum=None):
+    """Round a calorie bound to the nearest ``quantum`` (``CALORIE_QUANTUM`` by default); 0 keeps it exact."""
+    if quantum is None:
+        quantum = CALORIE_QUANTUM
+    if not quantum:
+        return float(value)
+    return float(round(value / quantum) * quantum)
+
+
+def value_nbytes(value):
+    """Bytes held by the arrays of a cached value (a ``ScoredPool`` or any tuple of arrays)."""
+    if isinstance(value, tuple):
+        return sum(value_nbytes(item) for item in value)
+    return getattr(value, 'nbytes', 0)
+
+
+def pool_signature(version, food_pref, cuisine, direction, calorie_range, weights, exclusions=()):
+    """Cache key for a scored pool; also the batch grouping key. ``exclusions`` come from ``exclusion_terms``."""
+    food_pref = food_pref.lower()
+    return (
+        version,
+        food_pref if food_pref in ("veg", "non-veg") else "both",
+        cuisine.lower(),
+        direction,
+        quantize_calories(calorie_range[0]),
+        quantize_calories(calorie_range[1]),
+        tuple(weights),
+        tuple(exclusions),
+    )
+
+
+class ScoredPoolCache:
+    """
+    Mapping with least-recently-used eviction and per-entry expiry, bounded
+    by ``maxsize`` entries and ``maxbytes`` bytes as measured by ``sizeof``.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, clock=time.monotonic,
+                 maxbytes=CACHE_BYTES, sizeof=value_nbytes):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.clock = clock
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value, _ = entry
+                if expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._discard(key)
+            self.misses += 1
+            return None
+
+    def _discard(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        # A value that could never fit is not cached rather than flushing everything else
+        if self.maxsize <= 0 or size > self.maxbytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (self.clock() + self.ttl, value, size)
+            self._bytes += size
+            while len(self._entries) > self.maxsize or self._bytes > self.maxbytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "bytes": self._bytes,
+                "maxbytes": self.maxbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+scored_pools = ScoredPoolCache()
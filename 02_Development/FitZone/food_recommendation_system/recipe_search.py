@@ -0,0 +1,152 @@
+"""
+Autocomplete over the recipe names of one artifact version.
+
+Names are split into lowercase words once per version. The distinct words
+are kept sorted, with a CSR matrix of words x recipes as posting lists, so
+every word starting with a prefix is one contiguous block of rows and a
+prefix lookup is a bisection plus one slice. Typed words that prefix no
+word at all fall back to a trigram index over the same vocabulary (not the
+names, which keeps it small) to tolerate typos. A query matches the
+recipes containing a match for each of its words.
+"""
+import bisect
+import re
+
+import numpy as np
+from scipy import sparse
+
+WORD = re.compile(r"[a-z0-9]+")
+
+# Share of a typed word's trigrams a vocabulary word needs to count as a typo match
+TRIGRAM_THRESHOLD = 0.5
+
+
+def name_words(name):
+    return WORD.findall(str(name).lower())
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RecipeNameIndex:
+    """Prefix and trigram lookup from typed text to catalog positions."""
+
+    def __init__(self, names):
+        word_ids = {}
+        rows, columns = [], []
+        first_words = []
+        name_lengths = []
+        for position, name in enumerate(names):
+            words = name_words(name)
+            ids = {word_ids.setdefault(word, len(word_ids)) for word in words}
+            rows.extend(ids)
+            columns.extend([position] * len(ids))
+            first_words.append(word_ids[words[0]] if words else -1)
+            name_lengths.append(len(str(name)))
+
+        # Renumber words alphabetically so a prefix covers a contiguous range of rows
+        self.words = sorted(word_ids)
+        rank = np.empty(len(word_ids), dtype=np.intp)
+        rank[[word_ids[word] for word in self.words]] = np.arange(len(self.words))
+        n_recipes = len(name_lengths)
+        postings = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int8), (rank[np.asarray(rows, dtype=np.intp)], np.asarray(columns, dtype=np.intp))),
+            shape=(len(self.words), n_recipes),
+        )
+        postings.sort_indices()
+        self.indptr = postings.indptr
+        self.indices = postings.indices
+        first_words = np.asarray(first_words, dtype=np.intp)
+        self.first_word = np.full(n_recipes, -1, dtype=np.intp)
+        self.first_word[first_words >= 0] = rank[first_words[first_words >= 0]]
+        self.name_lengths = np.asarray(name_lengths, dtype=np.int64)
+
+        trigram_rows, trigram_columns, trigram_ids = [], [], {}
+        for word_id, word in enumerate(self.words):
+            for trigram in trigrams(word):
+                trigram_rows.append(trigram_ids.setdefault(trigram, len(trigram_ids)))
+                trigram_columns.append(word_id)
+        self.trigram_ids = trigram_ids
+        self.trigram_postings = sparse.csr_matrix(
+            (np.ones(len(trigram_rows), dtype=np.int32), (trigram_rows, trigram_columns)),
+            shape=(len(trigram_ids), len(self.words)),
+        )
+        self.word_trigram_counts = np.asarray([len(trigrams(word)) for word in self.words], dtype=np.int32)
+
+    def prefix_range(self, prefix):
+        """Rows ``[lo, hi)`` of the vocabulary words starting with ``prefix``."""
+        lo = bisect.bisect_left(self.words, prefix)
+        hi = bisect.bisect_left(self.words, prefix + "\uffff", lo)
+        return lo, hi
+
+    def similar_words(self, word):
+        """Vocabulary rows sharing at least ``TRIGRAM_THRESHOLD`` of their trigrams with ``word``."""
+        ids = [self.trigram_ids[t] for t in trigrams(word) if t in self.trigram_ids]
+        if not ids:
+            return np.empty(0, dtype=np.intp)
+        shared = np.asarray(self.trigram_postings[ids].sum(axis=0)).ravel()
+        similarity = shared / np.maximum(self.word_trigram_counts, len(trigrams(word)))
+        return np.flatnonzero(similarity >= TRIGRAM_THRESHOLD)
+
+    def recipes_for_word(self, word):
+        lo, hi = self.prefix_range(word)
+        if hi == lo + 1:
+            # One word's postings are already sorted and unique
+            return self.indices[self.indptr[lo]:self.indptr[hi]]
+        if hi > lo:
+            return np.unique(self.indices[self.indptr[lo]:self.indptr[hi]])
+        rows = self.similar_words(word) if len(word) >= 3 else ()
+        if not len(rows):
+            return np.empty(0, dtype=self.indices.dtype)
+        return np.unique(np.concatenate([self.indices[self.indptr[r]:self.indptr[r + 1]] for r in rows]))
+
+    def search(self, query, limit=10):
+        """
+        Positions of up to ``limit`` recipes whose names match every word of
+        ``query`` (as a prefix, or by trigrams for typos). Names starting
+        with the first typed word come first, then shorter names.
+        """
+        words = name_words(query)
+        if not words or limit <= 0:
+            return np.empty(0, dtype=np.intp)
+
+        candidates = None
+        for word in words:
+            matches = self.recipes_for_word(word)
+            candidates = matches if candidates is None else np.intersect1d(candidates, matches, assume_unique=True)
+            if candidates.size == 0:
+                return np.empty(0, dtype=np.intp)
+
+        lo, hi = self.prefix_range(words[0])
+        first = self.first_word[candidates]
+        leading = (first >= lo) & (first < hi)
+        # One sortable key: leading match, then name length, then catalog position
+        key = (~leading).astype(np.int64) << 52 | self.name_lengths[candidates] << 32 | candidates
+        if key.size > limit:
+            key = key[np.argpartition(key, limit - 1)[:limit]]
+        return np.sort(key) & 0xFFFFFFFF
+
+
+def suggest(artifacts, query, limit=10):
+    """Autocomplete entries for ``query`` with the macros a meal form needs, rounded to whole units."""
+    positions = artifacts.name_index.search(query, limit)
+    columns = artifacts.columns
+    numeric = artifacts.numeric
+    # Legacy pickles may lack the column or have None for some recipes
+    ingredient_lines = columns.get("ingredient_lines")
+    if ingredient_lines is None:
+        ingredient_lines = [None] * artifacts.n_recipes
+    return [
+        {
+            "id": int(position),
+            "name": str(columns["recipe_name"][position]),
+            "calories": int(round(float(numeric["calories"][position]))),
+            "protein": int(round(float(numeric["protein"][position]))),
+            "carbs": int(round(float(numeric["carbs"][position]))),
+            "fat": int(round(float(numeric["fat"][position]))),
+            "ingredients": "\n".join(ingredient_lines[position] or ()),
+        }
+        for position in positions
+    ]
@@ -0,0 +1,134 @@
+"""
+Database copy of an artifact version's recipe catalog.
+
+``import_catalog`` writes every recipe of a version into ``Recipe`` rows
+(with normalized ``Cuisine`` and ``MealType`` tables) keyed by their catalog
+position. With ``FOOD_SQL_PREFILTER`` enabled, the exact scoring path asks
+the database for the candidates instead of scanning the in-memory masks:
+the calorie window, food type and cuisine are applied in SQL against the
+``(catalog, food_type, calories)`` index and only the positions and the
+four feature columns come back.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .artifacts import FEATURES
+from .models import Cuisine, MealType, Recipe, RecipeCatalog
+
+SQL_PREFILTER = getattr(settings, 'FOOD_SQL_PREFILTER', False)
+
+IMPORT_BATCH_SIZE = 2000
+
+# Completed catalogs never change, so their ids are remembered per version
+_catalog_ids = {}
+
+
+def _label_ids(model, labels):
+    model.objects.bulk_create([model(name=name) for name in sorted(labels)], ignore_conflicts=True)
+    return dict(model.objects.filter(name__in=labels).values_list('name', 'id'))
+
+
+def _lowercased(labels):
+    return sorted({label.lower() for label in labels})
+
+
+def import_catalog(artifacts, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Copy the recipes of ``artifacts`` into the database and return the
+    completed ``RecipeCatalog``.
+
+    Each batch is committed on its own so very large catalogs do not need
+    one huge transaction; the catalog is only marked complete at the end,
+    and an interrupted import is discarded and redone on the next call.
+    Raises ``ValueError`` if the version has already been imported.
+    """
+    version = artifacts.version
+    if RecipeCatalog.objects.filter(version=version, completed_at__isnull=False).exists():
+        raise ValueError(f"Recipe catalog {version} has already been imported")
+    RecipeCatalog.objects.filter(version=version).delete()
+    catalog = RecipeCatalog.objects.create(version=version, recipe_count=artifacts.n_recipes)
+
+    columns = artifacts.columns
+    numeric = artifacts.numeric
+    cuisines = [_lowercased(labels) for labels in columns['cuisine_type']]
+    meal_types = [_lowercased(labels) for labels in columns['meal_type']]
+    cuisine_ids = _label_ids(Cuisine, {name for names in cuisines for name in names})
+    meal_type_ids = _label_ids(MealType, {name for names in meal_types for name in names})
+    urls = columns['url'] if 'url' in columns else [''] * artifacts.n_recipes
+
+    RecipeCuisine = Recipe.cuisines.through
+    RecipeMealType = Recipe.meal_types.through
+    for start in range(0, artifacts.n_recipes, batch_size):
+        positions = range(start, min(start + batch_size, artifacts.n_recipes))
+        with transaction.atomic():
+            Recipe.objects.bulk_create([
+                Recipe(
+                    catalog=catalog,
+                    position=position,
+                    name=str(columns['recipe_name'][position])[:255],
+                    image_url=columns['image_url'][position] or '',
+                    url=urls[position] or '',
+                    calories=float(numeric['calories'][position]),
+                    protein=float(numeric['protein'][position]),
+                    fat=float(numeric['fat'][position]),
+                    carbs=float(numeric['carbs'][position]),
+                    food_type=columns['food_type'][position],
+                    ingredient_lines=list(columns['ingredient_lines'][position] or ()),
+                )
+                for position in positions
+            ])
+            recipe_ids = dict(
+                Recipe.objects.filter(catalog=catalog, position__gte=start, position__lt=positions.stop)
+                .values_list('position', 'id')
+            )
+            RecipeCuisine.objects.bulk_create([
+                RecipeCuisine(recipe_id=recipe_ids[position], cuisine_id=cuisine_ids[name])
+                for position in positions for name in cuisines[position]
+            ])
+            RecipeMealType.objects.bulk_create([
+                RecipeMealType(recipe_id=recipe_ids[position], mealtype_id=meal_type_ids[name])
+                for position in positions for name in meal_types[position]
+            ])
+
+    catalog.completed_at = timezone.now()
+    catalog.save(update_fields=['completed_at'])
+    return catalog
+
+
+def catalog_id(version):
+    """Id of the completed ``RecipeCatalog`` for ``version``, or ``None`` if it was not imported."""
+    if version in _catalog_ids:
+        return _catalog_ids[version]
+    found = (
+        RecipeCatalog.objects.filter(version=version, completed_at__isnull=False)
+        .values_list('id', flat=True).first()
+    )
+    if found is not None:
+        _catalog_ids[version] = found
+    return found
+
+
+def sql_candidates(version, food_pref, cuisine, calorie_range):
+    """
+    Positions (ascending) and ``FEATURES`` matrix of the recipes of
+    ``version`` that pass the request's filters, or ``None`` when that
+    version has not been imported. Filters match ``preference_masks``:
+    food type exactly, cuisine by lowercased label.
+    """
+    found = catalog_id(version)
+    if found is None:
+        return None
+
+    recipes = Recipe.objects.filter(catalog_id=found, calories__gte=calorie_range[0], calories__lte=calorie_range[1])
+    if food_pref.lower() in ["veg", "non-veg"]:
+        recipes = recipes.filter(food_type=food_pref.lower())
+    if cuisine.lower() != "all":
+        recipes = recipes.filter(cuisines__name=cuisine.lower())
+
+    rows = np.array(
+        list(recipes.order_by('position').values_list('position', *FEATURES)),
+        dtype=np.float64,
+    ).reshape(-1, 1 + len(FEATURES))
+    return rows[:, 0].astype(np.intp), rows[:, 1:]
@@ -1,236 +1,585 @@
-import os
-import pickle
+from collections import defaultdict, namedtuple
+
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import StandardScaler
-from django.conf import settings
-
-# Load pre-trained models and data
-MODEL_PATH = os.path.join(settings.BASE_DIR, 'food_recommendation_system', 'food_models.pkl')
-
-try:
-    with open(MODEL_PATH, 'rb') as f:
-        models_data = pickle.load(f)
-        dt_model = models_data['dt_model']
-        scaler_original = models_data['scaler']
-        cosine_sim = models_data['cosine_sim']
-        df_clean = models_data['df_clean']
-except Exception:
-    dt_model = None
-    scaler_original = None
-    cosine_sim = None
-    df_clean = None
 
-def get_recommendations(
-    age, height, current_weight, target_weight, gender="M", 
-    activity_level="moderate", food_pref="both", cuisine="all",
-    kcal_per_kg=110.0, min_daily_cal=1200.0, 
-    max_delta_kcal=900.0, cap_factor=1.5, w_health=0.45, w_macro=0.35, w_ingred=0.20
+from .artifacts import FEATURES, get_artifacts
+from .ingredient_index import exclusion_terms
+from .macro_index import ENABLED as MACRO_INDEX_ENABLED, MIN_RECIPES as MACRO_INDEX_MIN_RECIPES
+from .plan_optimizer import KCAL_PER_GRAM, arrange_week, daily_macro_targets
+from .pool_cache import pool_signature, quantize_calories, scored_pools
+from .recipe_store import SQL_PREFILTER, sql_candidates
+
+
+def label_mask(indexes, key, label):
+    """Return the precomputed mask for ``label`` or an all-False mask if it is unknown."""
+    mask = indexes[key].get(label)
+    if mask is None:
+        return np.zeros(len(indexes["calories"]), dtype=bool)
+    return mask
+
+
+def ingredient_similarity(artifacts, positions):
+    """Mean ingredient similarity of every candidate to the candidate set."""
+    if artifacts.ingredient_vectors is None:
+        return np.asarray(artifacts.cosine_sim[positions][:, positions]).mean(axis=1)
+    candidate_vectors = artifacts.ingredient_vectors[positions]
+    centroid = np.asarray(candidate_vectors.mean(axis=0)).ravel()
+    return candidate_vectors @ centroid
+
+
+ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "active": 1.725,
+    "very_active": 1.9
+}
+
+MACRO_SPLITS = {
+    "loss": {"protein": 0.37, "fat": 0.25, "carbs": 0.38},
+    "gain": {"protein": 0.28, "fat": 0.30, "carbs": 0.42},
+}
+DEFAULT_MACRO_SPLIT = {"protein": 0.30, "fat": 0.30, "carbs": 0.40}
+
+# 3 options x 7 days, so each day can get different meals
+POOL_SIZE = 21
+
+# Meals of the weekly plan; candidates for large catalogs are retrieved per meal
+MEAL_SLOTS = ["breakfast", "lunch", "dinner"]
+# Nearest recipes retrieved per meal (and for backfill) when scoring from the macro index
+RETRIEVAL_K = 4 * POOL_SIZE
+
+# Catalog positions of the filtered candidates and their per-candidate scores
+ScoredPool = namedtuple("ScoredPool", "positions health_score knn_score ingred_score final_score")
+
+DAYS = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+MODELS_NOT_LOADED = "Models not loaded. Please ensure food_models.pkl exists."
+NO_MATCHES = "No recipes match your criteria. Try adjusting preferences."
+
+
+def bmi_category(bmi_val):
+    if bmi_val < 18.5:
+        return "underweight"
+    elif bmi_val < 25:
+        return "normal"
+    elif bmi_val < 30:
+        return "overweight"
+    return "obese"
+
+
+def energy_targets(
+    age, height, current_weight, target_weight, gender, activity_level,
+    kcal_per_kg=110.0, min_daily_cal=1200.0, max_delta_kcal=900.0, cap_factor=1.5
 ):
-    if df_clean is None:
-        return {"error": "Models not loaded. Please ensure food_models.pkl exists."}
-
-    def bmi_info(w_kg, h_cm):
-        bmi_val = w_kg / ((h_cm / 100) ** 2)
-        if bmi_val < 18.5:
-            cat = "underweight"
-        elif bmi_val < 25:
-            cat = "normal"
-        elif bmi_val < 30:
-            cat = "overweight"
-        else:
-            cat = "obese"
-        return bmi_val, cat
-    
-    bmi_val, bmi_cat = bmi_info(current_weight, height)
-    
-    if gender.upper() == "M":
-        bmr = 10 * current_weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * current_weight + 6.25 * height - 5 * age - 161
-    
-    activity_map = {
-        "sedentary": 1.2,
-        "light": 1.375,
-        "moderate": 1.55,
-        "active": 1.725,
-        "very_active": 1.9
-    }
-    activity_mult = activity_map.get(activity_level.lower(), 1.55)
+    """
+    Compute BMI, BMR, TDEE, daily target and per-meal calorie window.
+
+    Every argument may be a scalar or a sequence (one entry per user); the
+    result is a dict of equal-length NumPy arrays, so a whole cohort is
+    computed in a handful of vectorized operations.
+    """
+    age = np.atleast_1d(np.asarray(age, dtype=float))
+    height = np.atleast_1d(np.asarray(height, dtype=float))
+    current_weight = np.atleast_1d(np.asarray(current_weight, dtype=float))
+    target_weight = np.atleast_1d(np.asarray(target_weight, dtype=float))
+    is_male = np.array([g.upper() == "M" for g in np.atleast_1d(gender)])
+    activity_mult = np.array([ACTIVITY_MULTIPLIERS.get(a.lower(), 1.55) for a in np.atleast_1d(activity_level)])
+
+    bmi = current_weight / ((height / 100) ** 2)
+    bmr = 10 * current_weight + 6.25 * height - 5 * age + np.where(is_male, 5, -161)
     tdee = bmr * activity_mult
-    
+
     diff = target_weight - current_weight
-    direction = "loss" if diff < 0 else "gain"
-    
-    delta_kcal = np.clip(abs(diff) * kcal_per_kg, 250.0, max_delta_kcal)
-    
-    if direction == "loss":
-        target_cal = max(min_daily_cal, tdee - delta_kcal)
-    else:
-        target_cal = tdee + delta_kcal
-    
+    is_loss = diff < 0
+    delta_kcal = np.clip(np.abs(diff) * kcal_per_kg, 250.0, max_delta_kcal)
+    target_cal = np.where(is_loss, np.maximum(min_daily_cal, tdee - delta_kcal), tdee + delta_kcal)
+
     per_meal_target = target_cal / 3.0
     calorie_cap = per_meal_target * cap_factor
-    calorie_range = (max(180.0, per_meal_target * 0.65), min(calorie_cap, per_meal_target + 350.0))
-    
-    if direction == "loss":
-        macro_split = {"protein": 0.37, "fat": 0.25, "carbs": 0.38}
-    elif direction == "gain":
-        macro_split = {"protein": 0.28, "fat": 0.30, "carbs": 0.42}
-    else:
-        macro_split = {"protein": 0.30, "fat": 0.30, "carbs": 0.40}
-    
-    filtered_df = df_clean.copy()
-    
+    return {
+        "bmi": bmi,
+        "bmr": bmr,
+        "tdee": tdee,
+        "direction": np.where(is_loss, "loss", "gain"),
+        "target_cal": target_cal,
+        "calorie_min": np.maximum(180.0, per_meal_target * 0.65),
+        "calorie_max": np.minimum(calorie_cap, per_meal_target + 350.0),
+    }
+
+
+def normalize_signal(signal):
+    min_val, max_val = signal.min(), signal.max()
+    if max_val == min_val:
+        return np.ones(len(signal))
+    return (signal - min_val) / (max_val - min_val)
+
+
+def macro_distances(X, target):
+    """
+    Distance from each row of ``X`` to ``target`` after standardizing both
+    with the mean and population std of ``X``.
+
+    This is the arithmetic of ``StandardScaler().fit(X)`` followed by
+    ``transform`` (same two-pass variance and constant-feature guard), done
+    directly in NumPy to skip sklearn's per-call input validation.
+    """
+    n_rows = X.shape[0]
+    mean = np.sum(X, axis=0) / n_rows
+    temp = X - mean
+    correction = np.sum(temp, axis=0)
+    temp **= 2
+    var = (np.sum(temp, axis=0) - correction ** 2 / n_rows) / n_rows
+
+    eps = np.finfo(np.float64).eps
+    scale = np.sqrt(var)
+    scale[var <= n_rows * eps * var + (n_rows * mean * eps) ** 2] = 1.0
+    return np.linalg.norm((X - mean) / scale - (target - mean) / scale, axis=1)
+
+
+def preference_masks(artifacts, food_pref, cuisine):
+    """Food type and cuisine masks for a request, ``None`` where that filter is not applied."""
+    filter_indexes = artifacts.filter_indexes
+    food_mask = None
+    cuisine_mask = None
     if food_pref.lower() in ["veg", "non-veg"]:
-        filtered_df = filtered_df[filtered_df["food_type"] == food_pref.lower()]
-    
-    filtered_df = filtered_df[
-        (filtered_df["calories"] >= calorie_range[0]) &
-        (filtered_df["calories"] <= calorie_range[1])
-    ]
-    
+        food_mask = label_mask(filter_indexes, "food_type", food_pref.lower())
     if cuisine.lower() != "all":
-        filtered_df = filtered_df[filtered_df["cuisine_type"].apply(lambda x: cuisine.lower() in [c.lower() for c in x])]
-    
-    if len(filtered_df) == 0:
+        cuisine_mask = label_mask(filter_indexes, "cuisine", cuisine.lower())
+    return food_mask, cuisine_mask
+
+
+def target_macros(calories, macro_split):
+    return np.array([[
+        calories,
+        calories * macro_split["protein"],
+        calories * macro_split["fat"],
+        calories * macro_split["carbs"]
+    ]])
+
+
+def score_pool(artifacts, positions, knn, w_health, w_macro, w_ingred):
+    """Blend health, macro and ingredient signals for the candidates at ``positions``."""
+    # The health probability only depends on the recipe, so it is precomputed per artifact
+    health = artifacts.health_score[positions]
+
+    # Mean ingredient similarity to the candidate set (sparse centroid product)
+    ingred = np.asarray(ingredient_similarity(artifacts, positions), dtype=float)
+
+    final = (
+        w_health * normalize_signal(health) +
+        w_macro * normalize_signal(knn) +
+        w_ingred * normalize_signal(ingred)
+    )
+    return ScoredPool(positions, health, knn, ingred, final)
+
+
+def empty_pool():
+    empty = np.empty(0)
+    return ScoredPool(np.empty(0, dtype=np.intp), empty, empty, empty, empty)
+
+
+def score_candidates(artifacts, food_pref, cuisine, calorie_range, macro_split,
+                     w_health=0.45, w_macro=0.35, w_ingred=0.20, exclusions=()):
+    """
+    Filter the catalog and score every candidate.
+
+    Recipes matching any of ``exclusions`` (see ``exclusion_terms``) are
+    dropped with one mask from the artifact's ingredient index.
+
+    Works directly on the catalog's column arrays: only the candidates'
+    feature values are gathered, and the result is a ``ScoredPool`` of
+    parallel arrays (empty when nothing matches the filters).
+
+    With ``FOOD_SQL_PREFILTER`` enabled and the version imported into the
+    database, the filters run in SQL and only the candidates' features are
+    fetched (see ``recipe_store``); this takes precedence over the macro
+    index. Otherwise, with ``FOOD_MACRO_INDEX`` enabled, catalogs of
+    ``MACRO_INDEX_MIN_RECIPES`` or more are scored from the macro index by
+    ``score_nearest_candidates``; every other request is an exact scan.
+    """
+    excluded = artifacts.ingredient_index.exclusion_mask(exclusions) if exclusions else None
+    candidates = None
+    if SQL_PREFILTER:
+        candidates = sql_candidates(artifacts.version, food_pref, cuisine, calorie_range)
+
+    if candidates is not None:
+        positions, X = candidates
+        if excluded is not None:
+            keep = ~excluded[positions]
+            positions, X = positions[keep], X[keep]
+    elif MACRO_INDEX_ENABLED and artifacts.n_recipes >= MACRO_INDEX_MIN_RECIPES:
+        return score_nearest_candidates(
+            artifacts, food_pref, cuisine, calorie_range, macro_split, w_health, w_macro, w_ingred, excluded
+        )
+    else:
+        # Intersect the precomputed masks and only gather the matching rows
+        calories_col = artifacts.filter_indexes["calories"]
+        candidate_mask = (calories_col >= calorie_range[0]) & (calories_col <= calorie_range[1])
+        food_mask, cuisine_mask = preference_masks(artifacts, food_pref, cuisine)
+        if food_mask is not None:
+            candidate_mask &= food_mask
+        if cuisine_mask is not None:
+            candidate_mask &= cuisine_mask
+        if excluded is not None:
+            candidate_mask &= ~excluded
+
+        positions = np.flatnonzero(candidate_mask)
+        X = np.column_stack([artifacts.numeric[column][positions] for column in FEATURES])
+
+    if positions.size == 0:
+        return empty_pool()
+
+    # Distances are standardized with the statistics of this subset
+    target = target_macros(X[:, 0].mean(), macro_split)
+    knn = 1.0 / (1.0 + macro_distances(X, target))
+
+    return score_pool(artifacts, positions, knn, w_health, w_macro, w_ingred)
+
+
+def score_nearest_candidates(artifacts, food_pref, cuisine, calorie_range, macro_split,
+                             w_health=0.45, w_macro=0.35, w_ingred=0.20, excluded=None):
+    """
+    Score only the recipes nearest to the target macros (``FOOD_MACRO_INDEX``).
+
+    This ranks differently from ``score_candidates``, not just faster: the
+    target, the standardization and the ingredient centroid below all
+    differ from the exact path, so it is only used when enabled explicitly.
+
+    For each meal in ``MEAL_SLOTS``, and once across all meal types for
+    backfill, the macro index returns the ``RETRIEVAL_K`` nearest recipes
+    that pass the filters; the union is scored like a full candidate set.
+    Distances use the catalog-wide standardization and the target is built
+    from the middle of the calorie window, so no per-request pass over the
+    catalog is needed.
+
+    Unlike ``score_candidates``, the target converts the macro split into
+    grams. The full scan ranks against ``calories * share`` grams, which
+    lies far outside every recipe; nearest-neighbour search degrades to a
+    scan for such a target, so it is only kept on the exact path for
+    compatibility with existing plans. ``excluded`` masks out recipes
+    matching the request's exclusions.
+    """
+    calories_col = artifacts.filter_indexes["calories"]
+    food_mask, _ = preference_masks(artifacts, food_pref, "all")
+
+    def accept(positions):
+        calories = calories_col[positions]
+        ok = (calories >= calorie_range[0]) & (calories <= calorie_range[1])
+        if food_mask is not None:
+            ok &= food_mask[positions]
+        if excluded is not None:
+            ok &= ~excluded[positions]
+        return ok
+
+    grams_split = {macro: share / KCAL_PER_GRAM[macro] for macro, share in macro_split.items()}
+    target = target_macros((calorie_range[0] + calorie_range[1]) / 2.0, grams_split)[0]
+    index = artifacts.macro_index
+    cuisine = None if cuisine.lower() == "all" else cuisine.lower()
+    found = [
+        index.nearest(target, RETRIEVAL_K, calorie_range, accept, meal_type=meal, cuisine=cuisine)
+        for meal in MEAL_SLOTS + [None]
+    ]
+
+    positions, first = np.unique(np.concatenate([p for p, _ in found]), return_index=True)
+    if positions.size == 0:
+        return empty_pool()
+    distances = np.concatenate([d for _, d in found])[first]
+
+    return score_pool(artifacts, positions, 1.0 / (1.0 + distances), w_health, w_macro, w_ingred)
+
+
+def top_by_score(local, scores, n):
+    """
+    The ``n`` entries of ``local`` with the highest ``scores``, best first.
+
+    ``np.argpartition``-style selection keeps this O(k) in the candidate
+    count; only the survivors are sorted, with ties kept in catalog order.
+    """
+    if n <= 0 or local.size == 0:
+        return local[:0]
+    if local.size > n:
+        local_scores = scores[local]
+        kth = np.partition(local_scores, local.size - n)[local.size - n]
+        local = local[local_scores >= kth]
+    order = np.lexsort((local, -scores[local]))
+    return local[order][:n]
+
+
+def meal_records(artifacts, pool, chosen):
+    """Output dicts for the pool entries at ``chosen``, built by direct array indexing."""
+    return recipe_records(
+        artifacts,
+        pool.positions[chosen],
+        pool.health_score[chosen],
+        pool.knn_score[chosen],
+        pool.ingred_score[chosen],
+        pool.final_score[chosen],
+    )
+
+
+def recipe_records(artifacts, positions, health, knn, ingred, final):
+    """
+    Output dicts for the recipes at catalog ``positions`` with their scores.
+
+    ``id`` is the recipe's catalog position, which together with the
+    artifact version is all a stored plan needs to rebuild these dicts.
+    """
+    positions = np.asarray(positions, dtype=np.intp)
+    columns = artifacts.columns
+    numeric = artifacts.numeric
+
+    names = columns["recipe_name"][positions]
+    images = columns["image_url"][positions]
+    urls = columns["url"][positions] if "url" in columns else [None] * len(positions)
+    cuisines = columns["cuisine_type"][positions]
+    ingredients = columns["ingredient_lines"][positions]
+    ids = positions.tolist()
+    calories = numeric["calories"][positions].tolist()
+    protein = numeric["protein"][positions].tolist()
+    fat = numeric["fat"][positions].tolist()
+    carbs = numeric["carbs"][positions].tolist()
+    health = np.asarray(health).tolist()
+    knn = np.asarray(knn).tolist()
+    ingred = np.asarray(ingred).tolist()
+    final = np.asarray(final).tolist()
+
+    return [
+        {
+            "id": ids[i],
+            "name": names[i],
+            "image": images[i],
+            "calories": round(calories[i], 1),
+            "protein": round(protein[i], 1),
+            "fat": round(fat[i], 1),
+            "carbs": round(carbs[i], 1),
+            "cuisine": ", ".join(cuisines[i]) if cuisines[i] else "Unknown",
+            "ingredients": "\n".join(ingredients[i]) if ingredients[i] else "Check recipe details for full ingredient list.",
+            "instructions": f"To view full preparation steps, please visit: {urls[i]}" if urls[i] else "Follow standard preparation steps for this meal type.",
+            "health_score": round(health[i], 3),
+            "macro_score": round(knn[i], 3),
+            "ingredient_score": round(ingred[i], 3),
+            "final_score": round(final[i], 3)
+        }
+        for i in range(len(positions))
+    ]
+
+
+def build_weekly_plan(artifacts, pool, daily_calories=None, macro_split=None):
+    """
+    Pick breakfast, lunch and dinner pools from a scored candidate set and lay out the week.
+
+    With a ``daily_calories`` target (and ``macro_split``), full pools are
+    arranged by ``arrange_week`` so each day's options add up close to the
+    target; otherwise the pools are sliced in score order.
+    """
+    meal_types = artifacts.filter_indexes
+    taken = np.zeros(len(pool.positions), dtype=bool)
+    nutrients = {}
+
+    def get_meals(meal_type_filter, n_meals=3):
+        meal_mask = label_mask(meal_types, "meal_type", meal_type_filter.lower())[pool.positions]
+        chosen = top_by_score(np.flatnonzero(meal_mask & ~taken), pool.final_score, POOL_SIZE)
+
+        # Backfill from any meal type when this one has too few candidates
+        if len(chosen) < n_meals:
+            remaining = ~taken
+            remaining[chosen] = False
+            backfill = top_by_score(np.flatnonzero(remaining), pool.final_score, POOL_SIZE - len(chosen))
+            chosen = np.concatenate([chosen, backfill])
+
+        taken[chosen] = True
+        positions = pool.positions[chosen]
+        nutrients[meal_type_filter] = np.column_stack([artifacts.numeric[column][positions] for column in FEATURES])
+        return meal_records(artifacts, pool, chosen)
+
+    # Each meal excludes recipes already picked for the earlier ones
+    breakfast_pool = get_meals("breakfast", POOL_SIZE)
+    lunch_pool = get_meals("lunch", POOL_SIZE)
+    dinner_pool = get_meals("dinner", POOL_SIZE)
+
+    # Generate a full weekly plan (7 days) with different food each day
+    weekly_plan = {}
+
+    if daily_calories is not None and min(len(breakfast_pool), len(lunch_pool), len(dinner_pool)) == POOL_SIZE:
+        # Every recipe goes to one day's (breakfast, lunch, dinner) option so the totals hit the target
+        triples = arrange_week(
+            nutrients["breakfast"], nutrients["lunch"], nutrients["dinner"],
+            daily_macro_targets(daily_calories, macro_split), n_triples=POOL_SIZE,
+        )
+        for i, day in enumerate(DAYS):
+            day_triples = triples[i * 3:i * 3 + 3]
+            weekly_plan[day] = {
+                "breakfast": [breakfast_pool[b] for b, _, _ in day_triples],
+                "lunch": [lunch_pool[l] for _, l, _ in day_triples],
+                "dinner": [dinner_pool[d] for _, _, d in day_triples],
+            }
+    else:
+        for i, day in enumerate(DAYS):
+            # Slice the pools to get different meals for different days
+            # Each day gets 3 unique options from the pool (3 * 7 = 21)
+            start = i * 3
+            end = start + 3
+
+            weekly_plan[day] = {
+                "breakfast": breakfast_pool[start:end] if i*3 < len(breakfast_pool) else breakfast_pool[:3],
+                "lunch": lunch_pool[start:end] if i*3 < len(lunch_pool) else lunch_pool[:3],
+                "dinner": dinner_pool[start:end] if i*3 < len(dinner_pool) else dinner_pool[:3]
+            }
+
+    return {
+        "breakfast": breakfast_pool[:3], # Fallback for old code
+        "lunch": lunch_pool[:3],
+        "dinner": dinner_pool[:3],
+        "weekly_plan": weekly_plan
+    }
+
+
+def _plan_for(artifacts, signature, daily_calories):
+    """
+    Weekly plan for a pool signature and daily calorie target (quantized like
+    the signature's window), reusing the cached scored pool when possible.
+    """
+    _, food_pref, cuisine, direction, calorie_min, calorie_max, weights, exclusions = signature
+    macro_split = MACRO_SPLITS.get(direction, DEFAULT_MACRO_SPLIT)
+    pool = scored_pools.get_or_compute(
+        signature,
+        lambda: score_candidates(
+            artifacts, food_pref, cuisine, (calorie_min, calorie_max),
+            macro_split, *weights, exclusions=exclusions
+        ),
+    )
+    if len(pool.positions) == 0:
+        return None
+    return build_weekly_plan(artifacts, pool, daily_calories, macro_split)
+
+
+def _result(targets, i, current_weight, target_weight, plan, catalog_version, signature):
+    """
+    Assemble the response for user ``i`` of ``targets`` around a (possibly
+    shared) plan. The calorie range reported is the window of ``signature``,
+    the one the candidates were actually filtered with.
+    """
+    bmi_val = float(targets["bmi"][i])
+    target_cal = float(targets["target_cal"][i])
+    calorie_range = signature[4:6]
+
+    if plan is None:
         return {
             "meta": {
                 "bmi": round(bmi_val, 2),
-                "bmi_category": bmi_cat,
+                "bmi_category": bmi_category(bmi_val),
                 "target_calories": round(target_cal, 0),
                 "calorie_range": (round(calorie_range[0], 0), round(calorie_range[1], 0))
             },
-            "error": "No recipes match your criteria. Try adjusting preferences."
-        }
-    
-    features = ["calories", "protein", "fat", "carbs"]
-    X_df = filtered_df[features]
-    try:
-        if hasattr(dt_model, "predict_proba"):
-            dt_proba = dt_model.predict_proba(X_df)[:, 1]
-        else:
-            dt_proba = dt_model.predict(X_df).astype(float)
-    except:
-        dt_proba = np.ones(len(filtered_df))
-    
-    filtered_df["health_score"] = dt_proba
-    
-    # We use a fresh scaler to normalize the distances for this subset
-    scaler = StandardScaler()
-    X_scaled_array = scaler.fit_transform(X_df)
-    
-    target_macros = pd.DataFrame([[
-        filtered_df["calories"].mean(),
-        filtered_df["calories"].mean() * macro_split["protein"],
-        filtered_df["calories"].mean() * macro_split["fat"],
-        filtered_df["calories"].mean() * macro_split["carbs"]
-    ]], columns=features)
-    target_macros_scaled = scaler.transform(target_macros)
-    
-    distances = np.linalg.norm(X_scaled_array - target_macros_scaled, axis=1)
-    knn_scores = 1.0 / (1.0 + distances)
-    
-    filtered_df["knn_score"] = knn_scores
-    
-    filtered_indices = filtered_df.index.tolist()
-    
-    # Compute ingredient similarity based on global cosine_sim
-    ingred_similarity = cosine_sim[filtered_indices][:, filtered_indices].mean(axis=1)
-    
-    filtered_df["ingred_score"] = ingred_similarity
-    
-    def normalize_signal(signal):
-        min_val, max_val = signal.min(), signal.max()
-        if max_val == min_val:
-            return np.ones(len(signal))
-        return (signal - min_val) / (max_val - min_val)
-    
-    health_norm = normalize_signal(filtered_df["health_score"].values)
-    knn_norm = normalize_signal(filtered_df["knn_score"].values)
-    ingred_norm = normalize_signal(filtered_df["ingred_score"].values)
-    
-    filtered_df["final_score"] = (
-        w_health * health_norm + 
-        w_macro * knn_norm + 
-        w_ingred * ingred_norm
-    )
-    
-    def get_meals(meal_type_filter, n_meals=3, excluded_indices=None):
-        if excluded_indices is None:
-            excluded_indices = set()
-        
-        meals_data = filtered_df[
-            filtered_df["meal_type"].apply(lambda x: meal_type_filter.lower() in [m.lower() for m in x])
-        ]
-        
-        meals_data = meals_data[~meals_data.index.isin(excluded_indices)]
-        
-        # Sort by final score and get slightly more to allow for daily variation
-        # We'll take top 21 (3 meals * 7 days) if available to pick different ones each day
-        meals_data = meals_data.sort_values("final_score", ascending=False).head(21)
-        
-        if len(meals_data) < n_meals:
-            remaining = filtered_df[~filtered_df.index.isin(excluded_indices | set(meals_data.index))]
-            remaining = remaining.sort_values("final_score", ascending=False).head(21 - len(meals_data))
-            meals_data = pd.concat([meals_data, remaining])
-        
-        return [
-            {
-                "name": row["recipe_name"],
-                "image": row["image_url"], # Changed from image_url to image
-                "calories": round(row["calories"], 1),
-                "protein": round(row["protein"], 1), # Changed from protein_g to protein
-                "fat": round(row["fat"], 1), # Changed from fat_g to fat
-                "carbs": round(row["carbs"], 1), # Changed from carbs_g to carbs
-                "cuisine": ", ".join(row["cuisine_type"]) if row["cuisine_type"] else "Unknown",
-                "ingredients": "\n".join(row["ingredient_lines"]) if row["ingredient_lines"] else "Check recipe details for full ingredient list.",
-                "instructions": f"To view full preparation steps, please visit: {row['url']}" if 'url' in row and row['url'] else "Follow standard preparation steps for this meal type.",
-                "health_score": round(row["health_score"], 3),
-                "macro_score": round(row["knn_score"], 3),
-                "ingredient_score": round(row["ingred_score"], 3),
-                "final_score": round(row["final_score"], 3)
-            }
-            for _, row in meals_data.iterrows()
-        ], set(meals_data.index)
-    
-    # Get pools of meals
-    breakfast_pool, breakfast_indices = get_meals("breakfast", 21, set())
-    lunch_pool, lunch_indices = get_meals("lunch", 21, breakfast_indices)
-    dinner_pool, dinner_indices = get_meals("dinner", 21, breakfast_indices | lunch_indices)
-    
-    # Generate a full weekly plan (7 days) with different food each day
-    days = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
-    weekly_plan = {}
-    
-    for i, day in enumerate(days):
-        # Slice the pools to get different meals for different days
-        # Each day gets 3 unique options from the pool (3 * 7 = 21)
-        start = i * 3
-        end = start + 3
-        
-        weekly_plan[day] = {
-            "breakfast": breakfast_pool[start:end] if i*3 < len(breakfast_pool) else breakfast_pool[:3],
-            "lunch": lunch_pool[start:end] if i*3 < len(lunch_pool) else lunch_pool[:3],
-            "dinner": dinner_pool[start:end] if i*3 < len(dinner_pool) else dinner_pool[:3]
+            "error": NO_MATCHES
         }
 
+    direction = str(targets["direction"][i])
     return {
         "meta": {
             "bmi": round(bmi_val, 2),
-            "bmi_category": bmi_cat,
+            "bmi_category": bmi_category(bmi_val),
             "current_weight": current_weight,
             "target_weight": target_weight,
             "weight_goal": direction.upper(),
             "target_calories": round(target_cal, 0),
             "calorie_range": (round(calorie_range[0], 0), round(calorie_range[1], 0)),
-            "tdee": round(tdee, 0),
-            "macro_split": macro_split
+            "tdee": round(float(targets["tdee"][i]), 0),
+            "macro_split": MACRO_SPLITS.get(direction, DEFAULT_MACRO_SPLIT),
+            "catalog_version": catalog_version
         },
-        "breakfast": breakfast_pool[:3], # Fallback for old code
-        "lunch": lunch_pool[:3],
-        "dinner": dinner_pool[:3],
-        "weekly_plan": weekly_plan
+        **plan
     }
 
 
+def get_recommendations(
+    age, height, current_weight, target_weight, gender="M", 
+    activity_level="moderate", food_pref="both", cuisine="all",
+    kcal_per_kg=110.0, min_daily_cal=1200.0, 
+    max_delta_kcal=900.0, cap_factor=1.5, w_health=0.45, w_macro=0.35, w_ingred=0.20,
+    artifacts=None, allergens=None, excluded_ingredients=None
+):
+    """
+    Weekly meal plan for one user. ``allergens`` (e.g. ``["peanut", "dairy"]``)
+    and ``excluded_ingredients`` remove every recipe whose ingredients
+    mention them; allergens also cover their usual ingredients.
+    """
+    if artifacts is None:
+        artifacts = get_artifacts()
+    if artifacts is None:
+        return {"error": MODELS_NOT_LOADED}
+
+    targets = energy_targets(
+        age, height, current_weight, target_weight, gender, activity_level,
+        kcal_per_kg, min_daily_cal, max_delta_kcal, cap_factor
+    )
+    signature = pool_signature(
+        artifacts.version, food_pref, cuisine, str(targets["direction"][0]),
+        (targets["calorie_min"][0], targets["calorie_max"][0]), (w_health, w_macro, w_ingred),
+        exclusion_terms(allergens, excluded_ingredients),
+    )
+    plan = _plan_for(artifacts, signature, quantize_calories(targets["target_cal"][0]))
+    return _result(targets, 0, current_weight, target_weight, plan, artifacts.version, signature)
+
+
+def get_recommendations_batch(
+    profiles, kcal_per_kg=110.0, min_daily_cal=1200.0,
+    max_delta_kcal=900.0, cap_factor=1.5, w_health=0.45, w_macro=0.35, w_ingred=0.20
+):
+    """
+    Generate recommendations for many users at once.
+
+    ``profiles`` is a sequence of dicts with the keyword arguments of
+    ``get_recommendations`` (``age``, ``height``, ``current_weight``,
+    ``target_weight`` and optionally ``gender``, ``activity_level``,
+    ``food_pref``, ``cuisine``, ``allergens``, ``excluded_ingredients``). Energy targets are computed as arrays across
+    the whole cohort, users whose filters and calorie window are identical
+    are scored once, and the results come back in input order, each equal
+    to what ``get_recommendations`` returns for that profile. Users in the
+    same group share the plan lists, so treat them as read-only.
+
+    Groups use the same signature as the scored-pool cache plus the daily
+    target, both quantized only when ``FOOD_POOL_CALORIE_QUANTUM`` is set,
+    so by default only users with identical windows and targets share a plan.
+    """
+    profiles = list(profiles)
+    if not profiles:
+        return []
+
+    artifacts = get_artifacts()
+    if artifacts is None:
+        return [{"error": MODELS_NOT_LOADED} for _ in profiles]
+
+    def column(key, default=None):
+        return [profile.get(key, default) for profile in profiles]
+
+    targets = energy_targets(
+        column("age"), column("height"), column("current_weight"), column("target_weight"),
+        column("gender", "M"), column("activity_level", "moderate"),
+        kcal_per_kg, min_daily_cal, max_delta_kcal, cap_factor
+    )
+
+    weights = (w_health, w_macro, w_ingred)
+    groups = defaultdict(list)
+    for i, profile in enumerate(profiles):
+        signature = pool_signature(
+            artifacts.version,
+            profile.get("food_pref", "both"),
+            profile.get("cuisine", "all"),
+            str(targets["direction"][i]),
+            (targets["calorie_min"][i], targets["calorie_max"][i]),
+            weights,
+            exclusion_terms(profile.get("allergens"), profile.get("excluded_ingredients")),
+        )
+        groups[(signature, quantize_calories(targets["target_cal"][i]))].append(i)
+
+    results = [None] * len(profiles)
+    for (signature, daily_calories), members in groups.items():
+        plan = _plan_for(artifacts, signature, daily_calories)
+        for i in members:
+            results[i] = _result(
+                targets, i, profiles[i]["current_weight"], profiles[i]["target_weight"], plan, artifacts.version,
+                signature,
+            )
+    return results
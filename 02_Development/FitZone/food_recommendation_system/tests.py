@@ -1,3 +1,914 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from .artifacts import (
+    build_filter_indexes,
+    build_ingredient_vectors,
+    current_version,
+    from_dataframe,
+    get_artifacts,
+    load_version,
+    publish,
+    reset_artifacts,
+    verify_checksums,
+    write_artifacts,
+)
+from fitness_plan.models import ClientFitnessProfile
+from membership.models import MembershipPlan, UserMembership
+
+from .benchmark import benchmark_size, daily_calorie_deviation, synthesize_catalog
+from .catalog_builder import build_artifacts, clean_recipes
+from .ingredient_index import IngredientIndex, exclusion_terms, split_terms, unmatched_terms
+from . import jobs, macro_index, pool_cache, recipe_store
+from .jobs import requeue_stale_jobs, run_plan_job
+from .utils import resolve_meal_plans, save_recommendations
+from .models import DailyMealPlan, FoodRecommendation, MealPlanJob, Recipe, RecipeCatalog
+from .plan_optimizer import arrange_week, daily_deviation, daily_macro_targets
+from .pool_cache import ScoredPoolCache, pool_signature, scored_pools
+from .recommendation_engine import (
+    build_weekly_plan,
+    get_recommendations,
+    get_recommendations_batch,
+    label_mask,
+    macro_distances,
+    score_candidates,
+    top_by_score,
+)
+from .worker_memory import memory_report, preload_artifacts, worker_pids
+
+
+def make_catalog(n=400, seed=0):
+    """Small synthetic catalog with the columns produced by the training notebook."""
+    rng = np.random.default_rng(seed)
+    cuisines = ['american', 'Asian', 'indian', 'Italian']
+    meal_types = ['breakfast', 'lunch/dinner', 'snack']
+    words = ['chicken', 'rice', 'egg', 'milk', 'peanut', 'flour', 'tomato', 'tofu', 'oats', 'beef']
+    calories = rng.gamma(4, 130, size=n)
+    df = pd.DataFrame({
+        'recipe_name': [f'Recipe {i}' for i in range(n)],
+        'image_url': [f'https://example.com/{i}.jpg' for i in range(n)],
+        'url': [f'https://example.com/r/{i}' if i % 4 else '' for i in range(n)],
+        'calories': calories,
+        'protein': rng.uniform(0.1, 0.4, size=n) * calories / 4,
+        'fat': rng.uniform(0.1, 0.4, size=n) * calories / 9,
+        'carbs': rng.uniform(0.2, 0.6, size=n) * calories / 4,
+        'food_type': rng.choice(['veg', 'non-veg'], size=n),
+        'cuisine_type': [list(rng.choice(cuisines, size=rng.integers(0, 3), replace=False)) for _ in range(n)],
+        'meal_type': [list(rng.choice(meal_types, size=rng.integers(1, 3), replace=False)) for _ in range(n)],
+        'ingredient_lines': [[f'1 cup {w}' for w in rng.choice(words, size=3, replace=False)] for _ in range(n)],
+    })
+    features = df[['calories', 'protein', 'fat', 'carbs']]
+    labels = (df['protein'] * 4 / df['calories'] > 0.25).astype(int)
+    dt_model = DecisionTreeClassifier(max_depth=4, random_state=0).fit(features, labels)
+    return from_dataframe('test', df, dt_model)
+
+
+PROFILES = [
+    {'age': 25, 'height': 175, 'current_weight': 80, 'target_weight': 70, 'gender': 'M',
+     'activity_level': 'moderate', 'food_pref': 'both', 'cuisine': 'all'},
+    {'age': 30, 'height': 160, 'current_weight': 55, 'target_weight': 60, 'gender': 'F',
+     'activity_level': 'light', 'food_pref': 'veg', 'cuisine': 'indian'},
+    {'age': 35, 'height': 165, 'current_weight': 65, 'target_weight': 55, 'gender': 'F',
+     'activity_level': 'moderate', 'food_pref': 'non-veg', 'cuisine': 'thai'},
+]
+
+
+class FilterIndexTests(TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'food_type': ['veg', 'non-veg', 'veg'],
+            'cuisine_type': [['Indian'], ['italian', 'French'], []],
+            'meal_type': [['breakfast'], ['Lunch/Dinner'], ['breakfast', 'snack']],
+            'calories': [300.0, 550.0, 420.0],
+        })
+
+    def test_list_labels_are_matched_case_insensitively(self):
+        indexes = build_filter_indexes(self.df)
+
+        np.testing.assert_array_equal(label_mask(indexes, 'cuisine', 'french'), [False, True, False])
+        np.testing.assert_array_equal(label_mask(indexes, 'meal_type', 'breakfast'), [True, False, True])
+        np.testing.assert_array_equal(label_mask(indexes, 'food_type', 'veg'), [True, False, True])
+
+    def test_unknown_label_matches_nothing(self):
+        indexes = build_filter_indexes(self.df)
+
+        self.assertFalse(label_mask(indexes, 'cuisine', 'thai').any())
+
+
+class IngredientVectorTests(TestCase):
+    def test_centroid_product_matches_dense_mean_similarity(self):
+        df = pd.DataFrame({'ingredient_lines': [
+            ['1 cup rice', '2 eggs'],
+            ['200 g chicken', '1 cup rice'],
+            ['1 tbsp peanut butter'],
+            [],
+        ]})
+        vectors = build_ingredient_vectors(df)
+        dense = (vectors @ vectors.T).toarray()
+        candidates = np.array([0, 1, 3])
+
+        candidate_vectors = vectors[candidates]
+        centroid = np.asarray(candidate_vectors.mean(axis=0)).ravel()
+
+        np.testing.assert_allclose(
+            candidate_vectors @ centroid,
+            dense[candidates][:, candidates].mean(axis=1),
+        )
+        self.assertIsNotNone(build_ingredient_vectors(df, cosine_sim=dense))
+
+    def test_mismatched_dense_matrix_is_rejected(self):
+        df = pd.DataFrame({'ingredient_lines': [['rice'], ['chicken']]})
+
+        self.assertIsNone(build_ingredient_vectors(df, cosine_sim=np.ones((2, 2))))
+
+
+class ArtifactLayoutTests(TestCase):
+    def test_written_version_round_trips_through_mmap(self):
+        df = pd.DataFrame({
+            'recipe_name': ['Oats', 'Chicken rice'],
+            'food_type': ['veg', 'non-veg'],
+            'cuisine_type': [['American'], ['asian']],
+            'meal_type': [['breakfast'], ['lunch/dinner']],
+            'ingredient_lines': [['1 cup oats'], ['200 g chicken', '1 cup rice']],
+            'calories': [320.0, 610.0],
+            'protein': [12.0, 45.0],
+            'fat': [6.0, 14.0],
+            'carbs': [54.0, 70.0],
+        })
+        artifacts = from_dataframe('v1', df, dt_model=None)
+
+        with tempfile.TemporaryDirectory() as root:
+            write_artifacts(artifacts, root=root)
+            self.assertIsNone(current_version(root))
+            publish('v1', root=root)
+            self.assertEqual(current_version(root), 'v1')
+
+            loaded = load_version('v1', root=root)
+
+            self.assertIsInstance(loaded.numeric['calories'], np.memmap)
+            np.testing.assert_array_equal(loaded.filter_indexes['cuisine']['asian'], [False, True])
+            np.testing.assert_allclose(loaded.ingredient_vectors.toarray(), artifacts.ingredient_vectors.toarray())
+            self.assertEqual(loaded.columns['recipe_name'][1], 'Chicken rice')
+            self.assertEqual(loaded.numeric['protein'][1], 45.0)
+
+
+@mock.patch('food_recommendation_system.recommendation_engine.get_artifacts')
+class BatchRecommendationTests(TestCase):
+    def setUp(self):
+        scored_pools.clear()
+
+    def test_repeat_request_reuses_scored_pool(self, get_artifacts):
+        get_artifacts.return_value = make_catalog()
+
+        first = get_recommendations(**PROFILES[0])
+        second = get_recommendations(**PROFILES[0])
+
+        self.assertEqual(first, second)
+        self.assertEqual(scored_pools.stats()['misses'], 1)
+        self.assertEqual(scored_pools.stats()['hits'], 1)
+
+    def test_batch_matches_individual_calls(self, get_artifacts):
+        get_artifacts.return_value = make_catalog()
+        profiles = PROFILES + PROFILES[:1]
+
+        batch = get_recommendations_batch(profiles)
+
+        self.assertEqual(batch, [get_recommendations(**profile) for profile in profiles])
+        self.assertIn('error', batch[2])
+
+    def test_command_regenerates_plans_for_active_members(self, get_artifacts):
+        get_artifacts.return_value = make_catalog()
+        plan = MembershipPlan.objects.create(price=10, duration='1M', feature_1='AI plans', feature_2='Chat')
+        for i, profile in enumerate(PROFILES):
+            user = User.objects.create_user(username=f'member{i}', password='Pass1234')
+            UserMembership.objects.create(user=user, membership_plan=plan, end_date=timezone.now() + timedelta(days=5))
+            FoodRecommendation.objects.create(
+                user=user, bmi=0, bmi_category='normal', target_calories=0, tdee=0, **profile
+            )
+
+        call_command('regenerate_meal_plans', stdout=mock.MagicMock())
+
+        self.assertEqual(FoodRecommendation.objects.count(), 5)
+        self.assertEqual(DailyMealPlan.objects.count(), 14)
+
+
+@mock.patch('food_recommendation_system.recommendation_engine.get_artifacts')
+class PlanJobTests(TestCase):
+    def setUp(self):
+        scored_pools.clear()
+        plan = MembershipPlan.objects.create(price=10, duration='1M', feature_1='AI plans', feature_2='Chat')
+        self.user = User.objects.create_user(username='member', password='Pass1234')
+        UserMembership.objects.create(user=self.user, membership_plan=plan, end_date=timezone.now() + timedelta(days=5))
+        self.client.login(username='member', password='Pass1234')
+
+    def submit(self, profile):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('food_recommendation_system:input'), profile)
+        return response, callbacks
+
+    def test_submit_returns_immediately_and_plan_appears_when_done(self, get_artifacts):
+        get_artifacts.return_value = make_catalog()
+
+        response, callbacks = self.submit(PROFILES[0])
+
+        job = MealPlanJob.objects.get()
+        input_url = reverse('food_recommendation_system:input')
+        status_url = reverse('food_recommendation_system:job_status', args=[job.id])
+        self.assertRedirects(response, f'{input_url}?job={job.id}', fetch_redirect_response=False)
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(FoodRecommendation.objects.count(), 0)
+        self.assertEqual(self.client.get(status_url).json()['status'], 'pending')
+
+        self.assertTrue(run_plan_job(job.id))
+        self.assertFalse(run_plan_job(job.id))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(DailyMealPlan.objects.filter(recommendations_record=job.recommendation).count(), 7)
+        plan_url = reverse('food_recommendation_system:view_plan', args=[job.recommendation_id])
+        self.assertEqual(self.client.get(status_url).json()['plan_url'], plan_url)
+        self.assertRedirects(self.client.get(f'{input_url}?job={job.id}'), plan_url, fetch_redirect_response=False)
+
+    def test_resubmitting_while_pending_reuses_the_job(self, get_artifacts):
+        self.submit(PROFILES[0])
+        response, callbacks = self.submit(PROFILES[0])
+
+        self.assertEqual(MealPlanJob.objects.count(), 1)
+        self.assertEqual(len(callbacks), 0)
+
+    def test_engine_error_fails_the_job(self, get_artifacts):
+        get_artifacts.return_value = make_catalog()
+        self.submit(PROFILES[2])
+        job = MealPlanJob.objects.get()
+
+        run_plan_job(job.id)
+
+        data = self.client.get(reverse('food_recommendation_system:job_status', args=[job.id])).json()
+        self.assertEqual(data['status'], 'failed')
+        self.assertIn('No recipes match', data['error'])
+
+    def test_stale_running_jobs_are_requeued_and_processed(self, get_artifacts):
+        get_artifacts.return_value = make_catalog()
+        job = MealPlanJob.objects.create(
+            user=self.user, inputs=PROFILES[0], status='running',
+            started_at=timezone.now() - timedelta(minutes=10),
+        )
+
+        self.assertEqual(requeue_stale_jobs(60), 1)
+        call_command('process_meal_plan_jobs', stdout=mock.MagicMock())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+
+    def test_runner_that_lost_its_claim_saves_nothing(self, get_artifacts):
+        get_artifacts.return_value = make_catalog()
+        job = MealPlanJob.objects.create(user=self.user, inputs=PROFILES[0])
+        real_get_recommendations = jobs.get_recommendations
+        overtaken = []
+
+        def slow_first_run(**inputs):
+            # While the first runner works, the job is re-queued as stale and run again
+            if not overtaken:
+                overtaken.append(True)
+                self.assertEqual(requeue_stale_jobs(-60), 1)
+                self.assertTrue(run_plan_job(job.id))
+            return real_get_recommendations(**inputs)
+
+        with mock.patch.object(jobs, 'get_recommendations', side_effect=slow_first_run):
+            self.assertFalse(run_plan_job(job.id))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(FoodRecommendation.objects.count(), 1)
+        self.assertEqual(job.recommendation, FoodRecommendation.objects.get())
+
+
+class CompactMealPlanTests(TestCase):
+    def setUp(self):
+        scored_pools.clear()
+        self.artifacts = make_catalog()
+        for target in ('recommendation_engine', 'artifacts', 'utils'):
+            patcher = mock.patch(f'food_recommendation_system.{target}.get_artifacts', return_value=self.artifacts)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        plan = MembershipPlan.objects.create(price=10, duration='1M', feature_1='AI plans', feature_2='Chat')
+        self.user = User.objects.create_user(username='member', password='Pass1234')
+        UserMembership.objects.create(user=self.user, membership_plan=plan, end_date=timezone.now() + timedelta(days=5))
+        self.client.login(username='member', password='Pass1234')
+
+    def test_plans_store_ids_and_render_full_meals(self):
+        result = get_recommendations(**PROFILES[0])
+        rec = save_recommendations([(self.user, PROFILES[0], result)])[0]
+
+        stored = DailyMealPlan.objects.get(recommendations_record=rec, day_of_week='Monday')
+        self.assertIsNone(stored.breakfast_options)
+        self.assertEqual(len(stored.meals['breakfast'][0]), 5)
+        self.assertEqual(rec.catalog_version, 'test')
+
+        response = self.client.get(reverse('food_recommendation_system:view_plan', args=[rec.id]))
+        monday = next(plan for plan in response.context['plans'] if plan.day_of_week == 'Monday')
+        self.assertEqual(monday.breakfast_options, result['weekly_plan']['Monday']['breakfast'])
+        self.assertEqual(monday.dinner_options, result['weekly_plan']['Monday']['dinner'])
+        self.assertFalse(response.context['catalog_missing'])
+
+    def test_identical_inputs_reuse_the_latest_recommendation(self):
+        rec = save_recommendations([(self.user, PROFILES[0], get_recommendations(**PROFILES[0]))])[0]
+
+        response = self.client.post(reverse('food_recommendation_system:input'), PROFILES[0])
+
+        self.assertRedirects(
+            response, reverse('food_recommendation_system:view_plan', args=[rec.id]), fetch_redirect_response=False
+        )
+        self.assertEqual(MealPlanJob.objects.count(), 0)
+
+        changed = dict(PROFILES[0], target_weight=72)
+        self.client.post(reverse('food_recommendation_system:input'), changed)
+        self.assertEqual(MealPlanJob.objects.count(), 1)
+
+    def test_plans_from_a_missing_catalog_version_render_empty(self):
+        rec = save_recommendations([(self.user, PROFILES[0], get_recommendations(**PROFILES[0]))])[0]
+        rec.catalog_version = 'retired'
+        plans = list(rec.meal_plans.all())
+
+        self.assertFalse(resolve_meal_plans(rec, plans))
+        self.assertEqual(plans[0].lunch_options, [])
+
+    def test_plans_from_the_legacy_pickle_store_full_meals(self):
+        self.artifacts.version = 'legacy-1700000000000000000'
+        result = get_recommendations(**PROFILES[0])
+        rec = save_recommendations([(self.user, PROFILES[0], result)])[0]
+
+        stored = DailyMealPlan.objects.get(recommendations_record=rec, day_of_week='Monday')
+        self.assertIsNone(stored.meals)
+        self.assertEqual(stored.lunch_options, result['weekly_plan']['Monday']['lunch'])
+
+        # Exporting or touching food_models.pkl retires that version
+        self.artifacts.version = 'legacy-1800000000000000000'
+        response = self.client.get(reverse('food_recommendation_system:view_plan', args=[rec.id]))
+        monday = next(plan for plan in response.context['plans'] if plan.day_of_week == 'Monday')
+        self.assertEqual(monday.dinner_options, result['weekly_plan']['Monday']['dinner'])
+        self.assertFalse(response.context['catalog_missing'])
+
+
+class PublishedVersionPlanTests(TestCase):
+    def setUp(self):
+        scored_pools.clear()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        patcher = mock.patch('food_recommendation_system.artifacts.ARTIFACTS_DIR', self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reset_artifacts()
+        self.addCleanup(reset_artifacts)
+        self.user = User.objects.create_user(username='member', password='Pass1234')
+
+    def publish_catalog(self, version, seed):
+        catalog = make_catalog(seed=seed)
+        catalog.version = version
+        write_artifacts(catalog, root=self.root)
+        publish(version, root=self.root)
+        reset_artifacts()
+
+    def test_plans_still_render_after_a_new_version_is_published(self):
+        self.publish_catalog('v1', seed=0)
+        result = get_recommendations(**PROFILES[0])
+        rec = save_recommendations([(self.user, PROFILES[0], result)])[0]
+        self.assertEqual(rec.catalog_version, 'v1')
+
+        self.publish_catalog('v2', seed=1)
+        self.assertEqual(get_artifacts().version, 'v2')
+
+        plans = list(rec.meal_plans.all())
+        self.assertTrue(resolve_meal_plans(rec, plans))
+        monday = next(plan for plan in plans if plan.day_of_week == 'Monday')
+        self.assertEqual(monday.breakfast_options, result['weekly_plan']['Monday']['breakfast'])
+        self.assertEqual(monday.lunch_options, result['weekly_plan']['Monday']['lunch'])
+
+
+class RecipeStoreTests(TestCase):
+    def setUp(self):
+        scored_pools.clear()
+        recipe_store._catalog_ids.clear()
+        self.addCleanup(recipe_store._catalog_ids.clear)
+        self.artifacts = make_catalog()
+
+    def test_import_normalizes_labels(self):
+        catalog = recipe_store.import_catalog(self.artifacts, batch_size=150)
+
+        self.assertIsNotNone(catalog.completed_at)
+        self.assertEqual(Recipe.objects.filter(catalog=catalog).count(), 400)
+        recipe = Recipe.objects.get(catalog=catalog, position=7)
+        self.assertEqual(
+            sorted(recipe.cuisines.values_list('name', flat=True)),
+            sorted(label.lower() for label in self.artifacts.columns['cuisine_type'][7]),
+        )
+        self.assertEqual(recipe.calories, self.artifacts.numeric['calories'][7])
+        with self.assertRaises(ValueError):
+            recipe_store.import_catalog(self.artifacts)
+
+    def test_import_keeps_long_urls_and_missing_ingredients(self):
+        long_url = 'https://edamam-product-images.s3.amazonaws.com/web-img/a.jpg?' + 'X-Amz-Signature=f' * 60
+        columns = {name: column.copy() for name, column in self.artifacts.columns.items()}
+        columns['image_url'][3] = long_url
+        columns['ingredient_lines'][4] = None
+        self.artifacts.columns = columns
+
+        catalog = recipe_store.import_catalog(self.artifacts)
+
+        self.assertGreater(len(long_url), 500)
+        self.assertEqual(Recipe.objects.get(catalog=catalog, position=3).image_url, long_url)
+        self.assertEqual(Recipe.objects.get(catalog=catalog, position=4).ingredient_lines, [])
+
+    def test_sql_prefilter_matches_in_memory_filters(self):
+        expected = [
+            score_candidates(self.artifacts, pref, cuisine, (300.0, 700.0), {'protein': 0.3, 'fat': 0.3, 'carbs': 0.4})
+            for pref, cuisine in [('both', 'all'), ('veg', 'Indian'), ('non-veg', 'thai')]
+        ]
+        self.assertIsNone(recipe_store.sql_candidates('test', 'both', 'all', (300.0, 700.0)))
+        recipe_store.import_catalog(self.artifacts)
+
+        with mock.patch('food_recommendation_system.recommendation_engine.SQL_PREFILTER', True), \
+                mock.patch('food_recommendation_system.recommendation_engine.MACRO_INDEX_ENABLED', True), \
+                mock.patch('food_recommendation_system.recommendation_engine.MACRO_INDEX_MIN_RECIPES', 0):
+            for (pref, cuisine), pool in zip([('both', 'all'), ('veg', 'Indian'), ('non-veg', 'thai')], expected):
+                from_sql = score_candidates(
+                    self.artifacts, pref, cuisine, (300.0, 700.0), {'protein': 0.3, 'fat': 0.3, 'carbs': 0.4}
+                )
+                for actual, wanted in zip(from_sql, pool):
+                    np.testing.assert_array_equal(actual, wanted)
+
+    def test_interrupted_import_is_not_used(self):
+        RecipeCatalog.objects.create(version='test', recipe_count=400)
+
+        self.assertIsNone(recipe_store.catalog_id('test'))
+        with mock.patch(
+            'food_recommendation_system.management.commands.import_recipe_catalog.get_artifacts',
+            return_value=self.artifacts,
+        ):
+            call_command('import_recipe_catalog', stdout=mock.MagicMock())
+
+        self.assertEqual(RecipeCatalog.objects.get().recipe_count, 400)
+        self.assertIsNotNone(recipe_store.catalog_id('test'))
+
+
+class IngredientExclusionTests(TestCase):
+    def setUp(self):
+        scored_pools.clear()
+
+    def test_terms_fold_plurals_and_expand_allergens(self):
+        self.assertEqual(split_terms('Peanuts, shellfish and dairy'), ['peanuts', 'shellfish', 'dairy'])
+        terms = exclusion_terms(['Peanuts', 'dairy'], ['Green Chillies'])
+
+        self.assertIn(('peanut',), terms)
+        self.assertIn(('milk',), terms)
+        self.assertIn(('chilli', 'green'), terms)
+        self.assertEqual(exclusion_terms(excluded_ingredients=['chilli']), (('chilli',),))
+
+    def test_allergy_phrases_are_stripped_to_the_allergen(self):
+        self.assertEqual(exclusion_terms(['lactose intolerant']), exclusion_terms(['dairy']))
+        self.assertEqual(exclusion_terms(['Egg allergy']), exclusion_terms(['eggs']))
+        self.assertEqual(exclusion_terms(['gluten-free']), exclusion_terms(['gluten']))
+        self.assertEqual(exclusion_terms(excluded_ingredients=['allergic to peanuts']), (('peanut',),))
+
+    def test_excluded_words_match_plurals_and_compounds(self):
+        index = IngredientIndex.build([
+            ['1 cup buttermilk'],
+            ['100 g mozzarella', '2 tbsp parmesan'],
+            ['2 chillies', '1 onion'],
+            ['1 cup berries'],
+            ['1 cup rice'],
+        ])
+
+        np.testing.assert_array_equal(
+            index.exclusion_mask(exclusion_terms(['dairy'])), [True, True, False, False, False]
+        )
+        np.testing.assert_array_equal(
+            index.exclusion_mask(exclusion_terms(excluded_ingredients=['chilli'])), [False, False, True, False, False]
+        )
+        np.testing.assert_array_equal(
+            index.exclusion_mask(exclusion_terms(excluded_ingredients=['berry'])), [False, False, False, True, False]
+        )
+
+    def test_words_do_not_match_inside_other_words(self):
+        index = IngredientIndex.build([
+            ['1 teaspoon salt', '1 tablespoon oil'],
+            ['1 eggplant', '2 tomatoes'],
+            ['1 cup chickpeas', '2 pears'],
+            ['4 graham crackers', '1 tsp nutmeg'],
+            ['50 g licorice', '1 coconut'],
+        ])
+
+        for allergens, ingredients in [
+            ([], ['tea']), (['egg'], []), ([], ['pea']), ([], ['ham']), ([], ['rice']),
+            ([], ['nut']), (['tree nuts'], []),
+        ]:
+            with self.subTest(allergens=allergens, ingredients=ingredients):
+                self.assertFalse(index.exclusion_mask(exclusion_terms(allergens, ingredients)).any())
+
+        # Measurement words are never excluded on their own
+        self.assertEqual(exclusion_terms(excluded_ingredients=['cup', '1 tbsp milk']), (('milk',),))
+        self.assertEqual(unmatched_terms(index, excluded_ingredients=['cups']), ['cups'])
+
+    def test_entries_that_match_no_ingredient_are_reported(self):
+        index = IngredientIndex.build([['2 eggs', '1 cup milk'], ['1 cup rice']])
+
+        self.assertEqual(
+            unmatched_terms(index, ['egg allergy', 'nightshades', 'allergic'], ['milk', 'saffron']),
+            ['nightshades', 'allergic', 'saffron'],
+        )
+        self.assertEqual(unmatched_terms(index), [])
+
+    def test_index_matches_every_token_of_a_term(self):
+        index = IngredientIndex.build([
+            ['2 eggs', '1 cup milk'],
+            ['1 tbsp peanut butter'],
+            ['200 g tofu'],
+            ['2 tbsp butter', '1 cup peanuts'],
+        ])
+
+        np.testing.assert_array_equal(index.exclusion_mask((('egg',),)), [True, False, False, False])
+        # Butter and peanuts on separate lines are not peanut butter
+        np.testing.assert_array_equal(index.exclusion_mask((('butter', 'peanut'),)), [False, True, False, False])
+        self.assertIsNone(index.exclusion_mask(()))
+        self.assertFalse(index.exclusion_mask((('saffron',),)).any())
+
+    @mock.patch('food_recommendation_system.recommendation_engine.get_artifacts')
+    def test_plans_leave_out_excluded_ingredients(self, get_artifacts):
+        get_artifacts.return_value = make_catalog()
+
+        result = get_recommendations(**PROFILES[0], allergens=['dairy'], excluded_ingredients=['peanuts'])
+
+        meals = [meal for day in result['weekly_plan'].values() for options in day.values() for meal in options]
+        self.assertTrue(meals)
+        for meal in meals:
+            self.assertNotIn('milk', meal['ingredients'])
+            self.assertNotIn('peanut', meal['ingredients'])
+        self.assertEqual(result, get_recommendations_batch([
+            dict(PROFILES[0], allergens=['dairy'], excluded_ingredients=['peanuts'])
+        ])[0])
+        self.assertNotEqual(result, get_recommendations(**PROFILES[0]))
+
+    def test_index_is_stored_with_the_version(self):
+        artifacts = make_catalog()
+
+        with tempfile.TemporaryDirectory() as root:
+            write_artifacts(artifacts, root=root)
+            loaded = load_version('test', root=root)
+
+            self.assertIsInstance(loaded.ingredient_index.indices, np.memmap)
+            terms = exclusion_terms(['egg', 'nuts'])
+            np.testing.assert_array_equal(
+                loaded.ingredient_index.exclusion_mask(terms), artifacts.ingredient_index.exclusion_mask(terms)
+            )
+
+    @mock.patch('food_recommendation_system.recommendation_engine.get_artifacts')
+    def test_form_defaults_to_fitness_profile_allergies(self, get_artifacts):
+        get_artifacts.return_value = make_catalog()
+        plan = MembershipPlan.objects.create(price=10, duration='1M', feature_1='AI plans', feature_2='Chat')
+        user = User.objects.create_user(username='member', password='Pass1234')
+        UserMembership.objects.create(user=user, membership_plan=plan, end_date=timezone.now() + timedelta(days=5))
+        ClientFitnessProfile.objects.create(user=user, height_cm=175, weight_kg=80, age=25, allergies='Peanuts, eggs')
+        self.client.login(username='member', password='Pass1234')
+
+        response = self.client.get(reverse('food_recommendation_system:input'))
+        self.assertEqual(response.context['allergies'], 'Peanuts, eggs')
+
+        self.client.post(reverse('food_recommendation_system:input'), PROFILES[0])
+        self.assertEqual(MealPlanJob.objects.get().inputs['allergens'], ['peanuts', 'eggs'])
+
+    @mock.patch('food_recommendation_system.recommendation_engine.get_artifacts')
+    def test_plan_page_warns_about_unmatched_allergies(self, get_artifacts):
+        artifacts = make_catalog()
+        get_artifacts.return_value = artifacts
+        plan = MembershipPlan.objects.create(price=10, duration='1M', feature_1='AI plans', feature_2='Chat')
+        user = User.objects.create_user(username='member', password='Pass1234')
+        UserMembership.objects.create(user=user, membership_plan=plan, end_date=timezone.now() + timedelta(days=5))
+        self.client.login(username='member', password='Pass1234')
+        profile = dict(PROFILES[0], allergens=['lactose intolerant', 'kiwi'], excluded_ingredients=['beef'])
+        rec = save_recommendations([(user, profile, get_recommendations(**profile))])[0]
+
+        with mock.patch('food_recommendation_system.utils.get_artifacts_version', return_value=artifacts):
+            response = self.client.get(reverse('food_recommendation_system:view_plan', args=[rec.id]))
+
+        self.assertEqual(response.context['unmatched_exclusions'], ['kiwi'])
+        self.assertContains(response, 'No ingredient in our recipes matched kiwi')
+
+
+class PlanOptimizerTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.targets = daily_macro_targets(2100.0, {'protein': 0.3, 'fat': 0.3, 'carbs': 0.4})
+        self.pools = []
+        for _ in range(3):
+            calories = rng.uniform(450, 1050, size=21)
+            shares = rng.dirichlet([4, 5, 8], size=21)
+            self.pools.append(np.column_stack([calories, calories * shares[:, 0] / 4,
+                                               calories * shares[:, 1] / 9, calories * shares[:, 2] / 4]))
+
+    def test_every_recipe_is_used_once_and_days_move_toward_the_target(self):
+        triples = arrange_week(*self.pools, self.targets, n_triples=21)
+
+        for meal in range(3):
+            self.assertEqual(sorted(triple[meal] for triple in triples), list(range(21)))
+        sliced = [(i, i, i) for i in range(21)]
+        self.assertLess(
+            daily_deviation(*self.pools, triples, self.targets),
+            0.6 * daily_deviation(*self.pools, sliced, self.targets),
+        )
+
+    def test_weekly_plan_keeps_the_pools_and_arranges_the_days(self):
+        artifacts = make_catalog(n=1500)
+        split = {'protein': 0.3, 'fat': 0.3, 'carbs': 0.4}
+        pool = score_candidates(artifacts, 'both', 'all', (400.0, 1000.0), split)
+
+        sliced = build_weekly_plan(artifacts, pool)
+        arranged = build_weekly_plan(artifacts, pool, 2100.0, split)
+
+        def week(plan, meal):
+            return sorted(option['id'] for day in plan['weekly_plan'].values() for option in day[meal])
+
+        for meal in ('breakfast', 'lunch', 'dinner'):
+            self.assertEqual(week(arranged, meal), week(sliced, meal))
+            self.assertEqual(arranged[meal], sliced[meal])
+        meta = {'meta': {'target_calories': 2100.0}}
+        self.assertLess(
+            daily_calorie_deviation([dict(meta, **arranged)]), daily_calorie_deviation([dict(meta, **sliced)])
+        )
+
+
+class ScoredPoolCacheTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = ScoredPoolCache(maxsize=2, ttl=60, clock=lambda: self.now)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_entries_expire_after_ttl(self):
+        self.cache.set('a', 1)
+        self.now = 61
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_entries_are_evicted_to_stay_within_the_byte_budget(self):
+        cache = ScoredPoolCache(maxsize=10, ttl=60, maxbytes=2000)
+        cache.set('a', (np.zeros(100), np.zeros(100)))
+        cache.set('b', (np.zeros(100),))
+        cache.set('huge', (np.zeros(1000),))
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('b'))
+        self.assertIsNone(cache.get('huge'))
+        self.assertEqual(cache.stats()['bytes'], 800)
+
+    def test_signature_keeps_the_exact_calorie_window_by_default(self):
+        weights = (0.45, 0.35, 0.20)
+        near = pool_signature('v1', 'Veg', 'Indian', 'loss', (421.2, 688.9), weights)
+
+        self.assertEqual(near, pool_signature('v1', 'veg', 'indian', 'loss', (421.2, 688.9), weights))
+        self.assertNotEqual(near, pool_signature('v1', 'veg', 'indian', 'loss', (418.7, 691.3), weights))
+        self.assertNotEqual(near, pool_signature('v2', 'veg', 'indian', 'loss', (421.2, 688.9), weights))
+
+    @mock.patch.object(pool_cache, 'CALORIE_QUANTUM', 10.0)
+    def test_signature_quantizes_calorie_window_when_configured(self):
+        weights = (0.45, 0.35, 0.20)
+        near = pool_signature('v1', 'Veg', 'Indian', 'loss', (421.2, 688.9), weights)
+        same = pool_signature('v1', 'veg', 'indian', 'loss', (418.7, 691.3), weights)
+
+        self.assertEqual(near, same)
+        self.assertEqual(near[4:6], (420.0, 690.0))
+
+    @mock.patch('food_recommendation_system.recommendation_engine.get_artifacts')
+    def test_plans_stay_within_the_reported_calorie_range(self, get_artifacts):
+        get_artifacts.return_value = make_catalog()
+        profile = dict(PROFILES[0], current_weight=81.3)
+
+        for quantum in (0.0, 10.0):
+            scored_pools.clear()
+            with mock.patch.object(pool_cache, 'CALORIE_QUANTUM', quantum):
+                result = get_recommendations(**profile)
+            low, high = result['meta']['calorie_range']
+            for day in result['weekly_plan'].values():
+                for meal in day.values():
+                    for recipe in meal:
+                        self.assertTrue(low - 0.5 <= recipe['calories'] <= high + 0.5, (quantum, recipe['calories']))
+
+        # By default a near-identical member cached first does not change the plan
+        scored_pools.clear()
+        cold = get_recommendations(**profile)
+        scored_pools.clear()
+        get_recommendations(**dict(profile, current_weight=81.4))
+        self.assertEqual(get_recommendations(**profile), cold)
+
+
+class ScoringKernelTests(TestCase):
+    def test_macro_distances_match_standard_scaler(self):
+        rng = np.random.default_rng(1)
+        X = np.column_stack([rng.gamma(4, 130, 500), rng.uniform(5, 60, 500), np.full(500, 12.5), rng.uniform(10, 90, 500)])
+        target = np.array([[520.0, 40.0, 15.0, 50.0]])
+
+        scaler = StandardScaler()
+        expected = np.linalg.norm(scaler.fit_transform(X) - scaler.transform(target), axis=1)
+
+        np.testing.assert_array_equal(macro_distances(X, target), expected)
+
+    def test_top_by_score_orders_best_first_with_ties_in_catalog_order(self):
+        scores = np.array([0.2, 0.9, 0.5, 0.9, 0.1, 0.5])
+
+        np.testing.assert_array_equal(top_by_score(np.arange(6), scores, 4), [1, 3, 2, 5])
+        np.testing.assert_array_equal(top_by_score(np.array([0, 4]), scores, 4), [0, 4])
+
+
+class MacroIndexTests(TestCase):
+    def setUp(self):
+        scored_pools.clear()
+
+    def brute_force(self, artifacts, target, k, calorie_range, food_type, meal_type, cuisine):
+        index = artifacts.macro_index
+        calories = artifacts.filter_indexes['calories']
+        mask = (calories >= calorie_range[0]) & (calories <= calorie_range[1])
+        mask &= label_mask(artifacts.filter_indexes, 'food_type', food_type)
+        mask &= label_mask(artifacts.filter_indexes, 'meal_type', meal_type)
+        if cuisine is not None:
+            mask &= label_mask(artifacts.filter_indexes, 'cuisine', cuisine)
+        positions = np.flatnonzero(mask)
+        distances = np.linalg.norm(index.points[positions] - index.standardize(target), axis=1)
+        order = np.lexsort((positions, distances))[:k]
+        return positions[order], distances[order]
+
+    def test_nearest_matches_a_filtered_scan(self):
+        artifacts = make_catalog(n=3000)
+        calories = artifacts.filter_indexes['calories']
+        veg = artifacts.filter_indexes['food_type']['veg']
+        calorie_range = (300.0, 700.0)
+
+        def accept(positions):
+            return (calories[positions] >= 300.0) & (calories[positions] <= 700.0) & veg[positions]
+
+        with mock.patch.object(macro_index, 'BAND_SIZE', 128):
+            for cuisine in (None, 'indian'):
+                found, distances = artifacts.macro_index.nearest(
+                    [500.0, 30.0, 15.0, 60.0], 40, calorie_range, accept, meal_type='breakfast', cuisine=cuisine
+                )
+                expected, expected_distances = self.brute_force(
+                    artifacts, [500.0, 30.0, 15.0, 60.0], 40, calorie_range, 'veg', 'breakfast', cuisine
+                )
+                np.testing.assert_array_equal(found, expected)
+                np.testing.assert_allclose(distances, expected_distances)
+
+    def test_large_catalogs_plan_from_the_index_when_enabled(self):
+        artifacts = make_catalog(n=3000)
+
+        with mock.patch('food_recommendation_system.recommendation_engine.MACRO_INDEX_ENABLED', True), \
+                mock.patch('food_recommendation_system.recommendation_engine.MACRO_INDEX_MIN_RECIPES', 0):
+            result = get_recommendations(**PROFILES[0], artifacts=artifacts)
+
+        low, high = result['meta']['calorie_range']
+        meals = [meal for day in result['weekly_plan'].values() for slot in day.values() for meal in slot]
+        self.assertEqual(len(meals), 63)
+        self.assertEqual(len({meal['name'] for meal in meals}), 63)
+        for meal in meals:
+            self.assertTrue(low - 1 <= meal['calories'] <= high + 1)
+
+
+    def test_catalog_size_alone_does_not_change_the_plan(self):
+        artifacts = make_catalog(n=3000)
+        exact = get_recommendations(**PROFILES[0], artifacts=artifacts)
+        scored_pools.clear()
+
+        with mock.patch('food_recommendation_system.recommendation_engine.MACRO_INDEX_MIN_RECIPES', 0):
+            self.assertEqual(get_recommendations(**PROFILES[0], artifacts=artifacts), exact)
+
+    def test_index_candidates_are_a_subset_of_the_exact_candidates(self):
+        artifacts = make_catalog(n=3000)
+        split = {'protein': 0.3, 'fat': 0.3, 'carbs': 0.4}
+
+        for pref, cuisine in [('both', 'all'), ('veg', 'Indian'), ('non-veg', 'american')]:
+            exact = score_candidates(artifacts, pref, cuisine, (300.0, 700.0), split)
+            with mock.patch('food_recommendation_system.recommendation_engine.MACRO_INDEX_ENABLED', True), \
+                    mock.patch('food_recommendation_system.recommendation_engine.MACRO_INDEX_MIN_RECIPES', 0):
+                nearest = score_candidates(artifacts, pref, cuisine, (300.0, 700.0), split)
+
+            self.assertGreater(nearest.positions.size, 0)
+            self.assertLess(nearest.positions.size, exact.positions.size)
+            self.assertTrue(np.isin(nearest.positions, exact.positions).all())
+
+
+class CatalogBuilderTests(TestCase):
+    def test_clean_recipes_parses_lists_and_normalizes_food_type(self):
+        raw = pd.DataFrame({
+            'label': ['Paneer tikka', 'Chicken curry', '', 'Broken'],
+            'cuisineType': ["['indian']", 'indian|asian', "['thai']", None],
+            'mealType': ["['lunch/dinner']", 'lunch/dinner', 'snack', 'snack'],
+            'ingredientLines': ["['200 g paneer', '1 cup yogurt']", '500 g chicken|2 onions', "['rice']", "['rice']"],
+            'food_type': ['Vegetarian', None, 'veg', 'veg'],
+            'calories': [420, 610, 300, 'n/a'],
+            'protein': [25, 48, 6, 5],
+            'fat': [22, 30, 2, 1],
+            'carbs': [18, 20, 60, 50],
+        })
+
+        catalog, dropped = clean_recipes(raw)
+
+        self.assertEqual(dropped, 2)
+        self.assertEqual(list(catalog['recipe_name']), ['Paneer tikka', 'Chicken curry'])
+        self.assertEqual(list(catalog['food_type']), ['veg', 'non-veg'])
+        self.assertEqual(catalog.loc[1, 'cuisine_type'], ['indian', 'asian'])
+        self.assertEqual(catalog.loc[0, 'ingredient_lines'], ['200 g paneer', '1 cup yogurt'])
+
+    def test_built_artifacts_are_checksummed(self):
+        catalog = make_catalog().recipes.assign(**make_catalog().numeric)
+
+        with tempfile.TemporaryDirectory() as root:
+            write_artifacts(build_artifacts(catalog, 'built'), root=root)
+
+            self.assertEqual(verify_checksums('built', root=root), [])
+            with open(f'{root}/built/calories.npy', 'ab') as f:
+                f.write(b'0')
+            self.assertEqual(verify_checksums('built', root=root), ['calories.npy'])
+
+
+class BenchmarkTests(TestCase):
+    def test_synthetic_catalog_serves_plans(self):
+        artifacts = synthesize_catalog(2000, seed=1)
+
+        self.assertEqual(artifacts.n_recipes, 2000)
+        self.assertEqual(artifacts.ingredient_vectors.shape[0], 2000)
+        result = get_recommendations(**PROFILES[0], artifacts=artifacts)
+        self.assertEqual(len(result['weekly_plan']), 7)
+
+    def test_report_has_latency_and_memory(self):
+        report = benchmark_size(2000, repeats=1)
+
+        self.assertEqual(report['catalog_size'], 2000)
+        for mode in ('uncached', 'cached'):
+            self.assertLessEqual(report[mode]['p50_ms'], report[mode]['p95_ms'])
+            self.assertGreater(report[mode]['peak_traced_kb_per_call'], 0)
+        self.assertGreater(report['peak_rss_mb'], 0)
+        self.assertLess(report['daily_calorie_deviation'], 0.15)
+
+
+class WorkerMemoryTests(TestCase):
+    def test_preload_builds_the_macro_index_and_freezes_gc(self):
+        artifacts = make_catalog(n=500)
+
+        with mock.patch('food_recommendation_system.worker_memory.get_artifacts', return_value=artifacts), \
+                mock.patch('food_recommendation_system.worker_memory.MACRO_INDEX_ENABLED', True), \
+                mock.patch('food_recommendation_system.worker_memory.MACRO_INDEX_MIN_RECIPES', 0), \
+                mock.patch('food_recommendation_system.worker_memory.gc.freeze') as freeze:
+            self.assertIs(preload_artifacts(), artifacts)
+
+        freeze.assert_called_once_with()
+        self.assertIn(('meal_type', 'breakfast'), artifacts.macro_index._bands)
+        self.assertIn(('meal_type', None), artifacts.macro_index._bands)
+        for cuisine in ('american', 'asian', 'indian', 'italian'):
+            self.assertIn(('cuisine', cuisine), artifacts.macro_index._bands)
+
+        # A cuisine request in a worker reuses the preloaded bands instead of building its own
+        bands = dict(artifacts.macro_index._bands)
+        with mock.patch('food_recommendation_system.recommendation_engine.MACRO_INDEX_ENABLED', True), \
+                mock.patch('food_recommendation_system.recommendation_engine.MACRO_INDEX_MIN_RECIPES', 0):
+            get_recommendations(**PROFILES[1], artifacts=artifacts)
+        self.assertEqual(artifacts.macro_index._bands, bands)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/smaps_rollup'), 'needs /proc/<pid>/smaps_rollup')
+    def test_memory_report_splits_shared_and_unique(self):
+        report = memory_report()
+
+        self.assertGreater(report['rss_mb'], 0)
+        self.assertAlmostEqual(report['shared_mb'] + report['unique_mb'], report['rss_mb'], delta=1)
+        self.assertIn('unique_mb', report['artifacts'])
 
-# Create your tests here.
+    @unittest.skipUnless(os.path.exists('/proc/self/stat'), 'needs /proc')
+    def test_worker_pids_lists_children(self):
+        child = subprocess.Popen(['sleep', '5'])
+        try:
+            self.assertIn(child.pid, worker_pids(os.getpid()))
+        finally:
+            child.kill()
+            child.wait()
@@ -6,5 +6,6 @@ app_name = 'food_recommendation_system'
 urlpatterns = [
     path('', views.recommendation_home, name='home'),
     path('input/', views.get_recommendation_input, name='input'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
     path('plan/<int:rec_id>/', views.view_plan, name='view_plan'),
 ]
@@ -0,0 +1,126 @@
+from django.db import transaction
+
+from .artifacts import get_artifacts, get_artifacts_version, is_legacy_version
+from .ingredient_index import unmatched_terms
+from .models import DailyMealPlan, FoodRecommendation
+from .recommendation_engine import recipe_records
+
+PROFILE_FIELDS = (
+    'age', 'height', 'current_weight', 'target_weight',
+    'gender', 'activity_level', 'food_pref', 'cuisine',
+    'allergens', 'excluded_ingredients',
+)
+# Optional inputs; profiles and jobs from before they existed leave them out
+PROFILE_DEFAULTS = {'allergens': [], 'excluded_ingredients': []}
+MEALS = ('breakfast', 'lunch', 'dinner')
+SCORE_KEYS = ('health_score', 'macro_score', 'ingredient_score', 'final_score')
+
+
+def profile_inputs(profile):
+    """The ``PROFILE_FIELDS`` of ``profile``, with ``PROFILE_DEFAULTS`` for optional ones it omits."""
+    return {field: profile.get(field, PROFILE_DEFAULTS.get(field)) for field in PROFILE_FIELDS}
+
+
+def compact_meals(meals):
+    """``[[recipe_id, health, macro, ingredient, final], ...]`` for each meal of one day."""
+    return {
+        meal: [[option['id']] + [option[key] for key in SCORE_KEYS] for option in meals[meal]]
+        for meal in MEALS
+    }
+
+
+def daily_meal_plan(record, day, meals):
+    """Unsaved ``DailyMealPlan`` for one day of ``record``, compact unless its catalog is the legacy pickle."""
+    if is_legacy_version(record.catalog_version):
+        return DailyMealPlan(
+            recommendations_record=record,
+            day_of_week=day,
+            **{f'{meal}_options': meals[meal] for meal in MEALS},
+        )
+    return DailyMealPlan(recommendations_record=record, day_of_week=day, meals=compact_meals(meals))
+
+
+def save_recommendations(entries):
+    """
+    Persist ``(user, profile, result)`` triples with one bulk insert per table.
+
+    ``profile`` holds the inputs passed to the engine and ``result`` is its
+    successful output. Daily plans only store recipe ids and scores; see
+    ``resolve_meal_plans``. Results made from the legacy pickle store the
+    full meal dicts instead, since that catalog cannot be looked up again
+    once the pickle changes. Returns the new ``FoodRecommendation`` rows in
+    input order.
+    """
+    entries = list(entries)
+    with transaction.atomic():
+        records = FoodRecommendation.objects.bulk_create([
+            FoodRecommendation(
+                user=user,
+                **profile_inputs(profile),
+                bmi=result['meta']['bmi'],
+                bmi_category=result['meta']['bmi_category'],
+                target_calories=result['meta']['target_calories'],
+                tdee=result['meta']['tdee'],
+                catalog_version=result['meta']['catalog_version'],
+            )
+            for user, profile, result in entries
+        ])
+        DailyMealPlan.objects.bulk_create([
+            daily_meal_plan(record, day, meals)
+            for record, (_, _, result) in zip(records, entries)
+            for day, meals in result['weekly_plan'].items()
+        ])
+    return records
+
+
+def resolve_meal_plans(rec, plans):
+    """
+    Fill ``breakfast_options``/``lunch_options``/``dinner_options`` of compact
+    ``plans`` with full meal dicts from the catalog version ``rec`` was made
+    with. Returns False if that version is no longer available, in which
+    case the compact plans are left with empty options.
+    """
+    compact = [plan for plan in plans if plan.meals is not None]
+    if not compact:
+        return True
+
+    artifacts = get_artifacts_version(rec.catalog_version)
+    for plan in compact:
+        for meal in MEALS:
+            rows = plan.meals.get(meal, [])
+            if artifacts is None or not rows:
+                options = []
+            else:
+                ids, *scores = zip(*rows)
+                options = recipe_records(artifacts, ids, *scores)
+            setattr(plan, f'{meal}_options', options)
+    return artifacts is not None
+
+
+def unmatched_exclusions(rec):
+    """
+    Allergies and excluded ingredients of ``rec`` that matched no ingredient
+    of the catalog it was made with (see ``unmatched_terms``); empty if
+    that catalog is no longer available.
+    """
+    if not rec.allergens and not rec.excluded_ingredients:
+        return []
+    artifacts = get_artifacts_version(rec.catalog_version)
+    if artifacts is None:
+        return []
+    return unmatched_terms(artifacts.ingredient_index, rec.allergens, rec.excluded_ingredients)
+
+
+def reusable_recommendation(user, profile):
+    """
+    The user's latest recommendation if it was made from exactly these
+    inputs with the current catalog, so it can be shown instead of a new one.
+    """
+    inputs = profile_inputs(profile)
+    latest = FoodRecommendation.objects.filter(user=user).order_by('-created_at').first()
+    if latest is None or any(getattr(latest, field) != value for field, value in inputs.items()):
+        return None
+    artifacts = get_artifacts()
+    if artifacts is None or latest.catalog_version != artifacts.version:
+        return None
+    return latest
@@ -1,13 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .models import FoodRecommendation, DailyMealPlan
+from django.http import JsonResponse
+from django.urls import reverse
+from .models import FoodRecommendation, MealPlanJob
 from membership.models import UserMembership
+from fitness_plan.models import ClientFitnessProfile
 from django.utils import timezone
-from .recommendation_engine import get_recommendations
+from .ingredient_index import split_terms
+from .jobs import submit_plan_job
+from .utils import resolve_meal_plans, reusable_recommendation, unmatched_exclusions
 
 def is_member(user):
     return UserMembership.objects.filter(user=user, is_active=True, end_date__gt=timezone.now()).exists()
 
+def saved_allergies(user):
+    """Allergies from the user's fitness profile, used when the form does not send its own."""
+    return ClientFitnessProfile.objects.filter(user=user).values_list('allergies', flat=True).first() or ''
+
 @login_required
 def recommendation_home(request):
     if not is_member(request.user):
@@ -23,50 +32,73 @@ def get_recommendation_input(request):
 
     if request.method == 'POST':
         try:
-            age = int(request.POST['age'])
-            height = float(request.POST['height'])
-            current_weight = float(request.POST['current_weight'])
-            target_weight = float(request.POST['target_weight'])
-            gender = request.POST['gender']
-            activity_level = request.POST['activity_level']
-            food_pref = request.POST['food_pref']
-            cuisine = request.POST.get('cuisine', 'all') or 'all'
+            profile = {
+                'age': int(request.POST['age']),
+                'height': float(request.POST['height']),
+                'current_weight': float(request.POST['current_weight']),
+                'target_weight': float(request.POST['target_weight']),
+                'gender': request.POST['gender'],
+                'activity_level': request.POST['activity_level'],
+                'food_pref': request.POST['food_pref'],
+                'cuisine': request.POST.get('cuisine', 'all') or 'all',
+                'allergens': split_terms(request.POST.get('allergies', saved_allergies(request.user))),
+                'excluded_ingredients': split_terms(request.POST.get('excluded_ingredients', '')),
+            }
+        except (KeyError, ValueError) as e:
+            return render(request, 'food_recommendation_system/input_form.html', {
+                'error': f'Invalid input: {e}',
+                'allergies': request.POST.get('allergies', ''),
+            })
+
+        wants_json = 'application/json' in request.headers.get('Accept', '')
 
-            result = get_recommendations(age, height, current_weight, target_weight, gender, activity_level, food_pref, cuisine)
+        # Same inputs and catalog as the latest plan: show that plan instead of generating a copy
+        rec = reusable_recommendation(request.user, profile)
+        if rec is not None:
+            if wants_json:
+                return JsonResponse({
+                    'status': 'done',
+                    'plan_url': reverse('food_recommendation_system:view_plan', args=[rec.id]),
+                })
+            return redirect('food_recommendation_system:view_plan', rec_id=rec.id)
 
-            if "error" in result:
-                return render(request, 'food_recommendation_system/input_form.html', {'error': result['error']})
+        # The plan is generated in the background; the form polls job_status until it is ready
+        job = submit_plan_job(request.user, profile)
+        if wants_json:
+            return JsonResponse({
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': reverse('food_recommendation_system:job_status', args=[job.id]),
+            }, status=202)
+        return redirect(f"{reverse('food_recommendation_system:input')}?job={job.id}")
 
-            rec = FoodRecommendation.objects.create(
-                user=request.user,
-                age=age,
-                height=height,
-                current_weight=current_weight,
-                target_weight=target_weight,
-                gender=gender,
-                activity_level=activity_level,
-                food_pref=food_pref,
-                cuisine=cuisine,
-                bmi=result['meta']['bmi'],
-                bmi_category=result['meta']['bmi_category'],
-                target_calories=result['meta']['target_calories'],
-                tdee=result['meta']['tdee']
-            )
+    job = None
+    if request.GET.get('job', '').isdigit():
+        job = MealPlanJob.objects.filter(id=request.GET['job'], user=request.user).first()
+        if job is not None and job.status == 'done' and job.recommendation_id:
+            return redirect('food_recommendation_system:view_plan', rec_id=job.recommendation_id)
 
-            for day, meals in result['weekly_plan'].items():
-                DailyMealPlan.objects.create(
-                    recommendations_record=rec,
-                    day_of_week=day,
-                    breakfast_options=meals['breakfast'],
-                    lunch_options=meals['lunch'],
-                    dinner_options=meals['dinner']
-                )
+    return render(request, 'food_recommendation_system/input_form.html', {
+        'job': job,
+        'error': job.error if job is not None and job.status == 'failed' else None,
+        'allergies': saved_allergies(request.user),
+    })
 
-            return redirect('food_recommendation_system:view_plan', rec_id=rec.id)
-        except Exception as e:
-            return render(request, 'food_recommendation_system/input_form.html', {'error': str(e)})
+@login_required
+def job_status(request, job_id):
+    if not is_member(request.user):
+        return JsonResponse({'error': 'Active membership required'}, status=403)
+
+    job = MealPlanJob.objects.filter(id=job_id, user=request.user).first()
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
 
-    return render(request, 'food_recommendation_system/input_form.html')
+    data = {'job_id': job.id, 'status': job.status}
+    if job.status == 'done' and job.recommendation_id:
+        data['plan_url'] = reverse('food_recommendation_system:view_plan', args=[job.recommendation_id])
+    elif job.status == 'failed':
+        data['error'] = job.error
+    return JsonResponse(data)
 
 @login_required
 def view_plan(request, rec_id):
@@ -78,6 +110,12 @@ def view_plan(request, rec_id):
     
     day_order = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
     sorted_plans = sorted(plans, key=lambda x: day_order.index(x.day_of_week) if x.day_of_week in day_order else 99)
+    catalog_available = resolve_meal_plans(rec, sorted_plans)
     
-    return render(request, 'food_recommendation_system/view_plan.html', {'rec': rec, 'plans': sorted_plans})
+    return render(request, 'food_recommendation_system/view_plan.html', {
+        'rec': rec,
+        'plans': sorted_plans,
+        'catalog_missing': not catalog_available,
+        'unmatched_exclusions': unmatched_exclusions(rec),
+    })
 
@@ -0,0 +1,121 @@
+"""
+Sharing the recommendation artifacts across server worker processes.
+
+Published artifact versions are memory-mapped, so their arrays already live
+in the OS page cache once for the whole machine. What remains per worker is
+the unpickled part (display columns, models, legacy ``food_models.pkl``
+data) and the macro index. ``preload_artifacts`` builds all of that in the
+server's master process before it forks (gunicorn ``preload_app``, uWSGI
+without ``lazy-apps``), so workers inherit the pages copy-on-write instead
+of each building a private copy. ``memory_report`` measures how much of a
+worker is actually shared.
+"""
+import gc
+import os
+
+from .artifacts import ARTIFACTS_DIR, get_artifacts
+from .macro_index import ENABLED as MACRO_INDEX_ENABLED, MIN_RECIPES as MACRO_INDEX_MIN_RECIPES
+from .recommendation_engine import MEAL_SLOTS
+
+ROLLUP_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def preload_artifacts():
+    """
+    Load the current artifacts (with their ingredient and name indexes, and
+    the macro index of large catalogs when it is enabled) in this process, then move every
+    object created so far out of the cyclic garbage collector's reach.
+
+    ``gc.freeze()`` matters as much as the loading: a collection in a
+    worker would otherwise write to the header of every inherited object
+    and turn the shared pages into private copies.
+    """
+    artifacts = get_artifacts()
+    if artifacts is not None:
+        artifacts.ingredient_index
+        artifacts.name_index
+        if MACRO_INDEX_ENABLED and artifacts.n_recipes >= MACRO_INDEX_MIN_RECIPES:
+            # Every band a request can query: per meal type, and per cuisine for cuisine filters
+            for meal_type in MEAL_SLOTS + [None]:
+                artifacts.macro_index.bands("meal_type", meal_type)
+            for cuisine in artifacts.filter_indexes["cuisine"]:
+                artifacts.macro_index.bands("cuisine", cuisine)
+    gc.freeze()
+    return artifacts
+
+
+def _read_kb(line):
+    return int(line.split()[1])
+
+
+def memory_report(pid="self", artifacts_dir=ARTIFACTS_DIR):
+    """
+    Unique vs. shared memory of process ``pid`` in megabytes, from
+    ``/proc/<pid>/smaps_rollup``; ``None`` where that is unavailable.
+
+    ``unique`` is what exiting the process would free, ``shared`` is
+    resident but also mapped by other processes, and ``pss`` charges each
+    shared page proportionally. The ``artifacts`` entry restricts the same
+    numbers to memory-mapped files under ``artifacts_dir``.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            rollup = f.readlines()
+        with open(f"/proc/{pid}/smaps") as f:
+            mappings = f.readlines()
+    except OSError:
+        return None
+
+    def summarize(totals):
+        return {
+            "rss_mb": totals["rss"] / 1024,
+            "pss_mb": totals["pss"] / 1024,
+            "shared_mb": (totals["shared_clean"] + totals["shared_dirty"]) / 1024,
+            "unique_mb": (totals["private_clean"] + totals["private_dirty"]) / 1024,
+        }
+
+    totals = dict.fromkeys(ROLLUP_FIELDS.values(), 0)
+    for line in rollup:
+        field = line.split(":", 1)[0]
+        if field in ROLLUP_FIELDS:
+            totals[ROLLUP_FIELDS[field]] = _read_kb(line)
+
+    artifact_totals = dict.fromkeys(ROLLUP_FIELDS.values(), 0)
+    prefix = os.path.realpath(artifacts_dir) + os.sep
+    in_artifacts = False
+    for line in mappings:
+        field = line.split(":", 1)[0]
+        if field in ROLLUP_FIELDS:
+            if in_artifacts:
+                artifact_totals[ROLLUP_FIELDS[field]] += _read_kb(line)
+        elif not field[:1].isupper():
+            # A mapping header: "start-end perms offset dev inode [path]"
+            parts = line.split(None, 5)
+            in_artifacts = len(parts) == 6 and parts[5].strip().startswith(prefix)
+
+    return {"pid": pid, **summarize(totals), "artifacts": summarize(artifact_totals)}
+
+
+def worker_pids(master_pid):
+    """PIDs of the direct children of ``master_pid`` (the server's workers)."""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name is parenthesized and may contain spaces; the parent PID follows it
+        fields = stat.rsplit(")", 1)[1].split()
+        if int(fields[1]) == int(master_pid):
+            children.append(int(entry))
+    return sorted(children)
@@ -0,0 +1,19 @@
+"""
+Gunicorn configuration for FitZone.
+
+    gunicorn -c gunicorn.conf.py FitZone.wsgi
+
+The application is imported once in the master process, which loads the
+food recommendation artifacts before forking, so workers share those pages
+instead of each holding a private copy. Check with:
+
+    python manage.py food_worker_memory <master pid>
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('FOOD_PRELOAD_ARTIFACTS', 'True')
+
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
@@ -17,6 +17,7 @@ from datetime import datetime, date, time
 from datetime import timedelta
 from decimal import Decimal
 from trainer.models import TrainerBooking, TrainerRegistration
+from chat.models import ChatRoom
 
 
 def _normalize_valid_until_to_datetime(value):
@@ -260,6 +261,7 @@ def verify_payment(request, pidx):
                     booking.valid_until = base_date + timedelta(days=30)
 
                     booking.save()
+                    ChatRoom.provision(booking)
                     messages.success(request, "Payment successful! Your trainer booking has been confirmed and paid.")
                     return render(request, 'payment_success_booking.html', {'payment': payment})
                 else:
@@ -1,8 +1,6 @@
 from itertools import chain
 from operator import attrgetter
 
-from django.db.models import Q, Count
-
 from trainer.models import TrainerRegistration
 from notifications.models import UserNotification, TrainerNotification
 from chat.models import ChatRoom
@@ -35,28 +33,7 @@ def notification_count(request):
         context['user_unread_notif_count'] = user_unread + trainer_unread
         context['navbar_notifications'] = merged
 
-        # Total unread chat messages across all rooms for this user
-        # Rooms where user is a client
-        client_unread = ChatRoom.objects.filter(
-            client=request.user
-        ).aggregate(
-            total=Count(
-                'messages',
-                filter=Q(messages__is_read=False) & ~Q(messages__sender=request.user)
-            )
-        )['total'] or 0
-
-        # Rooms where user is a trainer
-        trainer_unread_chat = 0
-        if trainer_reg:
-            trainer_unread_chat = ChatRoom.objects.filter(
-                trainer=trainer_reg
-            ).aggregate(
-                total=Count(
-                    'messages',
-                    filter=Q(messages__is_read=False) & ~Q(messages__sender=request.user)
-                )
-            )['total'] or 0
-
-        context['chat_unread_count'] = client_unread + trainer_unread_chat
+        # Total unread chat messages across all rooms for this user, as client
+        # and as trainer, from the counters kept on each room
+        context['chat_unread_count'] = ChatRoom.total_unread(request.user)
     return context
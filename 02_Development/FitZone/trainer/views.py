@@ -20,7 +20,7 @@ from .forms import (
 )
 from .models import TrainerRegistrationDocument, TrainerRegistration, TrainerPhoto, TrainerBooking
 from notifications.models import TrainerNotification, UserNotification
-from chat.models import ChatRoom, Message
+from chat.models import ChatRoom
 
 MAX_TRAINER_GALLERY_PHOTO_SIZE = 5 * 1024 * 1024
 
@@ -947,6 +947,8 @@ def update_booking_status(request, booking_id):
                 booking.cancelled_by = 'trainer'
             
             booking.save()
+            if new_status == 'confirmed':
+                ChatRoom.provision(booking)
             messages.success(request, f"Booking {new_status} successfully!")
 
             # Notify the user
@@ -1004,14 +1006,11 @@ def update_booking_status(request, booking_id):
                     client=booking.user
                 ).first()
                 if chat_room:
-                    Message.objects.create(
-                        room=chat_room,
+                    chat_room.add_message(
                         sender=request.user,
                         content=f'⚠️ Booking Cancelled by Trainer\nReason: {reason_text}',
                         message_type='cancellation'
                     )
-                    chat_room.updated_at = timezone.now()
-                    chat_room.save(update_fields=['updated_at'])
         else:
             messages.error(request, "Invalid action.")
 
@@ -1094,14 +1093,11 @@ def user_cancel_booking(request, booking_id):
             client=request.user
         ).first()
         if chat_room:
-            Message.objects.create(
-                room=chat_room,
+            chat_room.add_message(
                 sender=request.user,
                 content=f'⚠️ Booking Cancelled by User\nReason: {reason_text}',
                 message_type='cancellation'
             )
-            chat_room.updated_at = timezone.now()
-            chat_room.save(update_fields=['updated_at'])
         messages.success(request, "Booking cancelled successfully.")
     else:
         messages.error(request, "Only pending or unpaid confirmed bookings can be cancelled.")